@@ -0,0 +1,90 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError:
+    resource = None
+from synthetic_data import make_candles
+from candle_store import CandleStore
+from build_dataset import feature_frame, read_candles, build_dataset, load_dataset
+from config import LABEL_COL
+
+def children_max_rss_mb() -> float:
+    # largest resident set of any finished child process
+    if resource is None:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+def single_pass(store_path:str, mode:str, timeframes:list) -> tuple:
+    # the old way: every candle in one frame
+    store = CandleStore(store_path)
+    df, plan = feature_frame(read_candles(store, 0, len(store)), mode, timeframes)
+    values = df.to_numpy(dtype=np.float64)
+    return plan.columns, plan.transform(values), values[:, df.columns.get_loc(LABEL_COL)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='chunked process pool dataset build vs a single pandas pass')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--mode', default='v04', choices=['v01', 'v04'])
+    parser.add_argument('--timeframes', nargs='*', default=[])
+    parser.add_argument('--chunk-rows', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_build_dataset_')
+    try:
+        store_path = os.path.join(work_dir, 'candles.candles')
+        CandleStore.from_dataframe(store_path, make_candles(args.rows, start='2010-01-01'), fsync=False)
+        print('{:d} candles, mode {:s}, chunks of {:d} rows, {:d} cores'.format(
+            args.rows,
+            args.mode,
+            args.chunk_rows,
+            os.cpu_count() or 1
+        ))
+        
+        for workers in args.workers:
+            path = os.path.join(work_dir, 'dataset_{:d}'.format(workers))
+            t0 = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                build_dataset(
+                    path,
+                    args.mode,
+                    store_path,
+                    timeframes = args.timeframes,
+                    chunk_rows = args.chunk_rows,
+                    workers = workers
+                )
+            print('build_dataset, {:2d} workers: {:7.2f} s, max worker rss {:6.0f} MB'.format(
+                workers,
+                time.perf_counter() - t0,
+                children_max_rss_mb()
+            ))
+        
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            t0 = time.perf_counter()
+            columns, features, label = executor.submit(single_pass, store_path, args.mode, args.timeframes).result()
+            t_single = time.perf_counter() - t0
+        print('single pass:                {:7.2f} s, max rss        {:6.0f} MB'.format(t_single, children_max_rss_mb()))
+        
+        dataset = load_dataset(path)
+        assert list(dataset.columns) == columns + [LABEL_COL]
+        expected = np.column_stack([features, label]).astype(np.float32)
+        actual = dataset.to_numpy()
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+        finite = np.isfinite(expected)
+        diff = np.abs(actual[finite] - expected[finite]) / np.maximum(np.abs(expected[finite]), 1e-3)
+        print('parity with the single pass: max relative difference {:.2e} over {:d} values'.format(
+            diff.max(),
+            int(finite.sum())
+        ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import time
+import argparse
+import numpy as np
+from synthetic_data import make_candles
+import talib_fallback
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='throughput of the talib_fallback candlestick patterns')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+    
+    # gapped opens so that the star and gap based patterns occur
+    df = make_candles(args.rows, open_gap=0.004)
+    patterns = talib_fallback.candle_patterns(df)
+    
+    try:
+        import talib.abstract as talib_abstract
+    except ModuleNotFoundError:
+        print('TA-Lib not installed, skipping parity check')
+    else:
+        for name in patterns.columns:
+            expected = getattr(talib_abstract, name)(df).to_numpy()
+            np.testing.assert_array_equal(patterns[name].to_numpy(), expected, err_msg=name)
+        print('parity with TA-Lib: ok ({:d} patterns, {:d} rows)'.format(len(patterns.columns), args.rows))
+    
+    for name in patterns.columns:
+        print('{:20s} {:6d} signals'.format(name, int(np.count_nonzero(patterns[name].to_numpy()))))
+    
+    one_pass_times = list()
+    separate_times = list()
+    for _ in range(args.repeats):
+        t0 = time.perf_counter()
+        talib_fallback.candle_patterns(df)
+        one_pass_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for name in patterns.columns:
+            getattr(talib_fallback, name)(df)
+        separate_times.append(time.perf_counter() - t0)
+    
+    for label, times in (('candle_patterns (one pass)', one_pass_times), ('CDL* functions (separately)', separate_times)):
+        seconds = np.median(times)
+        print('{:28s} {:8.1f} ms, {:6.2f} M candles/s'.format(label, 1e3 * seconds, args.rows / seconds / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+replays kline messages through main.process_message with the Binance client and
+telegram send() stubbed out and reports per-stage closing tick latencies
+
+every mode runs in its own subprocess because main.py resolves its mode at import;
+with --symbols > 1 the extra pairs replay the same candles through dispatch_message
+as one combined stream, compare max_rss_mb against a single pair run for the memory
+cost per pair
+"""
+import os
+import io
+import sys
+import json
+import shutil
+import atexit
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import datetime as dt
+import numpy as np
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_stub_client_class() -> type:
+    from binance.client import Client
+    
+    class StubClient(Client):
+        """
+        binance Client without any network access: the constructor skips the ping
+        and every REST request that is not stubbed raises
+        """
+        def __init__(self, api_key=None, api_secret=None, *args, **kwargs) -> None:
+            self.API_KEY = api_key
+            self.API_SECRET = api_secret
+            self.calls = list()
+        
+        def get_asset_balance(self, asset:str, **params) -> dict:
+            self.calls.append('get_asset_balance')
+            return {'asset': asset, 'free': '0.00000000', 'locked': '0.00000000'}
+        
+        def _request(self, method:str, uri:str, signed:bool, force_params:bool=False, **kwargs):
+            raise NotImplementedError('StubClient does not implement {:s} {:s}'.format(method.upper(), uri))
+    
+    return StubClient
+
+def prepare_working_dir(path:str, mode:str) -> None:
+    # changes into path; state_journal can only be imported once config finds
+    # ./data/credentials.json, binance_interface has to wait for the client stubs
+    os.makedirs(os.path.join(path, 'data'), exist_ok=True)
+    os.makedirs(os.path.join(path, 'models'), exist_ok=True)
+    with open(os.path.join(path, 'data', 'credentials.json'), 'w') as fh:
+        json.dump({'binance_key': ['key', 'secret'], 'tg_bot_token': '123456:benchmark', 'tg_recipient': 0}, fh)
+    os.chdir(path)
+    from state_journal import default_state
+    with open(os.path.join('data', 'state.json'), 'w') as fh:
+        json.dump(default_state(mode), fh, indent=2)
+
+def train_stub_model(history, mode:str, path:str, n_estimators:int, extra_transforms:dict=None) -> None:
+    # random labels: only the model size matters for latency
+    import joblib
+    import pandas as pd
+    from xgboost import XGBRegressor
+    from df_utils import FeaturePlan
+    from config import IGNORED_COLUMNS, LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL
+    plan = FeaturePlan(
+        history.columns,
+        mode,
+        IGNORED_COLUMNS + [LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL],
+        extra_transforms = extra_transforms
+    )
+    features = pd.DataFrame(plan.transform(history.to_numpy(dtype=np.float64)), columns=plan.columns)
+    labels = np.random.default_rng(0).normal(0., 1., len(features))
+    est = XGBRegressor(n_estimators=n_estimators, max_depth=6)
+    est.fit(features, labels)
+    joblib.dump(est, path)
+
+def run_mode(args:argparse.Namespace) -> None:
+    mode = args.worker
+    work_dir = tempfile.mkdtemp(prefix='bench_closing_tick_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, mode)
+    
+    # config reads ./data/credentials.json on import and the stubs have to be in place
+    # before the bot modules are imported
+    from synthetic_data import make_candles, make_kline_messages
+    import binance.client
+    binance.client.Client = make_stub_client_class()
+    import config
+    config.MULTI_SYMBOL_PAIRS = [('PAIR{:d}'.format(i), 'USDT', 6, 2) for i in range(1, args.symbols)]
+    model_path = os.path.join(work_dir, 'models', 'bench_{:s}.pkl'.format(mode))
+    config.MODEL_PATH_V01 = config.MODEL_PATH_V04 = model_path
+    import telegram_interface as tg
+    tg.send = lambda *args, **kwargs: None
+    from df_utils import dfunpickle, apply_technicals_v01, apply_technicals_v04_full
+    
+    if args.klines is not None:
+        history = dfunpickle(args.history)
+        with open(args.klines, 'r') as fh:
+            messages = [json.loads(line) for line in fh if line.strip()]
+    else:
+        df = make_candles(config.DATAFRAME_LENGTH + args.candles, open_gap=0.002)
+        history = df.iloc[:config.DATAFRAME_LENGTH]
+        messages = make_kline_messages(df.iloc[config.DATAFRAME_LENGTH:], ticks_per_candle=args.ticks_per_candle)
+    history = history.loc[:, config.DATA_COLUMNS].copy()
+    history = apply_technicals_v01(history) if mode == 'v01' else apply_technicals_v04_full(history)
+    if args.timeframes:
+        from timeframes import MultiTimeframeAggregator
+        timeframes = MultiTimeframeAggregator(args.timeframes)
+        train_stub_model(
+            history.join(timeframes.seed(history)),
+            mode,
+            model_path,
+            args.n_estimators,
+            timeframes.transforms()
+        )
+    else:
+        train_stub_model(history, mode, model_path, args.n_estimators)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        from candle_store import CandleStore
+        from feature_cache import FeatureCache
+        main.load_model()
+        for ctx in main.contexts:
+            ctx.candle_store = CandleStore.from_dataframe(ctx.candle_store_path, history)
+            if mode == 'v04':
+                ctx.feature_cache = FeatureCache(ctx.feature_cache_path, mode)
+            if args.timeframes:
+                ctx.timeframes = MultiTimeframeAggregator(args.timeframes)
+            main.init_candles(ctx, history)
+        main.compile_prediction_path()
+    
+    n_closing = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for msg in messages:
+            if len(main.contexts) == 1:
+                main.process_message(msg)
+            else:
+                for ctx in main.contexts:
+                    main.dispatch_message({
+                        'stream': '{:s}@kline_{:s}'.format(ctx.symbol.lower(), config.INTERVAL),
+                        'data': dict(msg, s=ctx.symbol)
+                    })
+            if msg['k']['x']:
+                # the order commands of a close must not run into the timing of the next ticks
+                main.order_executor.flush()
+                n_closing += 1
+                if n_closing == args.warmup:
+                    main.tick_latency.reset()
+                    main.order_latency.reset()
+                    main.order_executor.latency.reset()
+    main.order_executor.flush()
+    
+    # closing_tick_orders runs on the executor thread, its stages follow the tick stages
+    stages = main.tick_latency.summary()
+    for stage, stats in main.order_latency.summary().items():
+        stages['orders_total' if stage == 'total' else stage] = stats
+    executor_stages = main.order_executor.latency.summary()
+    if 'queued' in executor_stages:
+        stages['order_queued'] = executor_stages['queued']
+    
+    from df_utils import ta
+    report = {
+        'metadata': {
+            'mode': mode,
+            'symbols': len(main.contexts),
+            'closing_ticks': len(main.contexts) * (n_closing - args.warmup),
+            'messages': len(messages),
+            'technicals_backend': ta.__name__,
+            'n_estimators': args.n_estimators,
+            'client_calls': len(main.tsm.client.calls),
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None
+        },
+        'stages': stages
+    }
+    with open(args.output, 'w', newline='\n') as fh:
+        json.dump(report, fh, indent=2)
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd = REPO_DIR,
+            stderr = subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='per-stage latency of the closing kline tick in process_message')
+    parser.add_argument('--modes', nargs='+', default=['v01', 'v04'], choices=['v01', 'v04'])
+    parser.add_argument('--candles', type=int, default=300, help='synthetic closing ticks to replay')
+    parser.add_argument('--ticks-per-candle', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=10, help='closing ticks excluded from the statistics')
+    parser.add_argument('--n-estimators', type=int, default=300)
+    parser.add_argument('--symbols', type=int, default=1, help='pairs on one combined kline stream')
+    parser.add_argument('--timeframes', nargs='*', default=[], help='higher timeframe features, e.g. 4h 1d')
+    parser.add_argument('--klines', default=None, help='recorded websocket kline messages, one JSON object per line')
+    parser.add_argument('--history', default=None, help='pickled candle dataframe preceding the recorded klines')
+    parser.add_argument('--output', default=None, help='JSON report path (default: closing_tick_<commit>.json)')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.klines is not None and args.history is None:
+        parser.error('--klines requires --history')
+    
+    if args.worker is not None:
+        run_mode(args)
+        return
+    
+    commit = git_commit()
+    output = os.path.abspath(args.output or 'closing_tick_{:s}.json'.format(commit))
+    report = {
+        'metadata': {
+            'commit': commit,
+            'created': dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%d %H:%M:%S %z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor()
+        },
+        'modes': dict()
+    }
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            mode_output = os.path.join(tmp, 'report.json')
+            worker_args = [
+                sys.executable, os.path.abspath(__file__),
+                '--worker', mode,
+                '--candles', str(args.candles),
+                '--ticks-per-candle', str(args.ticks_per_candle),
+                '--warmup', str(args.warmup),
+                '--n-estimators', str(args.n_estimators),
+                '--symbols', str(args.symbols),
+                '--output', mode_output
+            ]
+            if args.timeframes:
+                worker_args += ['--timeframes'] + args.timeframes
+            if args.klines is not None:
+                worker_args += ['--klines', os.path.abspath(args.klines), '--history', os.path.abspath(args.history)]
+            t0 = time.perf_counter()
+            subprocess.run(worker_args, check=True)
+            with open(mode_output, 'r') as fh:
+                mode_report = json.load(fh)
+        report['modes'][mode] = mode_report
+        print('\nmode {:s} ({:d} closing ticks, {:d} symbols, {:s}, {:.1f} s, max rss {:s})'.format(
+            mode,
+            mode_report['metadata']['closing_ticks'],
+            mode_report['metadata']['symbols'],
+            mode_report['metadata']['technicals_backend'],
+            time.perf_counter() - t0,
+            '{:.0f} MB'.format(mode_report['metadata']['max_rss_mb']) if mode_report['metadata']['max_rss_mb'] else 'n/a'
+        ))
+        print('{:14s}{:>10s}{:>10s}{:>10s}{:>10s}'.format('stage', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'))
+        for stage, stats in mode_report['stages'].items():
+            print('{:14s}{:10.3f}{:10.3f}{:10.3f}{:10.3f}'.format(
+                stage,
+                stats['mean_ms'],
+                stats['p50_ms'],
+                stats['p95_ms'],
+                stats['p99_ms']
+            ))
+    
+    with open(output, 'w', newline='\n') as fh:
+        json.dump(report, fh, indent=2)
+    print('\nreport written to {:s}'.format(output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from synthetic_data import make_candles
+from df_utils import DF_CODECS, available_codecs, detect_codec, dfsave, dfload, apply_technicals_v04_full
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='read/write throughput and file size of the df_utils codecs')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--raw', action='store_true', help='only the raw candle columns, without v04 technicals')
+    args = parser.parse_args()
+    
+    df = make_candles(args.rows)
+    if not args.raw:
+        df = apply_technicals_v04_full(df)
+    n_bytes = df.memory_usage(index=True).sum()
+    print('{:d} rows x {:d} columns, {:.1f} MB in memory'.format(df.shape[0], df.shape[1], n_bytes / 1e6))
+    missing = [name for name in DF_CODECS if name not in available_codecs()]
+    if missing:
+        print('not installed: {:s}'.format(', '.join(missing)))
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_codecs_')
+    try:
+        print('{:10s}{:>12s}{:>12s}{:>12s}{:>10s}'.format('codec', 'write MB/s', 'read MB/s', 'size MB', 'ratio'))
+        for name in available_codecs():
+            path = os.path.join(work_dir, 'candles' + DF_CODECS[name][2])
+            write_times, read_times = list(), list()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    dfsave(df, path, name)
+                    write_times.append(time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    loaded = dfload(path)
+                    read_times.append(time.perf_counter() - t0)
+            assert detect_codec(path) in (name, 'columnar'), name
+            assert list(loaded.columns) == list(df.columns), name
+            assert np.all(loaded.index == df.index), name
+            np.testing.assert_array_equal(loaded.to_numpy(), df.to_numpy(), err_msg=name)
+            size = os.path.getsize(path)
+            print('{:10s}{:12.0f}{:12.0f}{:12.2f}{:10.2f}'.format(
+                name,
+                n_bytes / 1e6 / min(write_times),
+                n_bytes / 1e6 / min(read_times),
+                size / 1e6,
+                n_bytes / size
+            ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from synthetic_data import make_candles
+from df_utils import apply_technicals_v04_full
+from stream_technicals import TECHNICALS_V04_COLUMNS, TechnicalsV04Stream
+from feature_cache import FeatureCache
+from candle_buffer import CandleBuffer
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='startup technicals: apply_technicals_v04_full + seed vs FeatureCache')
+    parser.add_argument('--frame', type=int, default=1025, help='rows of the startup frame')
+    parser.add_argument('--downtime', type=int, default=24, help='candles between shutdown and restart')
+    parser.add_argument('--runtime', type=int, default=48, help='closing candles before the last cache save')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    df = make_candles(args.frame + args.runtime + args.downtime)
+    work_dir = tempfile.mkdtemp(prefix='bench_feature_cache_')
+    try:
+        cache = FeatureCache(os.path.join(work_dir, 'features'), min_rows=args.frame - 1)
+        
+        # first start: nothing cached yet
+        t0 = time.perf_counter()
+        frame = cache.apply(df.iloc[:args.frame].copy())
+        t_cold = time.perf_counter() - t0
+        
+        # live bot: closing candles go through the stream into the ring buffer, then the cache is saved
+        engine = cache.engine
+        candles = CandleBuffer.from_dataframe(frame, args.frame - 1)
+        reference = TechnicalsV04Stream()
+        reference.seed(df.iloc[:args.frame])
+        for tick in df.iloc[args.frame:args.frame + args.runtime].to_dict('records'):
+            tick.update(engine.update(tick))
+            candles.append(candles.last_open_time() + 3600 * 1000, tick)
+        cache.save(candles.to_dataframe(), engine)
+        
+        # restart after the downtime: same frame length, ending at the latest candle
+        restart_frame = df.iloc[-args.frame:]
+        warm_times = list()
+        for _ in range(args.repeat):
+            cache_ = FeatureCache(cache.path, min_rows=args.frame - 1)
+            t0 = time.perf_counter()
+            warm = cache_.apply(restart_frame.copy(), save=False)
+            warm_times.append(time.perf_counter() - t0)
+        cold_times = list()
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            full = apply_technicals_v04_full(restart_frame.copy())
+            TechnicalsV04Stream().seed(full)
+            cold_times.append(time.perf_counter() - t0)
+        
+        # the cached path continues the stream instead of restarting it at the frame start
+        expected = reference.seed(df.iloc[args.frame:])
+        for col in TECHNICALS_V04_COLUMNS:
+            np.testing.assert_allclose(
+                warm[col].to_numpy()[-args.downtime - args.runtime:],
+                expected[col].to_numpy(),
+                rtol = 1e-12,
+                atol = 1e-12,
+                err_msg = col
+            )
+        print('parity with an uninterrupted stream: ok ({:d} rows)'.format(warm.shape[0]))
+        
+        # a changed indicator definition must not reuse the cache
+        stale = FeatureCache(cache.path, min_rows=args.frame - 1)
+        stale.definition_hash = 'changed'
+        assert stale.load() is None
+        
+        print('first start, FeatureCache (full + save): {:8.1f} ms'.format(1e3 * t_cold))
+        print('restart, apply_technicals_v04_full + seed: {:6.1f} ms'.format(1e3 * np.median(cold_times)))
+        print('restart, FeatureCache ({:3d} new rows):     {:6.1f} ms'.format(args.downtime, 1e3 * np.median(warm_times)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+REST calls against a local fake server with a simulated connection handshake:
+a fresh session per call (what a throwaway Client does) against the shared
+pooled session, the PooledClient on top of it, GET retries on 503 responses and
+the per endpoint statistics dumped to a file
+"""
+import os
+import json
+import time
+import shutil
+import atexit
+import argparse
+import tempfile
+import requests
+from fake_binance_server import FakeBinanceServer
+from bench_closing_tick import prepare_working_dir
+
+def fresh_session_get(url:str) -> requests.Response:
+    with requests.Session() as session:
+        return session.get(url, timeout=5.)
+
+def timed_calls(get, url:str, n:int) -> tuple:
+    # mean ms per call and the number of calls not answered with 200
+    n_failed = 0
+    t0 = time.perf_counter()
+    for _ in range(n):
+        if get(url).status_code != 200:
+            n_failed += 1
+    return 1e3 * (time.perf_counter() - t0) / n, n_failed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='shared pooled HTTP session vs a fresh connection per call')
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds per request on the fake server')
+    parser.add_argument('--connect-latency', type=float, default=0.03, help='seconds per new connection')
+    parser.add_argument('--fail-every', type=int, default=4, help='every n-th request gets a 503')
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_http_session_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, 'v04')
+    from http_session import PooledClient, http_stats, get_session, dump_http_stats, format_http_stats
+    from config import HTTP_STATS_PATH
+    
+    print('{:d} calls, {:.0f} ms per request, {:.0f} ms per new connection'.format(
+        args.calls,
+        1e3 * args.latency,
+        1e3 * args.connect_latency
+    ))
+    for name, get in (('fresh session per call', fresh_session_get), ('shared pooled session', get_session().get)):
+        with FakeBinanceServer(latency=args.latency, connect_latency=args.connect_latency) as server:
+            ms, n_failed = timed_calls(get, server.base_url + '/api/v3/time', args.calls)
+            assert n_failed == 0
+            print('{:24s} {:6.1f} ms per call, {:3d} connections'.format(name, ms, server.n_connections))
+    
+    with FakeBinanceServer(latency=args.latency, connect_latency=args.connect_latency) as server:
+        
+        class LocalClient(PooledClient):
+            API_URL = server.base_url + '/api'
+        
+        http_stats.reset()
+        client = LocalClient('key', 'secret')  # pings on construction
+        t0 = time.perf_counter()
+        for _ in range(args.calls):
+            client.get_server_time()
+        print('{:24s} {:6.1f} ms per call, {:3d} connections'.format(
+            'PooledClient',
+            1e3 * (time.perf_counter() - t0) / args.calls,
+            server.n_connections
+        ))
+        assert http_stats.requests['GET /api/v3/time'] == args.calls
+        assert http_stats.requests['GET /api/v1/ping'] + http_stats.requests['GET /api/v3/ping'] == 1
+    
+    # 503s: a plain session sees every one of them, the pooled session retries the GETs
+    with FakeBinanceServer(latency=args.latency, fail_every=args.fail_every) as server:
+        with requests.Session() as session:
+            n_failed = timed_calls(lambda url: session.get(url, timeout=5.), server.base_url + '/api/v3/time', args.calls)[1]
+    print('\n503 on every {:d}th request: plain session {:d} failed calls'.format(args.fail_every, n_failed), end=', ')
+    assert n_failed == args.calls // args.fail_every
+    with FakeBinanceServer(latency=args.latency, fail_every=args.fail_every) as server:
+        http_stats.reset()
+        n_failed = timed_calls(get_session().get, server.base_url + '/api/v3/time', args.calls)[1]
+        print('shared session {:d} failed calls, {:d} retries'.format(n_failed, http_stats.retries['GET /api/v3/time']))
+        assert n_failed == 0 and http_stats.retries['GET /api/v3/time'] == len(server.requests) - args.calls
+        # POST is not idempotent and never retried
+        get_session().post(server.base_url + '/api/v3/order')
+        get_session().get(server.base_url + '/api/v3/unknown')
+        assert http_stats.retries['POST /api/v3/order'] == 0
+    
+    print('\n' + format_http_stats())
+    assert dump_http_stats()
+    with open(HTTP_STATS_PATH, 'r') as fh:
+        report = json.load(fh)
+    for endpoint, stats in report['endpoints'].items():
+        assert sum(report['histogram'][endpoint]) == stats['count']
+    assert report['endpoints']['GET /api/v3/unknown']['errors'] == {'HTTP 404': 1}
+    print('{:s}: {:d} endpoints, histograms over {:d} buckets'.format(
+        HTTP_STATS_PATH,
+        len(report['endpoints']),
+        len(report['buckets_ms']) + 1
+    ))
+
+if __name__ == '__main__':
+    main()
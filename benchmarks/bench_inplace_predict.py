@@ -0,0 +1,76 @@
+import time
+import argparse
+import joblib
+import numpy as np
+from xgboost import XGBRegressor
+from synthetic_data import make_candles
+from df_utils import apply_technicals_v04_full, create_dfml, FeaturePlan
+from prediction import InplacePredictor, model_feature_names
+from config import (
+    N_ROWS_TO_PREDICT,
+    IGNORED_COLUMNS,
+    LABEL_COL,
+    Y_PRED_COL,
+    Y_PRED_MA_COL
+)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='est.predict on a DataFrame slice vs Booster.inplace_predict')
+    parser.add_argument('--model', type=str, default=None, help='v04 model to load, a synthetic one is trained if omitted')
+    parser.add_argument('--repeats', type=int, default=500)
+    args = parser.parse_args()
+    
+    df = apply_technicals_v04_full(make_candles(3000))
+    dfml = create_dfml(df, 'v04', IGNORED_COLUMNS)
+    if args.model is None:
+        train = dfml.dropna()
+        est = XGBRegressor(n_estimators=300, max_depth=6)
+        est.fit(train, np.random.default_rng(0).normal(0., 1., train.shape[0]))
+    else:
+        est = joblib.load(args.model)
+    
+    dfml[Y_PRED_COL] = np.full(dfml.shape[0], np.nan)
+    
+    def current_path() -> np.ndarray:
+        return est.predict(
+            dfml.iloc[-N_ROWS_TO_PREDICT:, :].loc[
+                :,
+                [col not in [LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL] for col in dfml.columns]
+            ]
+        )
+    
+    plan = FeaturePlan(
+        df.columns,
+        'v04',
+        IGNORED_COLUMNS,
+        output_columns = model_feature_names(est),
+        dtype = np.float32
+    )
+    predictor = InplacePredictor(est, plan.columns, N_ROWS_TO_PREDICT)
+    values = df.to_numpy()
+    
+    def inplace_path(n_rows:int) -> np.ndarray:
+        plan.transform(values[-n_rows:], out=predictor.buffer[:n_rows])
+        return predictor.predict(n_rows)
+    
+    np.testing.assert_allclose(inplace_path(N_ROWS_TO_PREDICT), current_path(), rtol=1e-6, atol=1e-6)
+    print('parity with est.predict: ok')
+    
+    for name, fn in (
+        ('est.predict, {:d} rows'.format(N_ROWS_TO_PREDICT), current_path),
+        ('plan + inplace_predict, {:d} rows'.format(N_ROWS_TO_PREDICT), lambda: inplace_path(N_ROWS_TO_PREDICT)),
+        ('plan + inplace_predict, 1 row', lambda: inplace_path(1))
+    ):
+        times = list()
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        print('{:34s} p50 {:8.1f} us  p99 {:8.1f} us'.format(
+            name,
+            1e6 * np.percentile(times, 50),
+            1e6 * np.percentile(times, 99)
+        ))
+
+if __name__ == '__main__':
+    main()
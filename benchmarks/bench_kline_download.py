@@ -0,0 +1,65 @@
+import time
+import argparse
+from synthetic_data import make_candles  # noqa: F401 (puts the repo root on sys.path)
+from fake_binance_server import FakeBinanceServer, HOUR_MS
+from kline_downloader import KlineDownloader
+from http_session import InstrumentedSession, EndpointStats, make_adapter
+from rate_limits import RateLimitScheduler
+
+def sequential_baseline(base_url:str, start_ms:int, end_ms:int) -> list:
+    # what download_dataframe did before: one get_historical_klines call
+    from binance.client import Client
+    
+    class LocalClient(Client):
+        API_URL = base_url + '/api'
+    
+    return LocalClient('', '').get_historical_klines('BTCUSDT', '1h', start_ms, end_ms)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='parallel windowed kline download against a local fake server')
+    parser.add_argument('--years', type=float, default=3.)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds per request on the fake server')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--weight-limit', type=int, default=1200, help='request weight per window of the fake server')
+    parser.add_argument('--weight-window', type=float, default=60., help='seconds of the weight window')
+    parser.add_argument('--skip-baseline', action='store_true')
+    args = parser.parse_args()
+    
+    # a fresh server and scheduler per run, their weight accounting would otherwise carry over
+    with FakeBinanceServer(latency=args.latency) as server:
+        end_ms = server.now_ms
+        start_ms = end_ms - int(args.years * 365 * 24) * HOUR_MS + 1234  # deliberately not aligned
+        expected = server.expected_klines(start_ms, end_ms)
+        print('{:d} candles, {:.0f} ms latency per request'.format(len(expected), 1e3 * args.latency))
+        if not args.skip_baseline:
+            t0 = time.perf_counter()
+            klines = sequential_baseline(server.base_url, start_ms, end_ms)
+            assert klines == expected, 'baseline result differs'
+            print('get_historical_klines:     {:7.2f} s ({:d} requests)'.format(
+                time.perf_counter() - t0,
+                len(server.requests)
+            ))
+    
+    for workers in args.workers:
+        with FakeBinanceServer(
+            latency = args.latency,
+            weight_limit = args.weight_limit,
+            weight_window = args.weight_window
+        ) as server:
+            scheduler = RateLimitScheduler(limits={'REQUEST_WEIGHT': (args.weight_limit, args.weight_window)})
+            session = InstrumentedSession(make_adapter(), EndpointStats(), (3.05, 10.), scheduler=scheduler)
+            downloader = KlineDownloader(server.base_url, max_workers=workers, session=session)
+            t0 = time.perf_counter()
+            klines = downloader.download('BTCUSDT', '1h', start_ms, end_ms)
+            seconds = time.perf_counter() - t0
+            assert klines == expected, 'downloaded klines differ'
+            print('KlineDownloader {:2d} workers: {:7.2f} s ({:d} requests, max concurrency {:d}, {:d} rate limited)'.format(
+                workers,
+                seconds,
+                len(server.requests),
+                server.max_concurrency,
+                server.statuses[429] + server.statuses[418]
+            ))
+
+if __name__ == '__main__':
+    main()
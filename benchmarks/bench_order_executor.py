@@ -0,0 +1,172 @@
+"""
+time spent in a kline handler that runs its order commands inline against one
+that queues them on an OrderExecutor, with every REST call of the fake spot
+account delayed; exchange side fills wait for the queued commands like the
+exchange waits for the order, both runs have to end in the same state after the
+same sequence of REST calls
+"""
+import os
+import time
+import shutil
+import atexit
+import argparse
+import tempfile
+import numpy as np
+from fake_user_stream import FakeSpotAccount
+from bench_closing_tick import prepare_working_dir
+from bench_user_stream import STATE_FIELDS
+
+REST_METHODS = [
+    'order_limit_buy',
+    'order_limit_sell',
+    'create_order',
+    'create_oco_order',
+    'cancel_order',
+    'get_order',
+    'get_open_orders',
+    'get_asset_balance'
+]
+
+class SlowAccount(FakeSpotAccount):
+    delay = 0.
+    
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.log = list()
+
+def slow(name:str):
+    method = getattr(FakeSpotAccount, name)
+    
+    def call(self, *args, **kwargs):
+        time.sleep(self.delay)
+        self.log.append(name)
+        return method(self, *args, **kwargs)
+    
+    return call
+
+for name in REST_METHODS:
+    setattr(SlowAccount, name, slow(name))
+
+def make_scenario() -> dict:
+    # tick -> ('command', function of the state machine) or ('exchange', function of sm and account)
+    from bot_utils import BUY_TYPE, STOPLOSS_TYPE, OCO_SELL_TYPE
+    
+    def free_asset(sm) -> float:
+        return float(sm.asset_balance['free'])
+    
+    return {
+        0: ('command', lambda sm: sm.place_and_process_order(BUY_TYPE, 0.1, 10000.)),
+        4: ('exchange', lambda sm, account: account.fill(sm.buy_order_id, 0.06)),
+        5: ('command', lambda sm: sm.reconcile_and_process_orders(update_balances=True)),
+        6: ('command', lambda sm: sm.cancel_buy_order()),
+        7: ('command', lambda sm: sm.update_asset_balance()),
+        8: ('command', lambda sm: sm.place_and_process_order(STOPLOSS_TYPE, free_asset(sm), 9500.)),
+        12: ('command', lambda sm: sm.cancel_stoploss_order(alert=False)),
+        13: ('command', lambda sm: sm.place_and_process_order(OCO_SELL_TYPE, free_asset(sm), 10500.)),
+        20: ('exchange', lambda sm, account: account.fill(sm.sell_order_id, 0.06)),
+        21: ('command', lambda sm: sm.reconcile_and_process_orders(update_balances=True)),
+        22: ('command', lambda sm: sm.place_and_process_order(BUY_TYPE, 0.05, 10100.)),
+        26: ('command', lambda sm: sm.cancel_buy_order())
+    }
+
+def run(synchronous:bool, args:argparse.Namespace) -> dict:
+    from binance_interface import TradeStateMachine
+    from order_executor import OrderExecutor
+    
+    SlowAccount.delay = 0.
+    account = SlowAccount(quote_balance=2000.)
+    sm = TradeStateMachine(
+        state_path = os.path.abspath('data/state_{:s}.json'.format('inline' if synchronous else 'queued')),
+        client = account,
+        mode = 'v04'
+    )
+    sm.stoploss_level = 9500.
+    sm.update_asset_balance()
+    sm.update_quote_asset_balance()
+    account.log.clear()
+    SlowAccount.delay = args.rest_latency
+    
+    executor = OrderExecutor(synchronous=synchronous)
+    scenario = make_scenario()
+    handler_seconds = list()
+    t_start = time.perf_counter()
+    for tick in range(args.ticks):
+        kind, action = scenario.get(tick, (None, None))
+        if kind == 'exchange':
+            executor.flush()
+            action(sm, account)
+        t0 = time.perf_counter()
+        sm.last_price = 10000. + tick
+        if kind == 'command':
+            executor.submit(action, sm)
+        # the bookkeeping every tick does, queued like the order commands
+        executor.submit(lambda: sm.save_state() if sm.unsaved_changes else None)
+        handler_seconds.append(time.perf_counter() - t0)
+        time.sleep(args.tick_seconds)
+    executor.flush()
+    seconds = time.perf_counter() - t_start
+    executor.close()
+    return {
+        'state': {field: getattr(sm, field) for field in STATE_FIELDS},
+        'log': list(account.log),
+        'handler_ms': 1e3 * np.array(handler_seconds),
+        'seconds': seconds,
+        'latency': executor.latency.summary(),
+        'failed': executor.n_failed
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='order commands inline vs on the order executor thread')
+    parser.add_argument('--ticks', type=int, default=30)
+    parser.add_argument('--tick-seconds', type=float, default=0.02, help='time between kline messages')
+    parser.add_argument('--rest-latency', type=float, default=0.05, help='seconds per REST call')
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_order_executor_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, 'v04')
+    # config reads ./data/credentials.json on import, the default client must not touch the network
+    import binance.client
+    
+    class FakeClient(FakeSpotAccount):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__()
+    
+    binance.client.Client = FakeClient
+    import telegram_interface as tg
+    tg.send = lambda *args, **kwargs: None
+    tg.notify = lambda *args, **kwargs: None
+    
+    results = {'inline': run(True, args), 'executor': run(False, args)}
+    print('{:d} ticks {:.0f} ms apart, {:.0f} ms per REST call'.format(args.ticks, 1e3 * args.tick_seconds, 1e3 * args.rest_latency))
+    print('{:10s}{:>10s}{:>10s}{:>10s}{:>10s}{:>12s}'.format('', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms', 'run_s'))
+    for name, result in results.items():
+        ms = result['handler_ms']
+        print('{:10s}{:10.2f}{:10.2f}{:10.2f}{:10.2f}{:12.2f}'.format(
+            name,
+            ms.mean(),
+            np.percentile(ms, 50),
+            np.percentile(ms, 99),
+            ms.max(),
+            result['seconds']
+        ))
+    queued = results['executor']['latency']['queued']
+    print('executor: commands queued {:.1f} ms on average, {:.1f} ms at most'.format(queued['mean_ms'], queued['max_ms']))
+    
+    assert results['inline']['failed'] == 0 and results['executor']['failed'] == 0
+    assert results['inline']['log'] == results['executor']['log'], 'REST call sequence differs'
+    mismatches = [f for f in STATE_FIELDS if results['inline']['state'][f] != results['executor']['state'][f]]
+    for field in mismatches:
+        print('mismatch {:s}: inline {:s}, executor {:s}'.format(
+            field,
+            str(results['inline']['state'][field]),
+            str(results['executor']['state'][field])
+        ))
+    assert not mismatches
+    print('same {:d} REST calls in the same order and final state parity ({:d} fields): ok'.format(
+        len(results['inline']['log']),
+        len(STATE_FIELDS)
+    ))
+
+if __name__ == '__main__':
+    main()
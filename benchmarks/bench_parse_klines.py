@@ -0,0 +1,72 @@
+import time
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+from fake_binance_server import fake_kline, HOUR_MS
+from synthetic_data import make_candles  # noqa: F401 (puts the repo root on sys.path)
+from df_utils import klines_to_dataframe
+from config import TIMEZONE_OBJ
+
+def loop_baseline(klines:list) -> pd.DataFrame:
+    # what download_dataframe did before: fromtimestamp per row and a 12 column float frame
+    opening_times = list()
+    for tick in klines:
+        opening_times.append(dt.datetime.fromtimestamp(tick[0] // 1000))
+    
+    df = pd.DataFrame(
+        klines,
+        dtype = 'float64',
+        index = opening_times,
+        columns = [
+            0,
+            'open',
+            'high',
+            'low',
+            'close',
+            'volume',
+            6,
+            'quote_asset_vol',
+            'no_of_trades',
+            'taker_buy_base_vol',
+            'taker_buy_quote_vol',
+            11
+        ]
+    )
+    df.drop(columns=[0, 6, 11], inplace=True)
+    df.index = df.index.tz_localize(TIMEZONE_OBJ, ambiguous='infer')
+    return df
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='kline payload to dataframe: row loop vs bulk parse_klines')
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+    
+    first_open_time = 1262304000000  # 2010-01-01 UTC, the rows stay within the tz database range
+    klines = [fake_kline(first_open_time + i * HOUR_MS) for i in range(args.rows)]
+    
+    t0 = time.perf_counter()
+    try:
+        expected = loop_baseline(klines)
+    except ValueError as e:
+        # ambiguous local times when the machine doesn't run in TIMEZONE_OBJ
+        print('row loop failed: {:s} (run with TZ={:s})'.format(str(e), str(TIMEZONE_OBJ)))
+        return
+    t_loop = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    df = klines_to_dataframe(klines)
+    t_bulk = time.perf_counter() - t0
+    
+    assert list(df.columns) == list(expected.columns)
+    np.testing.assert_array_equal(df.to_numpy(), expected.to_numpy())
+    # the row loop interprets open times in the local timezone of the machine, so its
+    # index is only correct where that is TIMEZONE_OBJ
+    assert df.index.tz_convert('UTC')[0] == pd.Timestamp(klines[0][0], unit='ms', tz='UTC')
+    print('parity of values with the row loop: ok ({:d} rows)'.format(args.rows))
+    print('index matches the row loop: {:s}'.format(str(bool(np.all(df.index == expected.index)))))
+    print('row loop:           {:7.3f} s'.format(t_loop))
+    print('klines_to_dataframe: {:6.3f} s ({:.1f}x)'.format(t_bulk, t_loop / t_bulk))
+
+if __name__ == '__main__':
+    main()
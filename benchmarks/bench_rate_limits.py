@@ -0,0 +1,139 @@
+"""
+bursts of cancels, re-placed orders, balance and order status reads of several
+pairs around volatile closes, sent from a few threads against a fake server with
+scaled down limits (429 over a limit, 418 and a ban when ignoring Retry-After),
+once straight through the session and once through the RateLimitScheduler
+"""
+import os
+import time
+import shutil
+import atexit
+import argparse
+import tempfile
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fake_binance_server import FakeBinanceServer
+from bench_closing_tick import prepare_working_dir
+
+# what one pair does at a volatile close
+CLOSE_REQUESTS = [
+    ('GET', 'account'),
+    ('DELETE', 'order'),
+    ('GET', 'account'),
+    ('POST', 'order'),
+    ('GET', 'order'),
+    ('GET', 'openOrders'),
+    ('GET', 'account')
+]
+ORDER_REQUESTS = (('POST', 'order'), ('DELETE', 'order'))
+
+def send(session, base_url:str, method:str, endpoint:str, pair:int) -> tuple:
+    # (request, outcome, seconds), outcome is the HTTP status or 'rejected' by the scheduler
+    from rate_limits import RateLimitExceeded
+    params = {'symbol': 'PAIR{:d}USDT'.format(pair), 'timestamp': int(time.time() * 1000), 'signature': 'x'}
+    if endpoint == 'account':
+        del params['symbol']
+    elif endpoint == 'order' and method != 'POST':
+        params['orderId'] = 1000 + pair
+    t0 = time.perf_counter()
+    try:
+        if method == 'GET':
+            status = session.get(base_url + '/api/v3/' + endpoint, params=params).status_code
+        else:
+            status = session.request(method, base_url + '/api/v3/' + endpoint, data=params).status_code
+    except RateLimitExceeded:
+        status = 'rejected'
+    return (method, endpoint), status, time.perf_counter() - t0
+
+def run(scheduled:bool, args:argparse.Namespace) -> dict:
+    from http_session import InstrumentedSession, EndpointStats, make_adapter
+    from rate_limits import RateLimitScheduler
+    scheduler = None
+    if scheduled:
+        scheduler = RateLimitScheduler(
+            limits = {'REQUEST_WEIGHT': (args.weight_limit, args.window), 'ORDERS_10S': (args.order_limit, args.window)},
+            max_wait = args.max_wait,
+            coalesce_seconds = args.coalesce_seconds
+        )
+    session = InstrumentedSession(make_adapter(), EndpointStats(), (3.05, 10.), scheduler=scheduler)
+    outcomes = list()
+    with FakeBinanceServer(
+        latency = args.latency,
+        weight_limit = args.weight_limit,
+        weight_window = args.window,
+        order_limit = args.order_limit,
+        order_window = args.window,
+        ban_seconds = args.ban_seconds
+    ) as server:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            for close in range(args.closes):
+                time.sleep(max(t0 + close * args.close_seconds - time.perf_counter(), 0.))
+                futures = [
+                    executor.submit(send, session, server.base_url, method, endpoint, pair)
+                    for pair in range(args.pairs)
+                    for method, endpoint in CLOSE_REQUESTS
+                ]
+                outcomes += [future.result() for future in futures]
+        seconds = time.perf_counter() - t0
+        statuses = dict(server.statuses)
+    orders = [(status, s) for request, status, s in outcomes if request in ORDER_REQUESTS]
+    reads = [status for request, status, _ in outcomes if request not in ORDER_REQUESTS]
+    return {
+        'seconds': seconds,
+        'server': statuses,
+        'orders_ok': sum(status == 200 for status, _ in orders),
+        'orders': len(orders),
+        'order_ms': 1e3 * np.array([s for status, s in orders if status == 200] or [np.nan]),
+        'reads': Counter(reads),
+        'counts': scheduler.status()['counts'] if scheduler is not None else dict()
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='REST bursts with and without the rate limit scheduler')
+    parser.add_argument('--pairs', type=int, default=4)
+    parser.add_argument('--closes', type=int, default=3)
+    parser.add_argument('--close-seconds', type=float, default=3., help='time between the bursts')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds per request on the fake server')
+    parser.add_argument('--weight-limit', type=int, default=100)
+    parser.add_argument('--order-limit', type=int, default=10)
+    parser.add_argument('--window', type=float, default=5., help='seconds of the limit windows, scaled down from 60 and 10')
+    parser.add_argument('--ban-seconds', type=int, default=5)
+    parser.add_argument('--max-wait', type=float, default=3.)
+    parser.add_argument('--coalesce-seconds', type=float, default=1.)
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_rate_limits_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, 'v04')
+    
+    print('{:d} pairs x {:d} requests per close, {:d} closes {:.0f} s apart; weight {:d} and {:d} orders per {:.0f} s'.format(
+        args.pairs,
+        len(CLOSE_REQUESTS),
+        args.closes,
+        args.close_seconds,
+        args.weight_limit,
+        args.order_limit,
+        args.window
+    ))
+    results = {'unscheduled': run(False, args), 'scheduler': run(True, args)}
+    for name, result in results.items():
+        print('\n{:s} ({:.1f} s)'.format(name, result['seconds']))
+        print('  server responses {:s}'.format(', '.join('{:d}: {:d}'.format(k, v) for k, v in sorted(result['server'].items()))))
+        print('  orders and cancels {:d}/{:d} ok, p50 {:.0f} ms, max {:.0f} ms'.format(
+            result['orders_ok'],
+            result['orders'],
+            np.nanpercentile(result['order_ms'], 50),
+            np.nanmax(result['order_ms'])
+        ))
+        print('  reads {:s}'.format(', '.join('{:s}: {:d}'.format(str(k), v) for k, v in sorted(result['reads'].items(), key=str))))
+        if result['counts']:
+            print('  scheduler {:s}'.format(', '.join('{:s} {:d}'.format(k, v) for k, v in sorted(result['counts'].items()))))
+    scheduled = results['scheduler']
+    assert scheduled['orders_ok'] == scheduled['orders']
+    assert scheduled['server'].get(418, 0) == 0
+
+if __name__ == '__main__':
+    main()
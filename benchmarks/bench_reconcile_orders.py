@@ -0,0 +1,131 @@
+"""
+REST round trips and resulting TradeStateMachine state of the sequential
+check_buy_order / check_sell_order / check_stoploss_order calls against
+TradeStateMachine.reconcile_orders for a set of order situations on a fake
+spot account; a slot is consistent if its active flag and executed quantity
+agree with the exchange and position_open with the holdings
+"""
+import os
+import shutil
+import atexit
+import tempfile
+from fake_user_stream import FakeSpotAccount
+from bench_closing_tick import prepare_working_dir
+
+def make_scenarios() -> dict:
+    from bot_utils import BUY_TYPE, SELL_TYPE, STOPLOSS_TYPE, OCO_SELL_TYPE
+    
+    def buy(sm, account) -> None:
+        sm.place_and_process_order(BUY_TYPE, 0.1, 10000.)
+    
+    def position(sm, account) -> None:
+        buy(sm, account)
+        account.fill(sm.buy_order_id, 0.1)
+        sm.check_and_process_order(BUY_TYPE, update_balances=True)
+    
+    def oco(sm, account) -> None:
+        position(sm, account)
+        sm.stoploss_level = 9500.
+        sm.place_and_process_order(OCO_SELL_TYPE, float(sm.asset_balance['free']), 10500.)
+    
+    def stoploss(sm, account) -> None:
+        position(sm, account)
+        sm.stoploss_level = 9500.
+        sm.place_and_process_order(STOPLOSS_TYPE, float(sm.asset_balance['free']), sm.stoploss_level)
+    
+    def half_position_and_stoploss(sm, account) -> None:
+        # stop-loss for the filled half of a buy order that is still open
+        buy(sm, account)
+        account.fill(sm.buy_order_id, 0.05)
+        sm.check_and_process_order(BUY_TYPE, update_balances=True)
+        sm.stoploss_level = 9500.
+        sm.place_and_process_order(STOPLOSS_TYPE, float(sm.asset_balance['free']), sm.stoploss_level)
+    
+    return {
+        'buy open, nothing changed': (buy, lambda sm, account: None),
+        'buy partially filled': (buy, lambda sm, account: account.fill(sm.buy_order_id, 0.04)),
+        'buy open + stop-loss, no change': (half_position_and_stoploss, lambda sm, account: None),
+        'buy open + stop-loss, buy filled': (half_position_and_stoploss, lambda sm, account: account.fill(sm.buy_order_id, 0.05)),
+        'stop-loss filled': (stoploss, lambda sm, account: account.fill(sm.stoploss_order_id, 0.1)),
+        'OCO open, nothing changed': (oco, lambda sm, account: None),
+        'OCO limit leg partially filled': (oco, lambda sm, account: account.fill(sm.sell_order_id, 0.03)),
+        'OCO limit leg filled': (oco, lambda sm, account: account.fill(sm.sell_order_id, 0.1)),
+        'OCO stop-loss leg filled': (oco, lambda sm, account: account.fill(sm.stoploss_order_id, 0.1))
+    }
+
+def sequential(sm) -> None:
+    # the calls of init_symbol before reconcile_orders
+    if sm.buy_order_active: sm.check_buy_order()
+    if sm.sell_order_active: sm.check_sell_order()
+    if sm.stoploss_order_active: sm.check_stoploss_order()
+
+def consistent(sm, account) -> bool:
+    from bot_utils import BUY_TYPE, SELL_TYPE, STOPLOSS_TYPE
+    for order_type, active in (
+        (BUY_TYPE, sm.buy_order_active),
+        (SELL_TYPE, sm.sell_order_active),
+        (STOPLOSS_TYPE, sm.stoploss_order_active)
+    ):
+        order = account.orders.get(sm.get_order_id(order_type), None)
+        if order is None:
+            continue
+        if active != (order['status'] in ('NEW', 'PARTIALLY_FILLED')):
+            return False
+        if float(order['executedQty']) > 0. and sm.get_executed_quantity(order_type) != float(order['executedQty']):
+            return False
+    return sm.position_open == (sum(account.balances[account.asset]) > 1e-12)
+
+def run(name:str, setup, action, reconcile:bool) -> tuple:
+    from binance_interface import TradeStateMachine
+    account = FakeSpotAccount(quote_balance=2000.)
+    sm = TradeStateMachine(
+        state_path = os.path.abspath('data/state_{:d}.json'.format(abs(hash((name, reconcile))))),
+        client = account,
+        mode = 'v04'
+    )
+    sm.update_asset_balance()
+    sm.update_quote_asset_balance()
+    setup(sm, account)
+    action(sm, account)
+    account.calls.clear()
+    if reconcile:
+        sm.reconcile_orders()
+    else:
+        sequential(sm)
+    return sum(account.calls.values()), account.weight, consistent(sm, account)
+
+def main() -> None:
+    work_dir = tempfile.mkdtemp(prefix='bench_reconcile_orders_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, 'v04')
+    # config reads ./data/credentials.json on import, the default client must not touch the network
+    import binance.client
+    
+    class FakeClient(FakeSpotAccount):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__()
+    
+    binance.client.Client = FakeClient
+    import telegram_interface as tg
+    tg.send = lambda *args, **kwargs: None
+    tg.notify = lambda *args, **kwargs: None
+    
+    rows = list()
+    for name, (setup, action) in make_scenarios().items():
+        rows.append((name, run(name, setup, action, False), run(name, setup, action, True)))
+    print('\n{:34s}{:>22s}{:>22s}'.format('', 'sequential checks', 'reconcile_orders'))
+    print('{:34s}{:>8s}{:>7s}{:>7s}{:>8s}{:>7s}{:>7s}'.format('situation', 'calls', 'weight', 'ok', 'calls', 'weight', 'ok'))
+    for name, (seq_calls, seq_weight, seq_ok), (rec_calls, rec_weight, rec_ok) in rows:
+        print('{:34s}{:8d}{:7d}{:>7s}{:8d}{:7d}{:>7s}'.format(
+            name,
+            seq_calls,
+            seq_weight,
+            'yes' if seq_ok else 'NO',
+            rec_calls,
+            rec_weight,
+            'yes' if rec_ok else 'NO'
+        ))
+    assert all(rec_ok for _, _, (_, _, rec_ok) in rows)
+
+if __name__ == '__main__':
+    main()
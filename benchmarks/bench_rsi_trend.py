@@ -0,0 +1,37 @@
+import time
+import argparse
+import numpy as np
+from synthetic_data import make_candles
+from df_utils import ta, linregress_trend, rolling_linregress_trend
+from stream_technicals import _RollingTrend
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='rolling linregress_trend: rolling.apply vs closed form')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--window', type=int, default=10)
+    args = parser.parse_args()
+    
+    rsi = ta.RSI(make_candles(args.rows), timeperiod=14)
+    
+    t0 = time.perf_counter()
+    expected = rsi.rolling(args.window).apply(linregress_trend).to_numpy()
+    t_apply = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    batch = rolling_linregress_trend(rsi, args.window)
+    t_batch = time.perf_counter() - t0
+    
+    trend = _RollingTrend(args.window)
+    t0 = time.perf_counter()
+    incremental = np.array([trend.push(x) for x in rsi.to_numpy()])
+    t_incremental = time.perf_counter() - t0
+    
+    np.testing.assert_allclose(batch, expected, rtol=1e-7, atol=1e-9)
+    np.testing.assert_allclose(incremental, expected, rtol=1e-7, atol=1e-9)
+    print('parity with rolling(...).apply(linregress_trend): ok ({:d} rows)'.format(args.rows))
+    print('rolling.apply(linregress_trend): {:9.3f} s'.format(t_apply))
+    print('rolling_linregress_trend:        {:9.3f} s ({:.0f}x)'.format(t_batch, t_apply / t_batch))
+    print('_RollingTrend.push:              {:9.3f} us/value'.format(1e6 * t_incremental / args.rows))
+
+if __name__ == '__main__':
+    main()
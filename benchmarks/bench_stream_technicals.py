@@ -0,0 +1,47 @@
+import time
+import argparse
+import numpy as np
+from synthetic_data import make_candles
+from df_utils import apply_technicals_v04_full, apply_technicals_v04_update
+from stream_technicals import TALIB_SEMANTICS, TECHNICALS_V04_COLUMNS, TechnicalsV04Stream
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='parity check and latency of the streaming v04 technicals')
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--updates', type=int, default=500)
+    args = parser.parse_args()
+    
+    df = make_candles(args.rows)
+    expected = apply_technicals_v04_full(df.copy())
+    
+    technicals = TechnicalsV04Stream()
+    seed_rows = args.rows - args.updates
+    seeded = technicals.seed(df.iloc[:seed_rows])
+    update_times = list()
+    rows = list()
+    for tick in df.iloc[seed_rows:].to_dict('records'):
+        t0 = time.perf_counter()
+        rows.append(technicals.update(tick))
+        update_times.append(time.perf_counter() - t0)
+    
+    print('backend: {:s}'.format('TA-Lib' if TALIB_SEMANTICS else 'talib_fallback'))
+    for i, col in enumerate(TECHNICALS_V04_COLUMNS):
+        streamed = np.concatenate([seeded[col].to_numpy(), [row[col] for row in rows]])
+        np.testing.assert_allclose(streamed, expected[col].to_numpy(), rtol=1e-9, atol=1e-9, err_msg=col)
+    print('parity with apply_technicals_v04_full: ok ({:d} columns, {:d} rows)'.format(
+        len(TECHNICALS_V04_COLUMNS),
+        args.rows
+    ))
+    
+    batch_times = list()
+    for i in range(seed_rows, min(seed_rows + 50, args.rows)):
+        df_ = df.iloc[i - 1000:i + 1].copy()
+        t0 = time.perf_counter()
+        apply_technicals_v04_update(df_)
+        batch_times.append(time.perf_counter() - t0)
+    
+    print('apply_technicals_v04_update (1001 rows): {:8.1f} us/candle'.format(1e6 * np.median(batch_times)))
+    print('TechnicalsV04Stream.update:              {:8.1f} us/candle'.format(1e6 * np.median(update_times)))
+
+if __name__ == '__main__':
+    main()
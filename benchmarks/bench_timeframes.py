@@ -0,0 +1,98 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from synthetic_data import make_candles
+from stream_technicals import TechnicalsV04Stream
+from candle_buffer import datetime_index_to_open_times
+from timeframes import SUMMED_COLUMNS, TIMEFRAME_TECHNICALS_COLUMNS, MultiTimeframeAggregator
+from config import DATA_COLUMNS
+
+def resample_bars(df:pd.DataFrame, interval:str) -> pd.DataFrame:
+    # reference: full pandas resample, bins start at UTC midnight
+    utc = df.tz_convert('UTC')
+    rule = interval.replace('d', 'D')
+    aggregation = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}
+    aggregation.update({col: 'sum' for col in SUMMED_COLUMNS})
+    bars = utc.resample(rule).agg(aggregation)
+    n_candles = utc['close'].resample(rule).count()
+    return bars.loc[:, DATA_COLUMNS], n_candles
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='incremental higher timeframe bars vs full pandas resample')
+    parser.add_argument('--rows', type=int, default=24 * 400)
+    parser.add_argument('--intervals', nargs='+', default=['4h', '1d'])
+    parser.add_argument('--gaps', type=int, default=20, help='hourly candles dropped at random')
+    parser.add_argument('--start', default='2019-01-01 05:00', help='first candle, deliberately not bar aligned')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    df = make_candles(args.rows, start=args.start)
+    dropped = np.random.default_rng(1).choice(np.arange(1, args.rows - 1), args.gaps, replace=False)
+    df = df.drop(df.index[dropped])
+    
+    aggregator = MultiTimeframeAggregator(args.intervals, capacity=args.rows)
+    t0 = time.perf_counter()
+    features = aggregator.seed(df)
+    t_seed = time.perf_counter() - t0
+    
+    for tf in aggregator.aggregators:
+        expected, n_candles = resample_bars(df, tf.interval)
+        expected = expected[n_candles > 0]
+        n_candles = n_candles[n_candles > 0]
+        # the last bar is still running unless its final candle has closed
+        running = tf.bar is not None
+        complete = expected.iloc[:-1] if running else expected
+        bars = tf.to_dataframe()
+        assert bars.shape[0] == complete.shape[0], tf.interval
+        np.testing.assert_array_equal(datetime_index_to_open_times(bars.index), datetime_index_to_open_times(complete.index))
+        np.testing.assert_allclose(bars.loc[:, DATA_COLUMNS].to_numpy(), complete.to_numpy(), rtol=1e-12, err_msg=tf.interval)
+        np.testing.assert_array_equal(bars['n_candles'].to_numpy(), n_candles.iloc[:bars.shape[0]].to_numpy())
+        if running:
+            partial = tf.to_dataframe(include_partial=True).iloc[-1]
+            assert partial['partial']
+            np.testing.assert_allclose(partial.loc[DATA_COLUMNS].to_numpy(dtype=np.float64), expected.iloc[-1].to_numpy(), rtol=1e-12)
+        
+        # indicators of a row are those of the last bar completed at its close, no lookahead
+        reference = TechnicalsV04Stream().seed(complete)
+        bar_close_times = complete.index + pd.Timedelta(tf.period, unit='ms')
+        row_close_times = df.index + pd.Timedelta(tf.base_period, unit='ms')
+        last_bar = np.searchsorted(bar_close_times, row_close_times, side='right') - 1
+        has_bar = last_bar >= 0
+        for col in TIMEFRAME_TECHNICALS_COLUMNS:
+            np.testing.assert_allclose(
+                features['{:s}_{:s}'.format(tf.interval, col)].to_numpy()[has_bar],
+                reference[col].to_numpy()[last_bar[has_bar]],
+                rtol = 1e-12,
+                equal_nan = True,
+                err_msg = col
+            )
+        print('{:4s} parity with pandas resample: ok ({:d} bars, {:d} incomplete)'.format(
+            tf.interval,
+            bars.shape[0],
+            tf.n_incomplete
+        ))
+    
+    # live: one closed candle after restarting from the seeded state
+    tick = df.iloc[-1].to_dict()
+    open_time = int(datetime_index_to_open_times(df.index[-1:])[0])
+    update_times = list()
+    for i in range(1, 1000):
+        t0 = time.perf_counter()
+        aggregator.update(open_time + i * 3600 * 1000, tick)
+        update_times.append(time.perf_counter() - t0)
+    resample_times = list()
+    window = df.iloc[-1024:]
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        for interval in args.intervals:
+            bars, _ = resample_bars(window, interval)
+            TechnicalsV04Stream().seed(bars)
+        resample_times.append(time.perf_counter() - t0)
+    
+    print('seed {:d} rows:                         {:8.1f} ms'.format(df.shape[0], 1e3 * t_seed))
+    print('per closed candle, incremental update:  {:8.3f} ms'.format(1e3 * np.median(update_times)))
+    print('per closed candle, resample + technicals:{:7.3f} ms (1024 rows)'.format(1e3 * np.median(resample_times)))
+
+if __name__ == '__main__':
+    main()
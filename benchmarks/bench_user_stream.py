@@ -0,0 +1,190 @@
+"""
+replays one trading scenario (partially filled buy, OCO sell filled in two parts,
+buy, stop-loss filled while the user socket is silently dead) against a fake
+spot account, once with the orders polled over REST like process_message does and
+once with the user data stream, and compares the resulting TradeStateMachine state,
+the REST calls spent and the kline ticks until each fill was seen
+"""
+import os
+import json
+import shutil
+import atexit
+import argparse
+import tempfile
+import numpy as np
+from fake_user_stream import FakeSpotAccount
+from bench_closing_tick import prepare_working_dir
+
+STATE_FIELDS = [
+    'asset_balance',
+    'quote_asset_balance',
+    'position_open',
+    'position_full',
+    'stoploss_is_oco'
+] + [
+    order + field
+    for order in ('buy', 'sell', 'stoploss')
+    for field in (
+        '_order_active',
+        '_order_id',
+        '_order_status',
+        '_order_original_qty',
+        '_order_executed_qty',
+        '_order_cum_quote_qty'
+    )
+]
+
+def run(streaming:bool, args:argparse.Namespace) -> dict:
+    from binance_interface import TradeStateMachine
+    from user_stream import UserDataStream
+    from bot_utils import BUY_TYPE, SELL_TYPE, STOPLOSS_TYPE, OCO_SELL_TYPE, rounddown
+    
+    account = FakeSpotAccount()
+    sm = TradeStateMachine(
+        state_path = os.path.abspath('data/state_{:s}.json'.format('stream' if streaming else 'poll')),
+        client = account,
+        mode = 'v04'
+    )
+    sm.update_asset_balance()
+    sm.update_quote_asset_balance()
+    stream = None
+    if streaming:
+        stream = UserDataStream(
+            account.socket_manager,
+            account,
+            keepalive_seconds = 3600.,
+            call_from_thread = lambda f: f()
+        )
+        assert stream.start()
+    account.calls.clear()
+    
+    def place(order_type:str, price:float) -> None:
+        if order_type == BUY_TYPE:
+            sm.update_quote_asset_balance()
+            quantity = rounddown(float(sm.quote_asset_balance['free']), sm.price_dec_places) / price
+        else:
+            sm.update_asset_balance()
+            quantity = float(sm.asset_balance['free'])
+        assert sm.place_and_process_order(order_type, quantity, price)
+    
+    def fill(order_type:str, fraction:float) -> None:
+        order = account.orders[sm.get_order_id(order_type)]
+        quantity = float(order['origQty']) * fraction
+        account.fill(order['orderId'], quantity)
+        pending.append((order_type, order['orderId'], float(order['executedQty']), tick))
+    
+    def buy_price() -> None:
+        place(BUY_TYPE, 10000.)
+    
+    def oco_sell() -> None:
+        sm.stoploss_level = 9500.
+        place(OCO_SELL_TYPE, 10500.)
+    
+    def stoploss() -> None:
+        sm.stoploss_level = 9600.
+        place(STOPLOSS_TYPE, sm.stoploss_level)
+    
+    below_stoploss = [False]
+    def stoploss_hit() -> None:
+        below_stoploss[0] = True
+        fill(STOPLOSS_TYPE, 1.)
+    
+    scenario = {
+        0: buy_price,
+        7: lambda: fill(BUY_TYPE, 0.4),
+        33: lambda: fill(BUY_TYPE, 0.6),
+        60: oco_sell,
+        85: lambda: fill(SELL_TYPE, 0.2),
+        101: lambda: fill(SELL_TYPE, 0.8),
+        140: buy_price,
+        150: lambda: fill(BUY_TYPE, 1.),
+        160: stoploss,
+        170: account.socket_manager.drop if streaming else lambda: None,
+        183: stoploss_hit,
+        200: account.socket_manager.give_up if streaming else lambda: None
+    }
+    pending = list()
+    delays = list()
+    for tick in range(args.ticks + 1):
+        if tick in scenario:
+            scenario[tick]()
+        if streaming:
+            account.socket_manager.pump()
+        if not sm.user_stream_live:
+            # the polling of process_message
+            if sm.stoploss_order_active and below_stoploss[0]:
+                sm.reconcile_and_process_orders(update_balances=True)
+            if tick % args.ticks_between_updates == 0 and (sm.buy_order_active or sm.sell_order_active):
+                sm.reconcile_and_process_orders(update_balances=True)
+        for item in list(pending):
+            order_type, order_id, executed, fill_tick = item
+            if sm.get_order_id(order_type) == order_id and sm.get_executed_quantity(order_type) >= executed - 1e-12:
+                delays.append(tick - fill_tick)
+                pending.remove(item)
+        if sm.unsaved_changes: sm.save_state()
+    
+    result = {
+        'state': {field: getattr(sm, field) for field in STATE_FIELDS},
+        'calls': dict(account.calls),
+        'weight': account.weight,
+        'delays': delays,
+        'unseen_fills': len(pending)
+    }
+    if stream is not None:
+        # keepalive of the listen key, a failing one falls back to polling and restarts
+        stream.keepalive()
+        assert account.calls['stream_keepalive'] == 1
+        account.keepalive_error = ConnectionError('keepalive failed')
+        stream.keepalive()
+        account.keepalive_error = None
+        assert sm.user_stream_live and stream.n_restarts == 2
+        result.update(events=stream.n_events, lost_events=account.socket_manager.n_lost, restarts=stream.n_restarts)
+        stream.stop()
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='user data stream vs REST polling of the orders')
+    parser.add_argument('--ticks', type=int, default=220, help='kline messages, one every 2 s')
+    parser.add_argument('--ticks-between-updates', type=int, default=20)
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='bench_user_stream_')
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    prepare_working_dir(work_dir, 'v04')
+    # config reads ./data/credentials.json on import, the default client must not touch the network
+    import binance.client
+    
+    class FakeClient(FakeSpotAccount):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__()
+    
+    binance.client.Client = FakeClient
+    import telegram_interface as tg
+    tg.send = lambda *args, **kwargs: None
+    
+    results = {'polling': run(False, args), 'stream': run(True, args)}
+    for name, result in results.items():
+        print('{:8s} REST calls {:s}, weight {:d}; fill seen after {:.1f} ticks on average, {:d} at most{:s}'.format(
+            name,
+            json.dumps(result['calls'], sort_keys=True),
+            result['weight'],
+            np.mean(result['delays']),
+            max(result['delays']),
+            ', {:d} unseen'.format(result['unseen_fills']) if result['unseen_fills'] else ''
+        ))
+    print('stream: {:d} events, {:d} lost while the socket was dead, {:d} restarts'.format(
+        results['stream']['events'],
+        results['stream']['lost_events'],
+        results['stream']['restarts']
+    ))
+    
+    poll_state = results['polling']['state']
+    stream_state = results['stream']['state']
+    mismatches = [field for field in STATE_FIELDS if poll_state[field] != stream_state[field]]
+    for field in mismatches:
+        print('mismatch {:s}: polling {:s}, stream {:s}'.format(field, str(poll_state[field]), str(stream_state[field])))
+    assert not mismatches
+    print('final state parity with polling: ok ({:d} fields)'.format(len(STATE_FIELDS)))
+
+if __name__ == '__main__':
+    main()
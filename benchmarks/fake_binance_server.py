@@ -0,0 +1,264 @@
+import json
+import math
+import time
+import threading
+import itertools
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+HOUR_MS = 3600 * 1000
+# request weight and order count of the endpoints below /api/v3/, klines are weighted by limit
+ENDPOINT_WEIGHTS = {
+    ('GET', 'ping'): 1,
+    ('GET', 'time'): 1,
+    ('GET', 'account'): 10,
+    ('GET', 'order'): 2,
+    ('GET', 'openOrders'): 3,
+    ('POST', 'order'): 1,
+    ('POST', 'order/oco'): 1,
+    ('DELETE', 'order'): 1
+}
+ENDPOINT_ORDERS = {('POST', 'order'): 1, ('POST', 'order/oco'): 2}
+
+def fake_kline(open_time:int, interval_ms:int=HOUR_MS) -> list:
+    # deterministic in the open time, formatted like the REST API
+    k = open_time // interval_ms
+    open_ = 10000. * (1. + 0.2 * math.sin(k / 97.)) + (k % 13)
+    close = 10000. * (1. + 0.2 * math.sin((k + 1) / 97.)) + ((k + 1) % 13)
+    high = max(open_, close) + 5. + k % 7
+    low = min(open_, close) - 5. - k % 5
+    volume = 1000. + (k * 7919) % 1500
+    return [
+        open_time,
+        '{:.2f}'.format(open_),
+        '{:.2f}'.format(high),
+        '{:.2f}'.format(low),
+        '{:.2f}'.format(close),
+        '{:.6f}'.format(volume),
+        open_time + interval_ms - 1,
+        '{:.6f}'.format(volume * close),
+        int(volume * 10),
+        '{:.6f}'.format(volume / 2),
+        '{:.6f}'.format(volume / 2 * close),
+        '0'
+    ]
+
+class FakeBinanceServer:
+    """
+    local stand-in for the REST endpoints used by the downloader and the bot: serves
+    deterministic 1h klines from first_open_time up to now_ms and placeholder
+    account and order responses with a fixed latency per request, and tracks
+    request weight and order count like the exchange (429 with Retry-After over a
+    limit, with ban_seconds a request during the Retry-After gets a 418 and an
+    IP ban that long); connections are kept alive and counted, each new one costs
+    connect_latency (the TCP and TLS handshakes) and every fail_every-th request
+    gets a 503
+    """
+    def __init__(
+        self,
+        first_open_time: int = 1500000000000 // HOUR_MS * HOUR_MS,
+        now_ms: int = 1600000000000,
+        latency: float = 0.05,
+        weight_limit: int = 1200,
+        weight_window: float = 60.,
+        order_limit: int = 50,
+        order_window: float = 10.,
+        retry_after: int = 1,
+        ban_seconds: int = 0,
+        fail_every: int = 0,
+        connect_latency: float = 0.,
+        host: str = '127.0.0.1'
+    ) -> None:
+        self.first_open_time = first_open_time
+        self.now_ms = now_ms
+        self.latency = latency
+        self.weight_limit = weight_limit
+        self.weight_window = weight_window
+        self.order_limit = order_limit
+        self.order_window = order_window
+        self.retry_after = retry_after
+        self.ban_seconds = ban_seconds
+        self.fail_every = fail_every
+        self.connect_latency = connect_latency
+        self.requests = list()
+        self.n_connections = 0
+        self.statuses = Counter()
+        self.max_concurrency = 0
+        self.__concurrency = 0
+        self.__weights = deque()
+        self.__orders = deque()
+        self.__limited_until = 0.
+        self.__order_ids = itertools.count(1000)
+        self.__lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, 0), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.base_url = 'http://{:s}:{:d}'.format(host, self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    def start(self) -> 'FakeBinanceServer':
+        self.thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self) -> 'FakeBinanceServer':
+        return self.start()
+    
+    def __exit__(self, *args) -> None:
+        self.stop()
+    
+    def expected_klines(self, start_ms:int, end_ms:int) -> list:
+        first = max(-(-start_ms // HOUR_MS) * HOUR_MS, self.first_open_time)
+        last = min(end_ms, self.now_ms - HOUR_MS)
+        return [fake_kline(t) for t in range(first, last + 1, HOUR_MS)]
+    
+    def enter_request(self, path:str, params:dict) -> bool:
+        # False for the requests to fail
+        with self.__lock:
+            self.requests.append((path, params))
+            self.__concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self.__concurrency)
+            return not (self.fail_every and len(self.requests) % self.fail_every == 0)
+    
+    def connected(self) -> None:
+        with self.__lock:
+            self.n_connections += 1
+    
+    def leave_request(self) -> None:
+        with self.__lock:
+            self.__concurrency -= 1
+    
+    def count_status(self, status:int) -> None:
+        with self.__lock:
+            self.statuses[status] += 1
+    
+    def spend(self, window:deque, seconds:float, now:float, amount:int) -> int:
+        while window and window[0][0] <= now - seconds:
+            window.popleft()
+        window.append((now, amount))
+        return sum(n for _, n in window)
+    
+    def admit(self, method:str, endpoint:str, params:dict) -> tuple:
+        # (status, headers) of the rate limits for a request, status None if it passes
+        if endpoint == 'klines':
+            limit = int(params.get('limit', 500))
+            weight = 1 if limit < 100 else 2 if limit < 500 else 5
+        else:
+            weight = ENDPOINT_WEIGHTS.get((method, endpoint), 1)
+        orders = ENDPOINT_ORDERS.get((method, endpoint), 0)
+        with self.__lock:
+            now = time.monotonic()
+            if self.ban_seconds and now < self.__limited_until:
+                self.__limited_until = now + self.ban_seconds
+                return 418, {'Retry-After': str(self.ban_seconds)}
+            used = self.spend(self.__weights, self.weight_window, now, weight)
+            headers = {'X-MBX-USED-WEIGHT-1M': str(used)}
+            if used > self.weight_limit:
+                self.__limited_until = now + self.retry_after
+                headers['Retry-After'] = str(self.retry_after)
+                return 429, headers
+            if orders:
+                n_orders = self.spend(self.__orders, self.order_window, now, orders)
+                headers['X-MBX-ORDER-COUNT-10S'] = str(n_orders)
+                if n_orders > self.order_limit:
+                    self.__limited_until = now + self.retry_after
+                    headers['Retry-After'] = str(self.retry_after)
+                    return 429, headers
+        return None, headers
+    
+    def response_body(self, method:str, endpoint:str, params:dict):
+        # None for unknown endpoints
+        if method == 'GET' and endpoint == 'klines':
+            return self.klines(params)
+        elif method == 'GET' and endpoint == 'ping':
+            return {}
+        elif method == 'GET' and endpoint == 'time':
+            return {'serverTime': int(time.time() * 1000)}
+        elif method == 'GET' and endpoint == 'account':
+            return {'balances': [{'asset': asset, 'free': '1.00000000', 'locked': '0.00000000'} for asset in ('BTC', 'USDT')]}
+        elif method == 'GET' and endpoint == 'openOrders':
+            return []
+        elif endpoint == 'order' and method in ('GET', 'DELETE'):
+            return {'orderId': int(params.get('orderId', 0)), 'status': 'NEW' if method == 'GET' else 'CANCELED'}
+        elif method == 'POST' and endpoint == 'order':
+            return {'orderId': next(self.__order_ids), 'status': 'NEW'}
+        elif method == 'POST' and endpoint == 'order/oco':
+            return {'orderListId': next(self.__order_ids), 'orderReports': []}
+        return None
+    
+    def klines(self, params:dict) -> list:
+        limit = min(int(params.get('limit', 500)), 1000)
+        start = int(params.get('startTime', 0))
+        end = int(params.get('endTime', self.now_ms))
+        first = max(-(-start // HOUR_MS) * HOUR_MS, self.first_open_time)
+        last = min(end, self.now_ms - HOUR_MS, first + (limit - 1) * HOUR_MS)
+        return [fake_kline(t) for t in range(first, last + 1, HOUR_MS)]
+    
+    def handler_class(self) -> type:
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # headers and body are separate writes
+            
+            def setup(self) -> None:
+                super().setup()
+                server.connected()
+                time.sleep(server.connect_latency)
+            
+            def log_message(self, *args) -> None:
+                pass
+            
+            def send_json(self, status:int, body, headers:dict=dict()) -> None:
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def handle_request(self, method:str) -> None:
+                # the parameters of signed POST and DELETE requests are in the body
+                url = urlparse(self.path)
+                query = url.query
+                length = int(self.headers.get('Content-Length', 0))
+                if length:
+                    query += '&' + self.rfile.read(length).decode('utf-8')
+                params = {k: v[-1] for k, v in parse_qs(query).items()}
+                endpoint = url.path.split('/', 3)[-1]
+                ok = server.enter_request(url.path, params)
+                time.sleep(server.latency)
+                server.leave_request()
+                body = server.response_body(method, endpoint, params)
+                if not ok:
+                    status, headers = 503, dict()
+                    body = {'code': -1001, 'msg': 'Internal error; unable to process your request.'}
+                elif body is None:
+                    status, headers = 404, dict()
+                    body = {'code': -1, 'msg': 'Unknown endpoint'}
+                else:
+                    status, headers = server.admit(method, endpoint, params)
+                    if status == 418:
+                        body = {'code': -1003, 'msg': 'Way too many requests; IP banned.'}
+                    elif status == 429:
+                        body = {'code': -1003, 'msg': 'Too many requests'}
+                    else:
+                        status = 200
+                server.count_status(status)
+                self.send_json(status, body, headers)
+            
+            def do_GET(self) -> None:
+                self.handle_request('GET')
+            
+            def do_POST(self) -> None:
+                self.handle_request('POST')
+            
+            def do_DELETE(self) -> None:
+                self.handle_request('DELETE')
+        
+        return Handler
@@ -0,0 +1,263 @@
+import time
+import itertools
+from collections import Counter, deque
+
+SL_TYPE = 'STOP_LOSS_LIMIT'
+FINAL = ('FILLED', 'CANCELED', 'REJECTED', 'EXPIRED')
+# request weight of the REST calls, as listed by the exchange
+REQUEST_WEIGHTS = {
+    'order': 1,
+    'oco_order': 1,
+    'cancel_order': 1,
+    'get_order': 2,
+    'get_open_orders': 3,
+    'get_asset_balance': 10,
+    'stream_get_listen_key': 1,
+    'stream_keepalive': 1
+}
+
+def _qty(x:float) -> str:
+    return '{:.8f}'.format(x)
+
+class FakeSpotAccount:
+    """
+    local stand-in for the signed spot endpoints used by TradeStateMachine and the
+    user data stream: limit, stop-loss and OCO sell orders of one symbol with
+    balances locked and released like on the exchange, fills triggered explicitly
+    by fill(); every change is published to the FakeUserSocketManager as the
+    executionReport and outboundAccountPosition events the exchange would send
+    """
+    def __init__(self, asset:str='BTC', quote_asset:str='USDT', quote_balance:float=1000.) -> None:
+        self.asset = asset
+        self.quote_asset = quote_asset
+        self.symbol = asset + quote_asset
+        self.balances = {asset: [0., 0.], quote_asset: [quote_balance, 0.]}  # free, locked
+        self.orders = dict()
+        self.order_lists = dict()
+        self.calls = Counter()
+        self.socket_manager = FakeUserSocketManager(self)
+        self.keepalive_error = None
+        self.__order_ids = itertools.count(1000)
+        self.__list_ids = itertools.count(1)
+    
+    @property
+    def weight(self) -> int:
+        return sum(REQUEST_WEIGHTS[name] * n for name, n in self.calls.items())
+    
+    def lock(self, asset:str, amount:float) -> None:
+        self.balances[asset][0] -= amount
+        self.balances[asset][1] += amount
+    
+    def new_order(self, side:str, order_type:str, quantity, price, stop_price=None, list_id:int=-1) -> dict:
+        order = {
+            'symbol': self.symbol,
+            'orderId': next(self.__order_ids),
+            'orderListId': list_id,
+            'price': _qty(float(price)),
+            'origQty': _qty(float(quantity)),
+            'executedQty': _qty(0.),
+            'cummulativeQuoteQty': _qty(0.),
+            'status': 'NEW',
+            'type': order_type,
+            'side': side,
+            'stopPrice': _qty(float(stop_price or 0.))
+        }
+        self.orders[order['orderId']] = order
+        self.publish_order(order, 'NEW', 0., 0.)
+        return order
+    
+    def order_limit_buy(self, quantity, price, symbol, **params) -> dict:
+        self.calls['order'] += 1
+        self.lock(self.quote_asset, float(quantity) * float(price))
+        order = self.new_order('BUY', 'LIMIT', quantity, price)
+        self.publish_balances()
+        return dict(order)
+    
+    def order_limit_sell(self, quantity, price, symbol, **params) -> dict:
+        self.calls['order'] += 1
+        self.lock(self.asset, float(quantity))
+        order = self.new_order('SELL', 'LIMIT', quantity, price)
+        self.publish_balances()
+        return dict(order)
+    
+    def create_order(self, side, type, quantity, price, symbol, stopPrice=None, **params) -> dict:
+        self.calls['order'] += 1
+        self.lock(self.asset, float(quantity))
+        order = self.new_order(side, type, quantity, price, stopPrice)
+        self.publish_balances()
+        return {'symbol': symbol, 'orderId': order['orderId'], 'orderListId': -1}
+    
+    def create_oco_order(self, side, quantity, price, stopPrice, stopLimitPrice, symbol, **params) -> dict:
+        # the quantity is locked once for both legs
+        self.calls['oco_order'] += 1
+        self.lock(self.asset, float(quantity))
+        list_id = next(self.__list_ids)
+        stoploss = self.new_order(side, SL_TYPE, quantity, stopLimitPrice, stopPrice, list_id)
+        limit = self.new_order(side, 'LIMIT_MAKER', quantity, price, None, list_id)
+        self.order_lists[list_id] = [stoploss['orderId'], limit['orderId']]
+        self.publish_balances()
+        return {'orderListId': list_id, 'orderReports': [dict(stoploss), dict(limit)]}
+    
+    def get_order(self, orderId, symbol, **params) -> dict:
+        self.calls['get_order'] += 1
+        return dict(self.orders[orderId])
+    
+    def get_open_orders(self, symbol, **params) -> list:
+        self.calls['get_open_orders'] += 1
+        return [dict(order) for order in self.orders.values() if order['status'] not in FINAL]
+    
+    def get_asset_balance(self, asset, **params) -> dict:
+        self.calls['get_asset_balance'] += 1
+        free, locked = self.balances[asset]
+        return {'asset': asset, 'free': _qty(free), 'locked': _qty(locked)}
+    
+    def stream_get_listen_key(self) -> str:
+        self.calls['stream_get_listen_key'] += 1
+        return 'fakelistenkey{:d}'.format(self.socket_manager.n_started)
+    
+    def stream_keepalive(self, listenKey) -> dict:
+        self.calls['stream_keepalive'] += 1
+        if self.keepalive_error is not None:
+            raise self.keepalive_error
+        if listenKey != self.socket_manager.listen_key:
+            raise ValueError('Unknown listen key')
+        return {}
+    
+    def release(self, order:dict) -> None:
+        remaining = float(order['origQty']) - float(order['executedQty'])
+        if order['side'] == 'BUY':
+            self.lock(self.quote_asset, -remaining * float(order['price']))
+        else:
+            self.lock(self.asset, -remaining)
+    
+    def end_order(self, order:dict, status:str) -> None:
+        self.release(order)
+        order['status'] = status
+        self.publish_order(order, status, 0., 0.)
+    
+    def cancel_order(self, orderId, symbol, **params) -> dict:
+        self.calls['cancel_order'] += 1
+        order = self.orders[orderId]
+        if order['status'] in FINAL:
+            raise ValueError('Unknown order sent.')
+        if order['orderListId'] == -1:
+            self.end_order(order, 'CANCELED')
+            self.publish_balances()
+            return dict(order)
+        legs = [self.orders[i] for i in self.order_lists[order['orderListId']]]
+        self.end_order(legs[0], 'CANCELED')
+        legs[1]['status'] = 'CANCELED'  # the quantity was only locked once
+        self.publish_order(legs[1], 'CANCELED', 0., 0.)
+        self.publish_balances()
+        return {'orderListId': order['orderListId'], 'orderReports': [dict(leg) for leg in legs]}
+    
+    def fill(self, order_id:int, quantity:float) -> None:
+        # a trade of quantity at the order price, the other leg of an OCO expires
+        order = self.orders[order_id]
+        price = float(order['price'])
+        executed = float(order['executedQty']) + quantity
+        if executed > float(order['origQty']) + 1e-12:
+            raise ValueError('Fill exceeds the order quantity')
+        order['executedQty'] = _qty(executed)
+        order['cummulativeQuoteQty'] = _qty(float(order['cummulativeQuoteQty']) + quantity * price)
+        order['status'] = 'FILLED' if abs(executed - float(order['origQty'])) < 1e-12 else 'PARTIALLY_FILLED'
+        if order['side'] == 'BUY':
+            self.balances[self.quote_asset][1] -= quantity * price
+            self.balances[self.asset][0] += quantity
+        else:
+            self.balances[self.asset][1] -= quantity
+            self.balances[self.quote_asset][0] += quantity * price
+        self.publish_order(order, 'TRADE', quantity, price)
+        if order['orderListId'] != -1:
+            for other_id in self.order_lists[order['orderListId']]:
+                other = self.orders[other_id]
+                if other_id != order_id and other['status'] not in FINAL:
+                    other['status'] = 'EXPIRED'
+                    self.publish_order(other, 'EXPIRED', 0., 0.)
+        self.publish_balances()
+    
+    def publish_order(self, order:dict, execution_type:str, last_qty:float, last_price:float) -> None:
+        now = int(time.time() * 1000)
+        self.socket_manager.publish({
+            'e': 'executionReport',
+            'E': now,
+            's': order['symbol'],
+            'c': 'fake{:d}'.format(order['orderId']),
+            'S': order['side'],
+            'o': order['type'],
+            'f': 'GTC',
+            'q': order['origQty'],
+            'p': order['price'],
+            'P': order['stopPrice'],
+            'g': order['orderListId'],
+            'x': execution_type,
+            'X': order['status'],
+            'r': 'NONE',
+            'i': order['orderId'],
+            'l': _qty(last_qty),
+            'z': order['executedQty'],
+            'L': _qty(last_price),
+            'n': '0',
+            'N': None,
+            'T': now,
+            'Z': order['cummulativeQuoteQty']
+        })
+    
+    def publish_balances(self) -> None:
+        self.socket_manager.publish({
+            'e': 'outboundAccountPosition',
+            'E': int(time.time() * 1000),
+            'u': int(time.time() * 1000),
+            'B': [
+                {'a': asset, 'f': _qty(free), 'l': _qty(locked)}
+                for asset, (free, locked) in self.balances.items()
+            ]
+        })
+
+class FakeUserSocketManager:
+    """
+    user socket part of BinanceSocketManager: events are queued like messages
+    waiting for the reactor and handed to the callback by pump(); while dropped,
+    events are lost until the socket is restarted
+    """
+    def __init__(self, account:FakeSpotAccount) -> None:
+        self.account = account
+        self.callback = None
+        self.listen_key = None
+        self.connected = False
+        self.n_started = 0
+        self.n_lost = 0
+        self.queue = deque()
+    
+    def start_user_socket(self, callback) -> str:
+        self.listen_key = self.account.stream_get_listen_key()
+        self.callback = callback
+        self.connected = True
+        self.n_started += 1
+        return self.listen_key
+    
+    def stop_socket(self, conn_key:str) -> None:
+        if conn_key == self.listen_key:
+            self.connected = False
+            self.listen_key = None
+    
+    def publish(self, event:dict) -> None:
+        if self.connected:
+            self.queue.append(event)
+        else:
+            self.n_lost += 1
+    
+    def pump(self) -> int:
+        n = 0
+        while self.queue:
+            self.callback(self.queue.popleft())
+            n += 1
+        return n
+    
+    def drop(self) -> None:
+        # connection lost without notice, reconnecting failed later on
+        self.connected = False
+        self.queue.clear()
+    
+    def give_up(self) -> None:
+        self.callback({'e': 'error', 'm': 'Max reconnect retries reached'})
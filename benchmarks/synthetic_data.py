@@ -0,0 +1,80 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TIMEZONE_OBJ, DATA_COLUMNS
+
+def make_candles(n_rows:int, seed:int=0, start:str='2019-01-01', open_gap:float=0.) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 10000. * np.exp(np.cumsum(rng.normal(0., 0.01, n_rows)))
+    open_ = np.empty(n_rows)
+    open_[0] = close[0]
+    open_[1:] = close[:-1]
+    if open_gap > 0.:
+        # separate generator so that the other columns don't depend on open_gap
+        open_[1:] *= 1. + np.random.default_rng([seed, 1]).normal(0., open_gap, n_rows - 1)
+    high = np.maximum(open_, close) * (1. + np.abs(rng.normal(0., 0.004, n_rows)))
+    low = np.minimum(open_, close) * (1. - np.abs(rng.normal(0., 0.004, n_rows)))
+    volume = np.abs(rng.normal(1800., 900., n_rows))
+    taker_buy_base_vol = volume * rng.uniform(0.3, 0.7, n_rows)
+    index = pd.date_range(start, periods=n_rows, freq='h', tz='UTC').tz_convert(TIMEZONE_OBJ)
+    df = pd.DataFrame(
+        {
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume,
+            'quote_asset_vol': volume * close,
+            'no_of_trades': np.round(volume * 10.),
+            'taker_buy_base_vol': taker_buy_base_vol,
+            'taker_buy_quote_vol': taker_buy_base_vol * close
+        },
+        index = index
+    )
+    return df.loc[:, DATA_COLUMNS]
+
+def make_kline_messages(
+    df: pd.DataFrame,
+    symbol: str = 'BTCUSDT',
+    interval: str = '1h',
+    ticks_per_candle: int = 3
+) -> list:
+    """
+    websocket kline messages replaying the candles of df: ticks_per_candle - 1
+    intermediate updates of the running candle followed by its closing tick
+    """
+    open_times = (df.index.tz_convert('UTC') - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(1, unit='ms')
+    interval_ms = int(pd.Timedelta(interval).total_seconds() * 1000)
+    messages = list()
+    for open_time, row in zip(open_times, df.to_dict('records')):
+        for i in range(1, ticks_per_candle + 1):
+            fraction = i / ticks_per_candle
+            close = row['open'] + fraction * (row['close'] - row['open'])
+            closing = i == ticks_per_candle
+            messages.append({
+                'e': 'kline',
+                'E': int(open_time + fraction * interval_ms) - int(not closing),
+                's': symbol,
+                'k': {
+                    't': int(open_time),
+                    'T': int(open_time) + interval_ms - 1,
+                    's': symbol,
+                    'i': interval,
+                    'o': '{:.2f}'.format(row['open']),
+                    'c': '{:.2f}'.format(close),
+                    'h': '{:.2f}'.format(row['high'] if closing else max(row['open'], close)),
+                    'l': '{:.2f}'.format(row['low'] if closing else min(row['open'], close)),
+                    'v': '{:.6f}'.format(fraction * row['volume']),
+                    'n': int(fraction * row['no_of_trades']),
+                    'x': closing,
+                    'q': '{:.6f}'.format(fraction * row['quote_asset_vol']),
+                    'V': '{:.6f}'.format(fraction * row['taker_buy_base_vol']),
+                    'Q': '{:.6f}'.format(fraction * row['taker_buy_quote_vol']),
+                    'B': '0'
+                }
+            })
+    return messages
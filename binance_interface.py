@@ -1,9 +1,11 @@
+import os
 import re
 import json
 import datetime as dt
 import telegram_interface as tg  # import whole module to avoid circular reference breaking everything
 from typing import Union
 from binance.client import Client
+from http_session import PooledClient
 from binance.enums import (
     TIME_IN_FORCE_GTC,
     SIDE_SELL,
@@ -16,6 +18,8 @@ from binance.enums import (
     ORDER_STATUS_EXPIRED
 )
 from binance.exceptions import BinanceAPIException
+from state_journal import StateJournal, default_state
+from persistence import atomic_write
 from bot_utils import (
     BUY_TYPE,
     SELL_TYPE,
@@ -36,7 +40,6 @@ from config import (
     QUOTE_ASSET,
     QTY_DEC_PLACES,
     PRICE_DEC_PLACES,
-    SYMBOL,
     STATE_FILE_PATH,
     DATETIME_FORMAT_INTERNAL,
     SL_TIMEOUT_HOURS,
@@ -60,40 +63,93 @@ def _extract_api_error_code(e:Exception) -> Union[int, None]:
         error_code_match = re.search(r'code=(-?\d+)', str(e))
         if error_code_match: return int(error_code_match.group(1))
 
+state_machines = dict()  # symbol -> TradeStateMachine, filled on construction
+
+def quote_allocation(state_machine:'TradeStateMachine') -> float:
+    # free quote balance split evenly between the pairs on the same quote asset that may still buy,
+    # so buy signals of several pairs in one candle don't each size for the whole balance
+    n_buyers = 1 + sum(
+        1 for sm in state_machines.values()
+        if sm is not state_machine and
+        sm.quote_asset == state_machine.quote_asset and
+        sm.trading_enabled and
+        not sm.position_full and
+        not sm.buy_order_active
+    )
+    return float(state_machine.quote_asset_balance['free']) / n_buyers
+
 class TradeStateMachine:
-    def __init__(self) -> None:
-        self.client = Client(*BINANCE_KEY)
+    def __init__(
+        self,
+        asset: str = ASSET,
+        quote_asset: str = QUOTE_ASSET,
+        qty_dec_places: int = QTY_DEC_PLACES,
+        price_dec_places: int = PRICE_DEC_PLACES,
+        state_path: str = STATE_FILE_PATH,
+        client: Union[Client, None] = None,
+        mode: Union[str, None] = None
+    ) -> None:
+        # a pair without a state file starts from default_state(mode)
+        self.asset = asset
+        self.quote_asset = quote_asset
+        self.symbol = asset + quote_asset
+        self.qty_dec_places = qty_dec_places
+        self.price_dec_places = price_dec_places
+        self.client = client if client is not None else PooledClient(*BINANCE_KEY)
         self.last_price = 0.0
+        self.user_stream_live = False  # set by UserDataStream, fills and balances then arrive by websocket
         self.__unsaved_changes = False
+        self.journal = StateJournal(state_path, os.path.splitext(state_path)[0] + '.journal')
+        if not os.path.exists(state_path) and mode is not None:
+            atomic_write(state_path, json.dumps(default_state(mode), indent=2).encode('utf-8'))
         self.__state = self.load_state()
+        state_machines[self.symbol] = self
     
     def load_state(self) -> dict:
-        with open(STATE_FILE_PATH, 'r') as fh:
-            state = json.load(fh)
+        state = self.journal.load()
         sl_timeout_dt = dt.datetime.strptime(state['stoploss_hit_timeout'], DATETIME_FORMAT_INTERNAL)
         state['stoploss_hit_timeout'] = sl_timeout_dt
         return state
     
     def save_state(self) -> None:
+        # journals the changed fields, written to disk by the write-behind thread
         state = self.__state.copy()
         sl_timeout_txt = state['stoploss_hit_timeout'].strftime(DATETIME_FORMAT_INTERNAL)
         state['stoploss_hit_timeout'] = sl_timeout_txt
-        with open(STATE_FILE_PATH, 'w', newline='\n') as fh:
-            json.dump(state, fh, indent=2)
+        self.journal.commit(state)
         self.__unsaved_changes = False
     
-    def update_asset_balance(self) -> None:
-        self.asset_balance = self.client.get_asset_balance(ASSET)
-    
-    def update_quote_asset_balance(self) -> None:
-        self.quote_asset_balance = self.client.get_asset_balance(QUOTE_ASSET)
+    def update_asset_balance(self, force:bool=False) -> None:
+        if self.user_stream_live and not force:
+            return
+        self.asset_balance = self.client.get_asset_balance(self.asset)
+    
+    def update_quote_asset_balance(self, force:bool=False) -> None:
+        if self.user_stream_live and not force:
+            return
+        self.quote_asset_balance = self.client.get_asset_balance(self.quote_asset)
+    
+    def reserve_quote(self, amount:float) -> None:
+        # the quote locked by a new buy order leaves the free balance of every pair on the
+        # quote asset, until the next balance update from the exchange replaces the estimate
+        machines = [sm for sm in state_machines.values() if sm.quote_asset == self.quote_asset]
+        if self not in machines:
+            machines.append(self)
+        for sm in machines:
+            free = float(sm.quote_asset_balance['free'])
+            reserved = min(amount, free)
+            sm.quote_asset_balance = {
+                'asset': sm.quote_asset_balance['asset'],
+                'free': '{:.8f}'.format(free - reserved),
+                'locked': '{:.8f}'.format(float(sm.quote_asset_balance['locked']) + reserved)
+            }
     
     def set_order_timeout(self) -> None:
         self.order_timeout = tznow().timestamp() + ORDER_TIMEOUT_SECONDS
     
     def set_stoploss_hit_timeout(self, starting_time:dt.datetime) -> None:
         self.stoploss_hit_timeout = starting_time + dt.timedelta(hours=SL_TIMEOUT_HOURS)
-        tg.notify_stoploss_hit()
+        tg.notify_stoploss_hit(state_machine=self)
     
     def get_order_id(self, order_type:str) -> int:
         if order_type == BUY_TYPE:
@@ -148,9 +204,9 @@ class TradeStateMachine:
     def place_buy_order(self, quantity:float, price:float, alert:bool=True) -> Union[str, int, None]:
         try:
             order = self.client.order_limit_buy(
-                quantity = rounddown(quantity, QTY_DEC_PLACES),
-                price = '{:.{:d}f}'.format(price, PRICE_DEC_PLACES),
-                symbol = SYMBOL
+                quantity = rounddown(quantity, self.qty_dec_places),
+                price = '{:.{:d}f}'.format(price, self.price_dec_places),
+                symbol = self.symbol
             )
             self.buy_order_active = True
             self.buy_order_id = order['orderId']
@@ -159,20 +215,21 @@ class TradeStateMachine:
             self.buy_order_original_qty = order['origQty']
             self.buy_order_executed_qty = order['executedQty']
             self.buy_order_cum_quote_qty = order['cummulativeQuoteQty']
-            tg.notify_order_placed(BUY_TYPE, quantity, price, alert=alert)
+            self.reserve_quote(float(order['origQty']) * float(order['price']))
+            tg.notify_order_placed(BUY_TYPE, quantity, price, alert=alert, state_machine=self)
             return order['status']
         except Exception as e:
             tg_msg = 'Warning: exception during attempt to place a buy order\n' \
                 + '{:s}: {:s}'.format(type(e).__name__, str(e))
-            tg.notify(tg_msg)
+            tg.notify(tg_msg, state_machine=self)
             return _extract_api_error_code(e)
     
     def place_sell_order(self, quantity:float, price:float, alert:bool=True) -> Union[str, int, None]:
         try:
             order = self.client.order_limit_sell(
-                quantity = rounddown(quantity, QTY_DEC_PLACES),
-                price = '{:.{:d}f}'.format(price, PRICE_DEC_PLACES),
-                symbol = SYMBOL
+                quantity = rounddown(quantity, self.qty_dec_places),
+                price = '{:.{:d}f}'.format(price, self.price_dec_places),
+                symbol = self.symbol
             )
             self.stoploss_is_oco = False
             self.sell_order_active = True
@@ -182,7 +239,7 @@ class TradeStateMachine:
             self.sell_order_original_qty = order['origQty']
             self.sell_order_executed_qty = order['executedQty']
             self.sell_order_cum_quote_qty = order['cummulativeQuoteQty']
-            tg.notify_order_placed(SELL_TYPE, quantity, price, alert=alert)
+            tg.notify_order_placed(SELL_TYPE, quantity, price, alert=alert, state_machine=self)
             return order['status']
         except Exception as e:
             error_code = _extract_api_error_code(e)
@@ -192,7 +249,7 @@ class TradeStateMachine:
             ):
                 tg_msg = 'Warning: exception during attempt to place a sell order\n' \
                     + '{:s}: {:s}'.format(type(e).__name__, str(e))
-                tg.notify(tg_msg)
+                tg.notify(tg_msg, state_machine=self)
             return error_code
     
     def place_oco_sell_order(
@@ -205,12 +262,12 @@ class TradeStateMachine:
         try:
             order = self.client.create_oco_order(
                 side = SIDE_SELL,
-                quantity = rounddown(quantity, QTY_DEC_PLACES),
-                price = '{:.{:d}f}'.format(price, PRICE_DEC_PLACES),
-                stopPrice = '{:.{:d}f}'.format(sl_price, PRICE_DEC_PLACES),
-                stopLimitPrice = '{:.{:d}f}'.format(sl_price, PRICE_DEC_PLACES),
+                quantity = rounddown(quantity, self.qty_dec_places),
+                price = '{:.{:d}f}'.format(price, self.price_dec_places),
+                stopPrice = '{:.{:d}f}'.format(sl_price, self.price_dec_places),
+                stopLimitPrice = '{:.{:d}f}'.format(sl_price, self.price_dec_places),
                 stopLimitTimeInForce = TIME_IN_FORCE_GTC,
-                symbol = SYMBOL
+                symbol = self.symbol
             )
             sl = 0 if order['orderReports'][0]['type'] == ORDER_TYPE_STOP_LOSS_LIMIT else 1
             li = 1 - sl
@@ -229,7 +286,7 @@ class TradeStateMachine:
             self.stoploss_order_original_qty = order['orderReports'][sl]['origQty']
             self.stoploss_order_executed_qty = order['orderReports'][sl]['executedQty']
             self.stoploss_order_cum_quote_qty = order['orderReports'][sl]['cummulativeQuoteQty']
-            tg.notify_order_placed(OCO_SELL_TYPE, quantity, price, alert=alert)
+            tg.notify_order_placed(OCO_SELL_TYPE, quantity, price, alert=alert, state_machine=self)
             return order['orderReports'][li]['status']
         except Exception as e:
             error_code = _extract_api_error_code(e)
@@ -244,7 +301,7 @@ class TradeStateMachine:
             ):
                 tg_msg = 'Warning: exception during attempt to place an OCO sell order\n' \
                     + '{:s}: {:s}'.format(type(e).__name__, str(e))
-                tg.notify(tg_msg)
+                tg.notify(tg_msg, state_machine=self)
             return error_code
     
     def place_stoploss_order(self, quantity:float, price:float, alert:bool=True) -> Union[str, int, None]:
@@ -252,22 +309,22 @@ class TradeStateMachine:
             order = self.client.create_order(
                 side = SIDE_SELL,
                 type = ORDER_TYPE_STOP_LOSS_LIMIT,
-                quantity = rounddown(quantity, QTY_DEC_PLACES),
-                price = '{:.{:d}f}'.format(price, PRICE_DEC_PLACES),
-                stopPrice = '{:.{:d}f}'.format(price, PRICE_DEC_PLACES),
+                quantity = rounddown(quantity, self.qty_dec_places),
+                price = '{:.{:d}f}'.format(price, self.price_dec_places),
+                stopPrice = '{:.{:d}f}'.format(price, self.price_dec_places),
                 timeInForce = TIME_IN_FORCE_GTC,
-                symbol = SYMBOL
+                symbol = self.symbol
             )
             self.stoploss_is_oco = False
             self.stoploss_order_active = True
             self.stoploss_order_id = order['orderId']
             # values not present in server response, so they have to be faked initially
-            self.stoploss_order_price = '{:.8f}'.format(round(price, PRICE_DEC_PLACES))
+            self.stoploss_order_price = '{:.8f}'.format(round(price, self.price_dec_places))
             self.stoploss_order_status = ORDER_STATUS_NEW
-            self.stoploss_order_original_qty = '{:.8f}'.format(rounddown(quantity, QTY_DEC_PLACES))
+            self.stoploss_order_original_qty = '{:.8f}'.format(rounddown(quantity, self.qty_dec_places))
             self.stoploss_order_executed_qty = '{:.8f}'.format(0.0)
             self.stoploss_order_cum_quote_qty = '{:.8f}'.format(0.0)
-            tg.notify_order_placed(STOPLOSS_TYPE, quantity, price, alert=alert)
+            tg.notify_order_placed(STOPLOSS_TYPE, quantity, price, alert=alert, state_machine=self)
             return ORDER_STATUS_NEW
         except Exception as e:
             error_code = _extract_api_error_code(e)
@@ -277,24 +334,24 @@ class TradeStateMachine:
             ):
                 tg_msg = 'Warning: exception during attempt to place a stop-loss order\n' \
                     + '{:s}: {:s}'.format(type(e).__name__, str(e))
-                tg.notify(tg_msg)
+                tg.notify(tg_msg, state_machine=self)
             return error_code
     
     def cancel_buy_order(self, alert:bool=True) -> Union[str, int, None]:
         try:
-            order = self.client.cancel_order(orderId=self.buy_order_id, symbol=SYMBOL)
+            order = self.client.cancel_order(orderId=self.buy_order_id, symbol=self.symbol)
             self.buy_order_active = False
             self.buy_order_status = order['status']
             self.buy_order_original_qty = order['origQty']
             self.buy_order_executed_qty = order['executedQty']
-            tg.notify_order_cancelled(BUY_TYPE, alert=alert)
+            tg.notify_order_cancelled(BUY_TYPE, alert=alert, state_machine=self)
             return order['status']
         except Exception as e:
             tg_msg = 'Warning: exception during attempt to cancel buy order #{:s}\n'.format(
                     str(self.buy_order_id)
                 ) \
                 + '{:s}: {:s}'.format(type(e).__name__, str(e))
-            tg.notify(tg_msg)
+            tg.notify(tg_msg, state_machine=self)
             return _extract_api_error_code(e)
     
     def cancel_sell_order(self, alert:bool=True) -> Union[str, int, None]:
@@ -302,26 +359,26 @@ class TradeStateMachine:
             if self.stoploss_is_oco and self.stoploss_order_active:
                 return self.cancel_oco_sell_order(OCO_SELL_TYPE, alert=alert)
             else:
-                order = self.client.cancel_order(orderId=self.sell_order_id, symbol=SYMBOL)
+                order = self.client.cancel_order(orderId=self.sell_order_id, symbol=self.symbol)
                 self.sell_order_active = False
                 self.sell_order_status = order['status']
                 self.sell_order_original_qty = order['origQty']
                 self.sell_order_executed_qty = order['executedQty']
-                tg.notify_order_cancelled(SELL_TYPE, alert=alert)
+                tg.notify_order_cancelled(SELL_TYPE, alert=alert, state_machine=self)
                 return order['status']
         except Exception as e:
             tg_msg = 'Warning: exception during attempt to cancel sell order #{:s}\n'.format(
                     str(self.sell_order_id)
                 ) \
                 + '{:s}: {:s}'.format(type(e).__name__, str(e))
-            tg.notify(tg_msg)
+            tg.notify(tg_msg, state_machine=self)
             return _extract_api_error_code(e)
     
     def cancel_oco_sell_order(self, order_type:str, alert:bool=True) -> Union[str, int, None]:
         try:
             order = self.client.cancel_order(
                 orderId = self.get_order_id(order_type),
-                symbol = SYMBOL
+                symbol = self.symbol
             )
             sl = 0 if order['orderReports'][0]['type'] == ORDER_TYPE_STOP_LOSS_LIMIT else 1
             li = 1 - sl
@@ -333,7 +390,7 @@ class TradeStateMachine:
             self.stoploss_order_status = order['orderReports'][sl]['status']
             self.stoploss_order_original_qty = order['orderReports'][sl]['origQty']
             self.stoploss_order_executed_qty = order['orderReports'][sl]['executedQty']
-            tg.notify_order_cancelled(order_type, alert=alert)
+            tg.notify_order_cancelled(order_type, alert=alert, state_machine=self)
             if order_type == OCO_STOPLOSS_TYPE:
                 return_status = order['orderReports'][sl]['status']
             else:
@@ -345,7 +402,7 @@ class TradeStateMachine:
                     str(self.get_order_id(order_type))
                 ) \
                 + '{:s}: {:s}'.format(type(e).__name__, str(e))
-            tg.notify(tg_msg)
+            tg.notify(tg_msg, state_machine=self)
             return _extract_api_error_code(e)
     
     def cancel_stoploss_order(self, alert:bool=True) -> Union[str, int, None]:
@@ -353,19 +410,19 @@ class TradeStateMachine:
             if self.stoploss_is_oco and self.sell_order_active:
                 return self.cancel_oco_sell_order(OCO_STOPLOSS_TYPE, alert=alert)
             else:
-                order = self.client.cancel_order(orderId=self.stoploss_order_id, symbol=SYMBOL)
+                order = self.client.cancel_order(orderId=self.stoploss_order_id, symbol=self.symbol)
                 self.stoploss_order_active = False
                 self.stoploss_order_status = order['status']
                 self.stoploss_order_original_qty = order['origQty']
                 self.stoploss_order_executed_qty = order['executedQty']
-                tg.notify_order_cancelled(STOPLOSS_TYPE, alert=alert)
+                tg.notify_order_cancelled(STOPLOSS_TYPE, alert=alert, state_machine=self)
                 return order['status']
         except Exception as e:
             tg_msg = 'Warning: exception during attempt to cancel stop-loss order #{:s}\n'.format(
                     str(self.stoploss_order_id)
                 ) \
                 + '{:s}: {:s}'.format(type(e).__name__, str(e))
-            tg.notify(tg_msg)
+            tg.notify(tg_msg, state_machine=self)
             return _extract_api_error_code(e)
     
     def check_buy_order(self) -> Union[str, int, None]:
@@ -373,125 +430,134 @@ class TradeStateMachine:
         IMPLICIT: state['buy_order_active'] == True
         """
         try:
-            order = self.client.get_order(orderId=self.buy_order_id, symbol=SYMBOL)
-            self.buy_order_status = order['status']
-            self.buy_order_original_qty = order['origQty']
-            self.buy_order_executed_qty = order['executedQty']
-            self.buy_order_cum_quote_qty = order['cummulativeQuoteQty']
-            if (
-                order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
-                order['status'] == ORDER_STATUS_FILLED
-            ):
-                self.position_open = True
-                if order['status'] == ORDER_STATUS_FILLED:
-                    self.position_full = True
-            if (
-                order['status'] == ORDER_STATUS_FILLED or
-                order['status'] == ORDER_STATUS_CANCELED or
-                order['status'] == ORDER_STATUS_REJECTED or
-                order['status'] == ORDER_STATUS_EXPIRED
-            ):
-                self.buy_order_active = False
-            return order['status']
+            order = self.client.get_order(orderId=self.buy_order_id, symbol=self.symbol)
+            return self.apply_buy_order(order)
         except Exception as e:
             print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
             return _extract_api_error_code(e)
     
+    def apply_buy_order(self, order:dict) -> str:
+        self.buy_order_status = order['status']
+        self.buy_order_original_qty = order['origQty']
+        self.buy_order_executed_qty = order['executedQty']
+        self.buy_order_cum_quote_qty = order['cummulativeQuoteQty']
+        if (
+            order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
+            order['status'] == ORDER_STATUS_FILLED
+        ):
+            self.position_open = True
+            if order['status'] == ORDER_STATUS_FILLED:
+                self.position_full = True
+        if (
+            order['status'] == ORDER_STATUS_FILLED or
+            order['status'] == ORDER_STATUS_CANCELED or
+            order['status'] == ORDER_STATUS_REJECTED or
+            order['status'] == ORDER_STATUS_EXPIRED
+        ):
+            self.buy_order_active = False
+        return order['status']
+    
     def check_sell_order(self) -> Union[str, int, None]:
         """
         IMPLICIT: state['sell_order_active'] == True
         """
         try:
-            order = self.client.get_order(orderId=self.sell_order_id, symbol=SYMBOL)
-            self.sell_order_status = order['status']
-            self.sell_order_original_qty = order['origQty']
-            self.sell_order_executed_qty = order['executedQty']
-            self.sell_order_cum_quote_qty = order['cummulativeQuoteQty']
+            order = self.client.get_order(orderId=self.sell_order_id, symbol=self.symbol)
+            return self.apply_sell_order(order)
+        except Exception as e:
+            print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+            return _extract_api_error_code(e)
+    
+    def apply_sell_order(self, order:dict) -> str:
+        self.sell_order_status = order['status']
+        self.sell_order_original_qty = order['origQty']
+        self.sell_order_executed_qty = order['executedQty']
+        self.sell_order_cum_quote_qty = order['cummulativeQuoteQty']
+        if (
+            order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
+            order['status'] == ORDER_STATUS_FILLED
+        ):
+            self.position_full = False
+            if order['status'] == ORDER_STATUS_FILLED:
+                self.position_open = False
+        if (
+            order['status'] == ORDER_STATUS_FILLED or
+            order['status'] == ORDER_STATUS_CANCELED or
+            order['status'] == ORDER_STATUS_REJECTED or
+            order['status'] == ORDER_STATUS_EXPIRED
+        ):
+            self.sell_order_active = False
+        if self.stoploss_is_oco:
             if (
                 order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
-                order['status'] == ORDER_STATUS_FILLED
-            ):
-                self.position_full = False
-                if order['status'] == ORDER_STATUS_FILLED:
-                    self.position_open = False
-            if (
                 order['status'] == ORDER_STATUS_FILLED or
-                order['status'] == ORDER_STATUS_CANCELED or
                 order['status'] == ORDER_STATUS_REJECTED or
                 order['status'] == ORDER_STATUS_EXPIRED
             ):
-                self.sell_order_active = False
-            if self.stoploss_is_oco:
-                if (
-                    order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
-                    order['status'] == ORDER_STATUS_FILLED or
-                    order['status'] == ORDER_STATUS_REJECTED or
-                    order['status'] == ORDER_STATUS_EXPIRED
-                ):
-                    self.stoploss_order_active = False
-            return order['status']
-        except Exception as e:
-            print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
-            return _extract_api_error_code(e)
+                self.stoploss_order_active = False
+        return order['status']
     
     def check_stoploss_order(self) -> Union[str, int, None]:
         """
         IMPLICIT: state['stoploss_order_active'] == True
         """
         try:
-            order = self.client.get_order(orderId=self.stoploss_order_id, symbol=SYMBOL)
-            self.stoploss_order_status = order['status']
-            self.stoploss_order_original_qty = order['origQty']
-            self.stoploss_order_executed_qty = order['executedQty']
-            self.stoploss_order_cum_quote_qty = order['cummulativeQuoteQty']
+            order = self.client.get_order(orderId=self.stoploss_order_id, symbol=self.symbol)
+            return self.apply_stoploss_order(order)
+        except Exception as e:
+            print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+            return _extract_api_error_code(e)
+    
+    def apply_stoploss_order(self, order:dict) -> str:
+        self.stoploss_order_status = order['status']
+        self.stoploss_order_original_qty = order['origQty']
+        self.stoploss_order_executed_qty = order['executedQty']
+        self.stoploss_order_cum_quote_qty = order['cummulativeQuoteQty']
+        if (
+            order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
+            order['status'] == ORDER_STATUS_FILLED
+        ):
+            self.position_full = False
+            if order['status'] == ORDER_STATUS_FILLED:
+                self.position_open = False
+        if (
+            order['status'] == ORDER_STATUS_FILLED or
+            order['status'] == ORDER_STATUS_CANCELED or
+            order['status'] == ORDER_STATUS_REJECTED or
+            order['status'] == ORDER_STATUS_EXPIRED
+        ):
+            self.stoploss_order_active = False
+        if self.stoploss_is_oco:
             if (
                 order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
-                order['status'] == ORDER_STATUS_FILLED
-            ):
-                self.position_full = False
-                if order['status'] == ORDER_STATUS_FILLED:
-                    self.position_open = False
-            if (
                 order['status'] == ORDER_STATUS_FILLED or
-                order['status'] == ORDER_STATUS_CANCELED or
                 order['status'] == ORDER_STATUS_REJECTED or
                 order['status'] == ORDER_STATUS_EXPIRED
             ):
-                self.stoploss_order_active = False
-            if self.stoploss_is_oco:
-                if (
-                    order['status'] == ORDER_STATUS_PARTIALLY_FILLED or
-                    order['status'] == ORDER_STATUS_FILLED or
-                    order['status'] == ORDER_STATUS_REJECTED or
-                    order['status'] == ORDER_STATUS_EXPIRED
-                ):
-                    self.sell_order_active = False
-            return order['status']
-        except Exception as e:
-            print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
-            return _extract_api_error_code(e)
+                self.sell_order_active = False
+        return order['status']
     
     def activate_buy_signal(self, price:float, delta:float) -> None:
         self.buy_signal_flag = True
         self.buy_signal_time = tznow().timestamp()
         self.buy_signal_price = price
         self.buy_price_delta = calculate_price_delta(delta, BUY_DELTA_A, BUY_DELTA_B, BUY_DELTA_C)
-        tg.notify_signal_activated(BUY_TYPE)
+        tg.notify_signal_activated(BUY_TYPE, state_machine=self)
     
     def deactivate_buy_signal(self) -> None:
         self.buy_signal_flag = False
-        tg.notify_signal_deactivated(BUY_TYPE)
+        tg.notify_signal_deactivated(BUY_TYPE, state_machine=self)
     
     def activate_sell_signal(self, price:float, delta:float) -> None:
         self.sell_signal_flag = True
         self.sell_signal_time = tznow().timestamp()
         self.sell_signal_price = price
         self.sell_price_delta = calculate_price_delta(delta, SELL_DELTA_A, SELL_DELTA_B, SELL_DELTA_C)
-        tg.notify_signal_activated(SELL_TYPE)
+        tg.notify_signal_activated(SELL_TYPE, state_machine=self)
     
     def deactivate_sell_signal(self) -> None:
         self.sell_signal_flag = False
-        tg.notify_signal_deactivated(SELL_TYPE)
+        tg.notify_signal_deactivated(SELL_TYPE, state_machine=self)
     
     def process_order_status(
         self,
@@ -508,22 +574,22 @@ class TradeStateMachine:
             elif order_type == STOPLOSS_TYPE:
                 order_type = OCO_STOPLOSS_TYPE
         
-        exec_qty_inc = rounddown(new_exec_qty, QTY_DEC_PLACES) > rounddown(old_exec_qty, QTY_DEC_PLACES)
+        exec_qty_inc = rounddown(new_exec_qty, self.qty_dec_places) > rounddown(old_exec_qty, self.qty_dec_places)
         
         if new_status == ORDER_STATUS_FILLED:
             if old_status != ORDER_STATUS_FILLED:
-                tg.notify_order_filled(order_type)
+                tg.notify_order_filled(order_type, state_machine=self)
             if update_balances:
                 self.update_asset_balance()
                 self.update_quote_asset_balance()
         elif new_status == ORDER_STATUS_PARTIALLY_FILLED:
             if exec_qty_inc:
-                tg.notify_order_partially_filled(order_type)
+                tg.notify_order_partially_filled(order_type, state_machine=self)
                 if update_balances:
                     self.update_asset_balance()
                     self.update_quote_asset_balance()
         elif isinstance(new_status, str) and new_status != ORDER_STATUS_NEW:
-            tg.notify_unexpected_order_status(order_type, new_status)
+            tg.notify_unexpected_order_status(order_type, new_status, state_machine=self)
         
         return exec_qty_inc
     
@@ -586,6 +652,157 @@ class TradeStateMachine:
         
         return exec_qty_increased
     
+    def reconcile_orders(self) -> dict:
+        """
+        all active orders from one open orders snapshot, with a get_order lookup only
+        for those no longer open, or from get_order alone if just one is active;
+        returns {order_type: (old_status, new_status, old_exec_qty)} of the updated slots
+        """
+        active = [
+            (order_type, self.get_order_id(order_type))
+            for order_type, order_active in (
+                (BUY_TYPE, self.buy_order_active),
+                (SELL_TYPE, self.sell_order_active),
+                (STOPLOSS_TYPE, self.stoploss_order_active)
+            )
+            if order_active
+        ]
+        if len(active) == 0:
+            return dict()
+        open_orders = dict()
+        if len(active) > 1:
+            try:
+                open_orders = {order['orderId']: order for order in self.client.get_open_orders(symbol=self.symbol)}
+            except Exception as e:
+                print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+                return dict()
+        
+        snapshot = list()
+        for order_type, order_id in active:
+            order = open_orders.get(order_id, None)
+            if order is None:
+                if self.stoploss_is_oco and order_type != BUY_TYPE and any(
+                    float(leg['executedQty']) > 0.0
+                    for leg_type, leg in snapshot
+                    if leg_type != BUY_TYPE
+                ):
+                    continue  # the other leg of the OCO order executed, so this one expired
+                try:
+                    order = self.client.get_order(orderId=order_id, symbol=self.symbol)
+                except Exception as e:
+                    print(get_timestamp(), '{:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+                    continue
+            snapshot.append((order_type, order))
+        
+        old_statuses = {
+            BUY_TYPE: self.buy_order_status,
+            SELL_TYPE: self.sell_order_status,
+            STOPLOSS_TYPE: self.stoploss_order_status
+        }
+        oco_executed = self.stoploss_is_oco and any(
+            float(order['executedQty']) > 0.0
+            for order_type, order in snapshot
+            if order_type != BUY_TYPE
+        )
+        updates = dict()
+        for order_type, order in snapshot:
+            if oco_executed and order_type != BUY_TYPE and order['status'] == ORDER_STATUS_EXPIRED:
+                continue  # expired because the other leg executed, which deactivates it
+            old_exec_qty = self.get_executed_quantity(order_type)
+            if order_type == BUY_TYPE:
+                new_status = self.apply_buy_order(order)
+            elif order_type == SELL_TYPE:
+                new_status = self.apply_sell_order(order)
+            else:
+                new_status = self.apply_stoploss_order(order)
+            updates[order_type] = (old_statuses[order_type], new_status, old_exec_qty)
+        return updates
+    
+    def reconcile_and_process_orders(self, update_balances:bool=False) -> dict:
+        # reconcile_orders() processed like check_and_process_order, returns {order_type: exec_qty_increased}
+        updates = self.reconcile_orders()
+        exec_qty_increased = {
+            order_type: self.process_order_status(
+                order_type,
+                old_status,
+                new_status,
+                old_exec_qty,
+                self.get_executed_quantity(order_type)
+            )
+            for order_type, (old_status, new_status, old_exec_qty) in updates.items()
+        }
+        if update_balances and any(exec_qty_increased.values()):
+            self.update_asset_balance()
+            self.update_quote_asset_balance()
+        return exec_qty_increased
+    
+    def apply_execution_report(self, event:dict) -> Union[tuple, None]:
+        """
+        executionReport of the user data stream, processed like a check_and_process_order
+        result; returns (order_type, exec_qty_increased), or None if the order belongs to
+        no slot or the report adds nothing to the known state, e.g. the cancellation of
+        an order cancelled by REST or the expiry of the other leg of a filled OCO order
+        """
+        order_id = event['i']
+        if order_id == self.buy_order_id:
+            order_type = BUY_TYPE
+            old_status = self.buy_order_status
+            active = self.buy_order_active
+        elif order_id == self.sell_order_id:
+            order_type = SELL_TYPE
+            old_status = self.sell_order_status
+            active = self.sell_order_active
+        elif order_id == self.stoploss_order_id:
+            order_type = STOPLOSS_TYPE
+            old_status = self.stoploss_order_status
+            active = self.stoploss_order_active
+        else:
+            return None
+        
+        old_exec_qty = self.get_executed_quantity(order_type)
+        new_exec_qty = float(event['z'])
+        if new_exec_qty < old_exec_qty or new_exec_qty == old_exec_qty and (
+            not active or
+            event['X'] == old_status
+        ):
+            return None
+        if self.stoploss_is_oco and order_type != BUY_TYPE and event['X'] == ORDER_STATUS_EXPIRED and (
+            self.sell_order_active if order_type == STOPLOSS_TYPE else self.stoploss_order_active
+        ):
+            return None  # the report of the executed leg deactivates it
+        
+        order = {
+            'orderId': order_id,
+            'status': event['X'],
+            'origQty': event['q'],
+            'executedQty': event['z'],
+            'cummulativeQuoteQty': event['Z']
+        }
+        if order_type == BUY_TYPE:
+            new_status = self.apply_buy_order(order)
+        elif order_type == SELL_TYPE:
+            new_status = self.apply_sell_order(order)
+        else:
+            new_status = self.apply_stoploss_order(order)
+        
+        exec_qty_increased = self.process_order_status(
+            order_type,
+            old_status,
+            new_status,
+            old_exec_qty,
+            new_exec_qty
+        )
+        
+        return order_type, exec_qty_increased
+    
+    def apply_account_position(self, event:dict) -> None:
+        # outboundAccountPosition of the user data stream, lists the assets that changed
+        for balance in event['B']:
+            if balance['a'] == self.asset:
+                self.asset_balance = {'asset': balance['a'], 'free': balance['f'], 'locked': balance['l']}
+            elif balance['a'] == self.quote_asset:
+                self.quote_asset_balance = {'asset': balance['a'], 'free': balance['f'], 'locked': balance['l']}
+    
     def update_stoploss_level(
         self,
         x: float,
@@ -596,7 +813,7 @@ class TradeStateMachine:
     ) -> bool:
         new_stoploss_level = round(
             calculate_stoploss(x, distance, distance_factor, pct_offset),
-            PRICE_DEC_PLACES
+            self.price_dec_places
         )
         if override_condition == 'greater':
             condition_met = new_stoploss_level > self.stoploss_level
@@ -606,7 +823,7 @@ class TradeStateMachine:
             raise ValueError("Invalid override_condition: must be 'greater' or 'not_equal'")
         if condition_met:
             self.stoploss_level = new_stoploss_level
-            tg.notify_stoploss_update(new_stoploss_level)
+            tg.notify_stoploss_update(new_stoploss_level, state_machine=self)
         return condition_met
     
     @property
@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from persistence import atomic_write
+from candle_store import CandleStore
+from candle_buffer import open_time_index
+from timeframes import MultiTimeframeAggregator
+from df_utils import (
+    apply_technicals_v01,
+    apply_technicals_v04_full,
+    apply_lookahead_label,
+    FeaturePlan
+)
+from config import (
+    CANDLE_STORE_PATH,
+    LOOKAHEAD_WINDOW,
+    DATASET_CHUNK_ROWS,
+    DATASET_WARMUP_ROWS,
+    TIMEFRAME_WARMUP_CANDLES,
+    DATA_COLUMNS,
+    IGNORED_COLUMNS,
+    LABEL_COL,
+    Y_PRED_COL,
+    Y_PRED_MA_COL
+)
+
+# output layout: a directory with one .npy file per column, open_time.npy (int64
+# epoch ms) and meta.json; the column files are preallocated and every worker
+# writes its chunk into them through a memory map
+DATASET_VERSION = 1
+META_FILE = 'meta.json'
+OPEN_TIME_FILE = 'open_time.npy'
+
+def feature_frame(df:pd.DataFrame, mode:str, timeframes:list) -> tuple:
+    # technicals, higher timeframe features and label of df and the plan turning them into model features
+    if mode == 'v01':
+        df = apply_technicals_v01(df)
+    elif mode == 'v04':
+        df = apply_technicals_v04_full(df)
+    else:
+        raise ValueError('Unknown mode encountered in feature_frame')
+    extra_transforms = None
+    if timeframes:
+        aggregator = MultiTimeframeAggregator(timeframes)
+        df = df.join(aggregator.seed(df))
+        extra_transforms = aggregator.transforms()
+    df = apply_lookahead_label(df)
+    plan = FeaturePlan(
+        df.columns,
+        mode,
+        IGNORED_COLUMNS + [LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL],
+        extra_transforms = extra_transforms
+    )
+    return df, plan
+
+def read_candles(store:CandleStore, first:int, last:int) -> pd.DataFrame:
+    records = store.records[first:last]
+    return pd.DataFrame(
+        {col: np.asarray(records[col]) for col in DATA_COLUMNS},
+        index = open_time_index(np.asarray(records['open_time']))
+    )
+
+def column_path(path:str, col:str) -> str:
+    return os.path.join(path, col + '.npy')
+
+def build_chunk(
+    store_path: str,
+    path: str,
+    mode: str,
+    timeframes: list,
+    offset: int,
+    first: int,
+    last: int,
+    warmup: int
+) -> int:
+    # rows [first, last) of the store, computed with warmup rows before and the label window after them
+    store = CandleStore(store_path)
+    read_first = max(first - warmup, 0)
+    read_last = min(last + LOOKAHEAD_WINDOW, len(store))
+    df, plan = feature_frame(read_candles(store, read_first, read_last), mode, timeframes)
+    rows = slice(first - read_first, last - read_first)
+    values = df.to_numpy(dtype=np.float64)[rows]
+    features = plan.transform(values)
+    outputs = {col: features[:, i] for i, col in enumerate(plan.columns)}
+    outputs[LABEL_COL] = values[:, df.columns.get_loc(LABEL_COL)]
+    with open(os.path.join(path, META_FILE), 'r') as fh:
+        meta = json.load(fh)
+    for col in meta['columns']:
+        out = np.load(column_path(path, col), mmap_mode='r+')
+        out[first - offset:last - offset] = outputs[col]
+        out.flush()
+        del out
+    out = np.load(os.path.join(path, OPEN_TIME_FILE), mmap_mode='r+')
+    out[first - offset:last - offset] = store.records[first:last]['open_time']
+    out.flush()
+    return last - first
+
+def build_dataset(
+    path: str,
+    mode: str,
+    store_path: str = CANDLE_STORE_PATH,
+    start: Union[str, None] = None,
+    end: Union[str, None] = None,
+    timeframes: list = [],
+    chunk_rows: int = DATASET_CHUNK_ROWS,
+    warmup: int = DATASET_WARMUP_ROWS,
+    workers: Union[int, None] = None,
+    dtype: str = 'float32'
+) -> dict:
+    """
+    features and LABEL_COL of the candles between start and end, computed chunk by
+    chunk in a process pool; rows without enough history or lookahead are NaN
+    """
+    store = CandleStore(store_path)
+    first = store.search(start, 'left') if start is not None else 0
+    last = store.search(end, 'right') if end is not None else len(store)
+    n_rows = last - first
+    if n_rows <= 0:
+        raise ValueError('No candles in the selected range')
+    plan = feature_frame(read_candles(store, first, min(first + 100, last)), mode, timeframes)[1]
+    if timeframes:
+        # indicators of daily bars need far more hourly candles to settle
+        warmup = max(warmup, TIMEFRAME_WARMUP_CANDLES)
+    columns = plan.columns + [LABEL_COL]
+    
+    os.makedirs(path, exist_ok=True)
+    meta = {
+        'version': DATASET_VERSION,
+        'complete': False,
+        'mode': mode,
+        'source': os.path.abspath(store_path),
+        'timeframes': list(timeframes),
+        'label': LABEL_COL,
+        'lookahead_window': LOOKAHEAD_WINDOW,
+        'warmup': warmup,
+        'n_rows': n_rows,
+        'dtype': dtype,
+        'columns': columns
+    }
+    atomic_write(os.path.join(path, META_FILE), json.dumps(meta, indent=2).encode('utf-8'))
+    for col in columns:
+        np.lib.format.open_memmap(column_path(path, col), mode='w+', dtype=dtype, shape=(n_rows,)).flush()
+    np.lib.format.open_memmap(os.path.join(path, OPEN_TIME_FILE), mode='w+', dtype=np.int64, shape=(n_rows,)).flush()
+    
+    chunks = [(i, min(i + chunk_rows, last)) for i in range(first, last, chunk_rows)]
+    t0 = time.perf_counter()
+    n_done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(build_chunk, store_path, path, mode, timeframes, first, chunk_first, chunk_last, warmup)
+            for chunk_first, chunk_last in chunks
+        ]
+        for future in as_completed(futures):
+            n_done += future.result()
+            print('{:d}/{:d} rows ({:.1f} s)'.format(n_done, n_rows, time.perf_counter() - t0), flush=True)
+    
+    meta['complete'] = True
+    meta['first_open_time'] = int(store.records[first]['open_time'])
+    meta['last_open_time'] = int(store.records[last - 1]['open_time'])
+    atomic_write(os.path.join(path, META_FILE), json.dumps(meta, indent=2).encode('utf-8'))
+    return meta
+
+def load_dataset(path:str, columns:Union[list, None]=None) -> pd.DataFrame:
+    with open(os.path.join(path, META_FILE), 'r') as fh:
+        meta = json.load(fh)
+    if not meta['complete']:
+        raise ValueError("Dataset '{:s}' is incomplete".format(path))
+    if columns is None:
+        columns = meta['columns']
+    return pd.DataFrame(
+        {col: np.load(column_path(path, col), mmap_mode='r') for col in columns},
+        index = open_time_index(np.load(os.path.join(path, OPEN_TIME_FILE)))
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='build a training dataset from a candle store')
+    parser.add_argument('output', help='dataset directory')
+    parser.add_argument('--mode', default='v04', choices=['v01', 'v04'])
+    parser.add_argument('--store', default=CANDLE_STORE_PATH, help='candle store with the history')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--timeframes', nargs='*', default=[], help='higher timeframe features, e.g. 4h 1d')
+    parser.add_argument('--chunk-rows', type=int, default=DATASET_CHUNK_ROWS)
+    parser.add_argument('--warmup', type=int, default=DATASET_WARMUP_ROWS, help='candles before each chunk for the indicators')
+    parser.add_argument('--workers', type=int, default=None, help='default: number of cores')
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float64'])
+    parser.add_argument('--force', action='store_true', help='overwrite an existing dataset')
+    args = parser.parse_args()
+    
+    if os.path.exists(os.path.join(args.output, META_FILE)) and not args.force:
+        print("error: '{:s}' already exists, use --force to overwrite".format(args.output))
+        sys.exit(1)
+    meta = build_dataset(
+        args.output,
+        args.mode,
+        args.store,
+        args.start,
+        args.end,
+        args.timeframes,
+        args.chunk_rows,
+        args.warmup,
+        args.workers,
+        args.dtype
+    )
+    print('{:d} rows x {:d} columns written to {:s}'.format(meta['n_rows'], len(meta['columns']), args.output))
+
+if __name__ == '__main__':
+    main()
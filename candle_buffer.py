@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+from config import TIMEZONE_OBJ
+
+def open_time_index(open_times:np.ndarray) -> pd.DatetimeIndex:
+    return pd.to_datetime(np.asarray(open_times, dtype=np.int64), unit='ms', utc=True).tz_convert(TIMEZONE_OBJ)
+
+def datetime_index_to_open_times(index:pd.DatetimeIndex) -> np.ndarray:
+    epoch = pd.Timestamp(0, tz='UTC')
+    return ((index.tz_convert('UTC') - epoch) // pd.Timedelta(1, unit='ms')).to_numpy(dtype=np.int64)
+
+class CandleBuffer:
+    """
+    fixed-capacity ring buffer of candles with an int64 epoch-ms open time index;
+    every row is written twice (slot and slot + capacity) so that the most recent
+    rows are always a contiguous view
+    """
+    def __init__(self, capacity:int, columns:list) -> None:
+        self.capacity = capacity
+        self.columns = list(columns)
+        self.column_positions = {col: i for i, col in enumerate(self.columns)}
+        self.__values = np.full((2 * capacity, len(self.columns)), np.nan)
+        self.__open_times = np.zeros(2 * capacity, dtype=np.int64)
+        self.__next_slot = 0
+        self.__size = 0
+    
+    @classmethod
+    def from_dataframe(cls, df:pd.DataFrame, capacity:int) -> 'CandleBuffer':
+        buffer = cls(capacity, df.columns)
+        buffer.extend(datetime_index_to_open_times(df.index), df.to_numpy(dtype=np.float64))
+        return buffer
+    
+    def __len__(self) -> int:
+        return self.__size
+    
+    def __end(self) -> int:
+        return self.__next_slot + self.capacity
+    
+    def __check_length(self, n:Union[int, None]) -> int:
+        if n is None or n > self.__size:
+            return self.__size
+        return n
+    
+    def append(self, open_time:int, row:Union[dict, pd.Series, np.ndarray]) -> None:
+        if self.__size > 0 and open_time <= self.last_open_time():
+            raise ValueError('Candles must be appended in chronological order')
+        if isinstance(row, np.ndarray):
+            values = row
+        else:
+            values = np.full(len(self.columns), np.nan)
+            for col, value in row.items():
+                values[self.column_positions[col]] = value
+        slot = self.__next_slot
+        self.__values[slot] = values
+        self.__values[slot + self.capacity] = values
+        self.__open_times[slot] = open_time
+        self.__open_times[slot + self.capacity] = open_time
+        self.__next_slot = (slot + 1) % self.capacity
+        self.__size = min(self.__size + 1, self.capacity)
+    
+    def extend(self, open_times:np.ndarray, values:np.ndarray) -> None:
+        open_times = open_times[-self.capacity:]
+        values = values[-self.capacity:]
+        for open_time, row in zip(open_times, values):
+            self.append(int(open_time), row)
+    
+    def tail(self, n:Union[int, None]=None) -> np.ndarray:
+        n = self.__check_length(n)
+        end = self.__end()
+        return self.__values[end - n:end]
+    
+    def column(self, col:str, n:Union[int, None]=None) -> np.ndarray:
+        return self.tail(n)[:, self.column_positions[col]]
+    
+    def open_times(self, n:Union[int, None]=None) -> np.ndarray:
+        n = self.__check_length(n)
+        end = self.__end()
+        return self.__open_times[end - n:end]
+    
+    def last(self, col:str) -> float:
+        return float(self.__values[self.__end() - 1, self.column_positions[col]])
+    
+    def last_open_time(self) -> int:
+        return int(self.__open_times[self.__end() - 1])
+    
+    def last_time(self) -> pd.Timestamp:
+        return open_time_index([self.last_open_time()])[0]
+    
+    def to_dataframe(self, n:Union[int, None]=None, columns:Union[list, None]=None) -> pd.DataFrame:
+        if columns is None:
+            columns = self.columns
+        positions = [self.column_positions[col] for col in columns]
+        return pd.DataFrame(
+            self.tail(n)[:, positions],
+            index = open_time_index(self.open_times(n)),
+            columns = columns
+        )
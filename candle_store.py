@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import zlib
+import bisect
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Union
+from candle_buffer import open_time_index, datetime_index_to_open_times
+from config import TIMEZONE_OBJ, DATA_COLUMNS
+
+# file layout: HEADER_SIZE bytes of magic + json header, then fixed size records of
+# int64 open time, float64 values, uint32 crc32 of the preceding bytes and padding
+MAGIC = b'CANDLES\x01'
+HEADER_SIZE = 1024
+CANDLE_STORE_EXTENSION = '.candles'
+TAIL_CHECK_RECORDS = 16
+
+def is_candle_store_path(path:str) -> bool:
+    return path.endswith(CANDLE_STORE_EXTENSION)
+
+def record_dtype(columns:list) -> np.dtype:
+    return np.dtype(
+        [('open_time', '<i8')]
+        + [(col, '<f8') for col in columns]
+        + [('crc32', '<u4'), ('reserved', '<u4')]
+    )
+
+def to_open_time(t:Union[int, str, pd.Timestamp]) -> int:
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    ts = pd.Timestamp(t)
+    if ts.tz is None:
+        ts = ts.tz_localize(TIMEZONE_OBJ)
+    return int((ts.tz_convert('UTC') - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(1, unit='ms'))
+
+class _OpenTimes:
+    # sequence view for bisect that only touches the records it compares
+    def __init__(self, records:np.ndarray) -> None:
+        self.records = records
+    
+    def __len__(self) -> int:
+        return self.records.shape[0]
+    
+    def __getitem__(self, i:int) -> int:
+        return int(self.records[i]['open_time'])
+
+class CandleStore:
+    """
+    append-only file of fixed size candle records, read through a memory map;
+    a torn or corrupted tail left by a crash is cut off when the file is opened
+    """
+    def __init__(self, path:str, fsync:bool=True) -> None:
+        self.path = path
+        self.fsync = fsync
+        with open(path, 'rb') as fh:
+            header = fh.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("'{:s}' is not a candle store".format(path))
+        header_length = int.from_bytes(header[len(MAGIC):len(MAGIC) + 4], 'little')
+        meta = json.loads(header[len(MAGIC) + 4:len(MAGIC) + 4 + header_length].decode('utf-8'))
+        self.columns = meta['columns']
+        self.dtype = record_dtype(self.columns)
+        self.__records = None
+        self.__n_records = 0
+        self.__last_open_time = None
+        self.__repair_tail()
+    
+    @staticmethod
+    def header_bytes(columns:list) -> bytes:
+        meta = json.dumps({'version': 1, 'columns': list(columns)}).encode('utf-8')
+        header = MAGIC + len(meta).to_bytes(4, 'little') + meta
+        if len(header) > HEADER_SIZE:
+            raise ValueError('Too many columns for the candle store header')
+        return header.ljust(HEADER_SIZE, b'\x00')
+    
+    @classmethod
+    def create(cls, path:str, columns:list=DATA_COLUMNS, fsync:bool=True) -> 'CandleStore':
+        return cls.from_arrays(path, np.zeros(0, dtype=np.int64), np.zeros((0, len(columns))), columns, fsync)
+    
+    @classmethod
+    def from_arrays(
+        cls,
+        path: str,
+        open_times: np.ndarray,
+        values: np.ndarray,
+        columns: list = DATA_COLUMNS,
+        fsync: bool = True
+    ) -> 'CandleStore':
+        # written to a temporary file first, so an existing store is replaced atomically
+        open_times = np.asarray(open_times, dtype=np.int64)
+        if np.any(np.diff(open_times) <= 0):
+            raise ValueError('Candles must be in chronological order without duplicates')
+        records = cls.pack(open_times, values, record_dtype(columns))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(cls.header_bytes(columns))
+            fh.write(records.tobytes())
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+        return cls(path, fsync)
+    
+    @classmethod
+    def from_dataframe(cls, path:str, df:pd.DataFrame, columns:list=DATA_COLUMNS, fsync:bool=True) -> 'CandleStore':
+        return cls.from_arrays(
+            path,
+            datetime_index_to_open_times(df.index),
+            df.loc[:, columns].to_numpy(dtype=np.float64),
+            columns,
+            fsync
+        )
+    
+    @staticmethod
+    def pack(open_times:np.ndarray, values:np.ndarray, dtype:np.dtype) -> np.ndarray:
+        records = np.zeros(len(open_times), dtype=dtype)
+        records['open_time'] = open_times
+        for i, col in enumerate(dtype.names[1:-2]):
+            records[col] = values[:, i]
+        raw = records.view(np.uint8).reshape(len(records), dtype.itemsize)
+        records['crc32'] = [zlib.crc32(row[:dtype.itemsize - 8].tobytes()) for row in raw]
+        return records
+    
+    def __check_crc(self, records:np.ndarray) -> np.ndarray:
+        raw = np.ascontiguousarray(records).view(np.uint8).reshape(len(records), self.dtype.itemsize)
+        crc = np.fromiter(
+            (zlib.crc32(row[:self.dtype.itemsize - 8].tobytes()) for row in raw),
+            dtype = np.uint32,
+            count = len(records)
+        )
+        return crc == records['crc32']
+    
+    def __repair_tail(self) -> None:
+        size = os.path.getsize(self.path)
+        n_records = max(size - HEADER_SIZE, 0) // self.dtype.itemsize
+        self.__n_records = n_records
+        records = self.records
+        n_valid = n_records
+        tail_start = max(n_records - TAIL_CHECK_RECORDS, 0)
+        tail_valid = self.__check_crc(records[tail_start:])
+        while n_valid > tail_start and not tail_valid[n_valid - tail_start - 1]:
+            n_valid -= 1
+        valid_size = HEADER_SIZE + n_valid * self.dtype.itemsize
+        if size != valid_size:
+            print('warning: dropping {:d} bytes of torn or corrupted candle records from {:s}'.format(
+                size - valid_size,
+                self.path
+            ), flush=True)
+            self.__records = None
+            with open(self.path, 'r+b') as fh:
+                fh.truncate(valid_size)
+                os.fsync(fh.fileno())
+            self.__n_records = n_valid
+    
+    def __len__(self) -> int:
+        return self.__n_records
+    
+    @property
+    def records(self) -> np.ndarray:
+        # remapped lazily after appends
+        if self.__records is None or self.__records.shape[0] != self.__n_records:
+            if self.__n_records == 0:
+                self.__records = np.zeros(0, dtype=self.dtype)
+            else:
+                self.__records = np.memmap(
+                    self.path,
+                    dtype = self.dtype,
+                    mode = 'r',
+                    offset = HEADER_SIZE,
+                    shape = (self.__n_records,)
+                )
+        return self.__records
+    
+    def first_open_time(self) -> Union[int, None]:
+        return int(self.records[0]['open_time']) if self.__n_records > 0 else None
+    
+    def last_open_time(self) -> Union[int, None]:
+        # cached so that appends don't have to remap the file
+        if self.__last_open_time is None and self.__n_records > 0:
+            self.__last_open_time = int(self.records[-1]['open_time'])
+        return self.__last_open_time
+    
+    def append(self, open_time:int, row:Union[dict, pd.Series, np.ndarray, list]) -> None:
+        if isinstance(row, (dict, pd.Series)):
+            values = [row[col] for col in self.columns]
+        else:
+            values = row
+        self.extend(np.array([open_time], dtype=np.int64), np.asarray(values, dtype=np.float64).reshape(1, -1))
+    
+    def extend(self, open_times:np.ndarray, values:np.ndarray) -> None:
+        open_times = np.asarray(open_times, dtype=np.int64)
+        if len(open_times) == 0:
+            return
+        last_open_time = self.last_open_time()
+        if np.any(np.diff(open_times) <= 0) or (last_open_time is not None and open_times[0] <= last_open_time):
+            raise ValueError('Candles must be appended in chronological order')
+        data = self.pack(open_times, values, self.dtype).tobytes()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+        try:
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.__n_records += len(open_times)
+        self.__last_open_time = int(open_times[-1])
+    
+    def search(self, open_time:Union[int, str, pd.Timestamp], side:str='left') -> int:
+        if side == 'left':
+            return bisect.bisect_left(_OpenTimes(self.records), to_open_time(open_time))
+        elif side == 'right':
+            return bisect.bisect_right(_OpenTimes(self.records), to_open_time(open_time))
+        else:
+            raise ValueError("Invalid side: must be 'left' or 'right'")
+    
+    def read(
+        self,
+        start: Union[int, str, pd.Timestamp, None] = None,
+        end: Union[int, str, pd.Timestamp, None] = None
+    ) -> tuple:
+        # open times and values of the candles with start <= open time <= end
+        first = self.search(start, 'left') if start is not None else 0
+        last = self.search(end, 'right') if end is not None else self.__n_records
+        records = self.records[first:max(first, last)]
+        values = np.empty((len(records), len(self.columns)))
+        for i, col in enumerate(self.columns):
+            values[:, i] = records[col]
+        return np.array(records['open_time']), values
+    
+    def to_dataframe(
+        self,
+        start: Union[int, str, pd.Timestamp, None] = None,
+        end: Union[int, str, pd.Timestamp, None] = None
+    ) -> pd.DataFrame:
+        open_times, values = self.read(start, end)
+        return pd.DataFrame(values, index=open_time_index(open_times), columns=self.columns)
+    
+    def tail(self, n:int) -> pd.DataFrame:
+        return self.to_dataframe(self.records[-n]['open_time'] if 0 < n < self.__n_records else None)
+    
+    def invalid(self) -> np.ndarray:
+        # mask of the records with a crc mismatch or out of order open time
+        records = self.records
+        invalid = ~self.__check_crc(records)
+        invalid[1:] |= np.diff(records['open_time']) <= 0
+        return invalid
+    
+    def verify(self) -> int:
+        return int(self.invalid().sum())
+
+def migrate_pickle(source:str, destination:str, columns:list=DATA_COLUMNS) -> CandleStore:
+    df = pd.read_pickle(source, compression='infer')
+    if df.index.tz is None:
+        df.index = df.index.tz_localize(TIMEZONE_OBJ, ambiguous='infer')
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return CandleStore.from_dataframe(destination, df, columns)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='candle store maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='convert a .pkl or .pkl.gz dataframe into a candle store')
+    migrate_parser.add_argument('source')
+    migrate_parser.add_argument('destination')
+    migrate_parser.add_argument('--force', action='store_true', help='overwrite an existing candle store')
+    info_parser = subparsers.add_parser('info', help='print size, time range and integrity of a candle store')
+    info_parser.add_argument('path')
+    args = parser.parse_args()
+    
+    if args.command == 'migrate':
+        if os.path.exists(args.destination) and not args.force:
+            print("error: '{:s}' already exists, use --force to overwrite".format(args.destination))
+            sys.exit(1)
+        store = migrate_pickle(args.source, args.destination)
+        print('migrated {:d} candles from {:s} to {:s}'.format(len(store), args.source, args.destination))
+    else:
+        store = CandleStore(args.path)
+        print('{:s}: {:d} candles, columns: {:s}'.format(args.path, len(store), ', '.join(store.columns)))
+        if len(store) > 0:
+            print('first: {:s}'.format(str(open_time_index([store.first_open_time()])[0])))
+            print('last: {:s}'.format(str(open_time_index([store.last_open_time()])[0])))
+        print('invalid records: {:d}'.format(store.verify()))
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,40 @@ SYMBOL = ASSET + QUOTE_ASSET
 INTERVAL = KLINE_INTERVAL_1HOUR
 DATAFRAME_LENGTH = 1024
 DATA_PATH = './data/{:s}_{:s}_{:d}.pkl'.format(SYMBOL, INTERVAL, DATAFRAME_LENGTH)
+CANDLE_STORE_PATH = './data/{:s}_{:s}.candles'.format(SYMBOL, INTERVAL)
+FEATURE_CACHE_PATH = './data/{:s}_{:s}.features'.format(SYMBOL, INTERVAL)
+FEATURE_CACHE_SAVE_INTERVAL = 24
+HIGHER_TIMEFRAMES = []  # e.g. ['4h', '1d'], aggregated from the INTERVAL candles
+TIMEFRAME_WARMUP_CANDLES = 24 * 200
+WRITE_BEHIND_QUEUE_SIZE = 256
+BINANCE_API_URL = 'https://api.binance.com'
+KLINE_DOWNLOAD_WORKERS = 4
+# shared connection pool of all REST calls, per endpoint latency dumped to HTTP_STATS_PATH
+HTTP_POOL_SIZE = 10
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 10.
+HTTP_GET_RETRIES = 2
+HTTP_LATENCY_SAMPLES = 1000
+HTTP_STATS_PATH = './data/http_stats.json'
+# limits of the exchange as (count, seconds); reads keep a reserve of the request weight
+# for orders and cancels and may reuse a response up to RATE_LIMIT_COALESCE_SECONDS old
+RATE_LIMITS = {
+    'REQUEST_WEIGHT': (1200, 60),
+    'ORDERS_10S': (50, 10),
+    'ORDERS_1D': (160000, 24 * 3600)
+}
+RATE_LIMIT_LOW_PRIORITY_RESERVE = 0.2
+RATE_LIMIT_MAX_WAIT_SECONDS = 10.
+RATE_LIMIT_COALESCE_SECONDS = 2.
 STATE_FILE_PATH = './data/state.json'
+STATE_JOURNAL_PATH = './data/state.journal'
+STATE_JOURNAL_COMPACT_RECORDS = 1000
+# further pairs traded in the mode of the main pair over one combined kline stream,
+# as (asset, quote_asset, qty_dec_places, price_dec_places)
+MULTI_SYMBOL_PAIRS = []
+STATE_FILE_PATH_FORMAT = './data/state_{:s}.json'
+CANDLE_STORE_PATH_FORMAT = './data/{:s}_' + INTERVAL + '.candles'
+FEATURE_CACHE_PATH_FORMAT = './data/{:s}_' + INTERVAL + '.features'
 CREDENTIALS_FILE_PATH = './data/credentials.json'
 MODEL_DIR = './models/'
 MODEL_PATH_V01 = MODEL_DIR + 'grid_v01_7.pkl'
@@ -25,6 +58,10 @@ DATETIME_FORMAT_INTERNAL = '%Y-%m-%d %H:%M:%S %z'
 LOOKAHEAD_WINDOW = 10
 N_ROWS_TO_PREDICT = 24
 PREDICTION_MA_WINDOW = 2
+PREDICTION_CACHE_SIZE = 4 * N_ROWS_TO_PREDICT
+TICK_LATENCY_SAMPLES = 1000
+DATASET_CHUNK_ROWS = 50000
+DATASET_WARMUP_ROWS = 3000
 
 SIGNAL_THRESHOLD = 0.05
 
@@ -44,6 +81,13 @@ DELTA_DECAY_FACTOR = 2.0
 
 ORDER_TIMEOUT_SECONDS = 5
 TICKS_BETWEEN_ORDER_UPDATES = 20
+# order and balance updates by websocket, polling only while the stream is down
+USER_STREAM_ENABLED = True
+USER_STREAM_KEEPALIVE_SECONDS = 30 * 60
+USER_STREAM_RETRY_SECONDS = 60
+# REST calls of the kline handler on a worker thread instead of the reactor thread
+ORDER_EXECUTOR_ENABLED = True
+ORDER_EXECUTOR_LATENCY_SAMPLES = 1000
 
 DATA_COLUMNS = [
     'open',
@@ -1,17 +1,96 @@
 import os
 import re
+import io
+import json
+import pytz
 import pandas as pd
 import numpy as np
 import datetime as dt
 from scipy.stats import linregress
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import Union
-from binance.client import Client
 try:
     import talib.abstract as ta
 except ModuleNotFoundError:
     import talib_fallback as ta
+try:
+    import lz4.frame as lz4_frame
+except ModuleNotFoundError:
+    lz4_frame = None
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
 from bot_utils import tznow, get_timestamp
-from config import TIMEZONE_OBJ
+from candle_store import CandleStore, is_candle_store_path, MAGIC as CANDLE_STORE_MAGIC
+from kline_downloader import download_klines, parse_klines, interval_to_milliseconds
+from candle_buffer import open_time_index, datetime_index_to_open_times
+from config import DATA_COLUMNS, LOOKAHEAD_WINDOW, LABEL_COL
+
+DFML_PCT_OF_CLOSE_COLUMNS_V01 = [
+    'open',
+    'high',
+    'low',
+    'sma10',
+    'sma20',
+    'sma50',
+    'sma100',
+    'sma200',
+    'sma500',
+    'sma1000',
+    'ema5',
+    'ema10',
+    'ema21',
+    'ema34',
+    'std',
+    'atr'
+]
+
+CANDLE_PATTERN_COLUMNS_V01 = {
+    'engulfing': 'CDLENGULFING',
+    'hammer': 'CDLHAMMER',
+    'invertedhammer': 'CDLINVERTEDHAMMER',
+    'harami': 'CDLHARAMI',
+    'hangingman': 'CDLHANGINGMAN',
+    'morningstar': 'CDLMORNINGSTAR',
+    'eveningstar': 'CDLEVENINGSTAR',
+    'shootingstar': 'CDLSHOOTINGSTAR',
+    'spinningtop': 'CDLSPINNINGTOP',
+    'doji': 'CDLDOJI',
+    'dojistar': 'CDLDOJISTAR',
+    'longleggeddoji': 'CDLLONGLEGGEDDOJI',
+    'dragonflydoji': 'CDLDRAGONFLYDOJI',
+    'gravestonedoji': 'CDLGRAVESTONEDOJI'
+}
+
+DFML_RATIO_CHANGE_COLUMNS_V04 = [
+    'open',
+    'high',
+    'low',
+    'ema10',
+    'ema20',
+    'sma50',
+    'sma100',
+    'sma200',
+    'sma500',
+    'sma1000',
+    'keltner_upper',
+    'keltner_lower'
+]
+
+DFML_RATIO_COLUMNS_V04 = [
+    'std20',
+    'atr10',
+    'atr100'
+]
+
+DFML_NORMALIZED_COLUMNS_V04 = [
+    'volume',
+    'taker_buy_base_vol'
+]
+
+DFML_MEAN_DICT_V04 = {'volume': 1883.2653201563026, 'taker_buy_base_vol': 943.0650478388751}
+DFML_STD_DICT_V04 = {'volume': 2056.6755264848543, 'taker_buy_base_vol': 1011.2795091423222}
 
 def check_gz_extension(filename:str) -> str:
     if re.search('\.gz$', filename):
@@ -19,48 +98,189 @@ def check_gz_extension(filename:str) -> str:
     else:
         return filename + '.gz'
 
-def dfpickle(df:pd.DataFrame, path:str, print_timestamp:bool=False) -> None:
-    if print_timestamp:
-        ts = get_timestamp() + ' '
+def _columnar_arrays(df:pd.DataFrame) -> dict:
+    if any(dtype == object for dtype in df.dtypes):
+        raise ValueError('Columnar codecs only support numeric and boolean columns')
+    meta = {'columns': list(df.columns), 'index_name': df.index.name, 'index': 'values', 'tz': None}
+    if isinstance(df.index, pd.DatetimeIndex):
+        meta['index'] = 'datetime'
+        if df.index.tz is not None:
+            meta['tz'] = str(df.index.tz)
+            index = datetime_index_to_open_times(df.index)
+        else:
+            index = datetime_index_to_open_times(df.index.tz_localize('UTC'))
     else:
-        ts = ''
-    print('{:s}saving data to {:s}...'.format(ts, path), end=' ', flush=True)
-    df.to_pickle(path)
-    print('done', flush=True)
+        index = df.index.to_numpy()
+    arrays = {'meta': np.array(json.dumps(meta)), 'index': index}
+    for i, col in enumerate(df.columns):
+        arrays['c{:d}'.format(i)] = df[col].to_numpy()
+    return arrays
 
-def dfpickle_zip(df:pd.DataFrame, path:str, print_timestamp:bool=False) -> None:
-    path = check_gz_extension(path)
+def _columnar_frame(arrays) -> pd.DataFrame:
+    meta = json.loads(str(arrays['meta']))
+    if meta['index'] == 'datetime':
+        index = pd.to_datetime(arrays['index'], unit='ms', utc=True)
+        if meta['tz'] is not None:
+            index = index.tz_convert(pytz.timezone(meta['tz']))
+        else:
+            index = index.tz_localize(None)
+    else:
+        index = pd.Index(arrays['index'])
+    index.name = meta['index_name']
+    return pd.DataFrame({col: arrays['c{:d}'.format(i)] for i, col in enumerate(meta['columns'])}, index=index)
+
+def _write_columnar(df:pd.DataFrame, fh, compress=None) -> None:
+    if compress is None:
+        np.savez(fh, **_columnar_arrays(df))
+    else:
+        buffer = io.BytesIO()
+        np.savez(buffer, **_columnar_arrays(df))
+        fh.write(compress(buffer.getbuffer()))
+
+def _read_columnar(fh, decompress=None) -> pd.DataFrame:
+    if decompress is not None:
+        fh = io.BytesIO(decompress(fh.read()))
+    with np.load(fh, allow_pickle=False) as arrays:
+        return _columnar_frame(arrays)
+
+def _require(module, codec:str, package:str):
+    if module is None:
+        raise ModuleNotFoundError("Codec '{:s}' requires the {:s} package".format(codec, package))
+    return module
+
+# name: (write(df, fh), read(fh), file extension, magic bytes, available)
+DF_CODECS = {
+    'pickle': (
+        lambda df, fh: df.to_pickle(fh),
+        lambda fh: pd.read_pickle(fh),
+        '.pkl',
+        b'\x80',
+        True
+    ),
+    'gzip': (
+        lambda df, fh: df.to_pickle(fh, compression='gzip'),
+        lambda fh: pd.read_pickle(fh, compression='gzip'),
+        '.gz',
+        b'\x1f\x8b',
+        True
+    ),
+    'columnar': (
+        lambda df, fh: _write_columnar(df, fh),
+        lambda fh: _read_columnar(fh),
+        '.cols',
+        b'PK\x03\x04',
+        True
+    ),
+    'npz': (
+        lambda df, fh: np.savez_compressed(fh, **_columnar_arrays(df)),
+        lambda fh: _read_columnar(fh),
+        '.npz',
+        b'PK\x03\x04',
+        True
+    ),
+    'lz4': (
+        lambda df, fh: _write_columnar(df, fh, _require(lz4_frame, 'lz4', 'lz4').compress),
+        lambda fh: _read_columnar(fh, _require(lz4_frame, 'lz4', 'lz4').decompress),
+        '.lz4',
+        b'\x04\x22\x4d\x18',
+        lz4_frame is not None
+    ),
+    'zstd': (
+        lambda df, fh: _write_columnar(df, fh, _require(zstandard, 'zstd', 'zstandard').ZstdCompressor().compress),
+        lambda fh: _read_columnar(fh, _require(zstandard, 'zstd', 'zstandard').ZstdDecompressor().decompress),
+        '.zst',
+        b'\x28\xb5\x2f\xfd',
+        zstandard is not None
+    )
+}
+
+def available_codecs() -> list:
+    return [name for name, codec in DF_CODECS.items() if codec[4]]
+
+def codec_from_extension(path:str) -> str:
+    for name, codec in DF_CODECS.items():
+        if path.endswith(codec[2]):
+            return name
+    return 'pickle'
+
+def detect_codec(path:str) -> str:
+    # npz and columnar files are both zip archives and are read the same way
+    with open(path, 'rb') as fh:
+        head = fh.read(8)
+    if head.startswith(CANDLE_STORE_MAGIC):
+        return 'candles'
+    for name, codec in DF_CODECS.items():
+        if head.startswith(codec[3]):
+            return name
+    raise ValueError("Unknown file format encountered in detect_codec: '{:s}'".format(path))
+
+def dfsave(df:pd.DataFrame, path:str, codec:Union[str, None]=None, print_timestamp:bool=False) -> None:
+    if codec is None:
+        codec = codec_from_extension(path)
+    if codec not in DF_CODECS:
+        raise ValueError('Unknown codec encountered in dfsave')
     if print_timestamp:
         ts = get_timestamp() + ' '
     else:
         ts = ''
     print('{:s}saving data to {:s}...'.format(ts, path), end=' ', flush=True)
-    df.to_pickle(path, compression='gzip')
+    with open(path, 'wb') as fh:
+        DF_CODECS[codec][0](df, fh)
     print('done', flush=True)
 
-def dfunpickle(path:str, print_timestamp:bool=False) -> pd.DataFrame:
+def dfload(path:str, print_timestamp:bool=False) -> pd.DataFrame:
     if print_timestamp:
         ts = get_timestamp() + ' '
     else:
         ts = ''
     print('{:s}loading data from {:s}...'.format(ts, path), end=' ', flush=True)
     try:
-        df = pd.read_pickle(path)
+        codec = detect_codec(path)
+        if codec == 'candles':
+            df = CandleStore(path).to_dataframe()
+        else:
+            with open(path, 'rb') as fh:
+                df = DF_CODECS[codec][1](fh)
         print('done', flush=True)
     except FileNotFoundError:
         print("\n{:s}error: '{:s}' not found in {:s}".format(ts, path, os.getcwd()), flush=True)
         raise
     return df
 
+def dfpickle(df:pd.DataFrame, path:str, print_timestamp:bool=False) -> None:
+    dfsave(df, path, 'pickle', print_timestamp)
+
+def dfpickle_zip(df:pd.DataFrame, path:str, print_timestamp:bool=False) -> None:
+    dfsave(df, check_gz_extension(path), 'gzip', print_timestamp)
+
+def dfunpickle(path:str, print_timestamp:bool=False) -> pd.DataFrame:
+    return dfload(path, print_timestamp)
+
 def dfunpickle_zip(path:str, print_timestamp:bool=False) -> pd.DataFrame:
-    path = check_gz_extension(path)
+    return dfload(check_gz_extension(path), print_timestamp)
+
+def dfstore(df:pd.DataFrame, path:str, print_timestamp:bool=False) -> None:
+    if print_timestamp:
+        ts = get_timestamp() + ' '
+    else:
+        ts = ''
+    print('{:s}saving data to {:s}...'.format(ts, path), end=' ', flush=True)
+    CandleStore.from_dataframe(path, df)
+    print('done', flush=True)
+
+def dfunstore(
+    path: str,
+    start: Union[str, None] = None,
+    end: Union[str, None] = None,
+    print_timestamp: bool = False
+) -> pd.DataFrame:
     if print_timestamp:
         ts = get_timestamp() + ' '
     else:
         ts = ''
     print('{:s}loading data from {:s}...'.format(ts, path), end=' ', flush=True)
     try:
-        df = pd.read_pickle(path, compression='gzip')
+        df = CandleStore(path).to_dataframe(start, end)
         print('done', flush=True)
     except FileNotFoundError:
         print("\n{:s}error: '{:s}' not found in {:s}".format(ts, path, os.getcwd()), flush=True)
@@ -76,51 +296,126 @@ def download_dataframe(
     zip: bool
 ) -> pd.DataFrame:
     print('downloading new data...', end=' ', flush=True)
-    client = Client('', '')
-    klines = client.get_historical_klines(symbol, interval, start, end)
+    klines = download_klines(symbol, interval, start, end)
     print('done', flush=True)
     
-    opening_times = list()
-    for tick in klines:
-        opening_times.append(dt.datetime.fromtimestamp(tick[0] // 1000))
-    
-    df = pd.DataFrame(
-        klines,
-        dtype = 'float64',
-        index = opening_times,
-        columns = [
-            0,
-            'open',
-            'high',
-            'low',
-            'close',
-            'volume',
-            6,
-            'quote_asset_vol',
-            'no_of_trades',
-            'taker_buy_base_vol',
-            'taker_buy_quote_vol',
-            11
-        ]
-    )
-    df.drop(columns=[0, 6, 11], inplace=True)
-    del klines, opening_times
-    
-    df.index = df.index.tz_localize(TIMEZONE_OBJ, ambiguous='infer')
+    df = klines_to_dataframe(klines)
     df.drop(df.index[-1], inplace=True)
     
+    merge_local_candles(df, path, zip)
+    return df
+
+def klines_to_dataframe(klines:list) -> pd.DataFrame:
+    open_times, values = parse_klines(klines)
+    return pd.DataFrame(values, index=open_time_index(open_times), columns=DATA_COLUMNS)
+
+def load_local_candles(path:str, zip:bool) -> pd.DataFrame:
+    if is_candle_store_path(path):
+        store = CandleStore(path)
+        if store.verify() > 0:
+            raise ValueError('Candle store contains corrupted records')
+        return store.to_dataframe()
     if zip:
+        df = dfunpickle_zip(path)
+    else:
+        df = dfunpickle(path)
+    if not df.index.is_monotonic_increasing or df.index.has_duplicates:
+        raise ValueError('Candle index is not strictly increasing')
+    return df
+
+def load_readable_candles(path:str, zip:bool) -> Union[pd.DataFrame, None]:
+    # what can still be read from a local file, without corrupted records; None if nothing
+    try:
+        if is_candle_store_path(path):
+            store = CandleStore(path)
+            valid = ~store.invalid()
+            open_times, values = store.read()
+            df = pd.DataFrame(values[valid], index=open_time_index(open_times[valid]), columns=store.columns)
+        elif zip:
+            df = dfunpickle_zip(path)
+        else:
+            df = dfunpickle(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print('warning: {:s} is unreadable ({:s}: {:s})'.format(path, type(e).__name__, str(e)), flush=True)
+        return None
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+def merge_local_candles(df:pd.DataFrame, path:str, zip:bool) -> None:
+    # the candles of df replace the stored ones of the same open time, the rest of the
+    # stored history is kept, so a download never shortens the local data
+    local = load_readable_candles(path, zip)
+    if local is not None and local.shape[0] > 0:
+        local = local.loc[~local.index.isin(df.index), df.columns]
+        df = pd.concat([local, df]).sort_index()
+    if is_candle_store_path(path):
+        dfstore(df, path)
+    elif zip:
         dfpickle_zip(df, path)
     else:
         dfpickle(df, path)
-    return df
+
+def fill_dataframe_gap(
+    symbol: str,
+    interval: str,
+    path: str,
+    end: Union[str, None],
+    zip: bool
+) -> None:
+    # appends the closed candles after the last stored one; raises ValueError if the
+    # local data is corrupt or doesn't line up with the exchange
+    if is_candle_store_path(path):
+        # only the last record is read, a torn tail is cut off when the store is opened
+        store = CandleStore(path)
+        if len(store) == 0:
+            raise ValueError('No local candles')
+        last = store.tail(1)
+    else:
+        local = load_local_candles(path, zip)
+        if local.shape[0] == 0:
+            raise ValueError('No local candles')
+        last = local.iloc[-1:]
+    last_open_time = int(datetime_index_to_open_times(last.index)[0])
+    now_ms = int(tznow().timestamp() * 1000)
+    
+    print('downloading missing data...', end=' ', flush=True)
+    # starting at the last stored candle so that the seam can be checked
+    klines = download_klines(symbol, interval, last_open_time, end)
+    klines = [kline for kline in klines if kline[6] < now_ms]
+    print('done', flush=True)
+    
+    if len(klines) == 0 or klines[0][0] != last_open_time:
+        raise ValueError('Last stored candle not found on the exchange')
+    open_times = np.array([kline[0] for kline in klines], dtype=np.int64)
+    if np.any(np.diff(open_times) <= 0) or np.any(np.diff(open_times) % interval_to_milliseconds(interval) != 0):
+        raise ValueError('Downloaded candles are duplicated, out of order or misaligned')
+    df = klines_to_dataframe(klines)
+    if not np.allclose(df.iloc[0].to_numpy(), last.iloc[-1].loc[df.columns].to_numpy(), rtol=1e-9, equal_nan=True):
+        # e.g. stored before the candle was final: the exchange's version replaces it
+        print('warning: last stored candle differs from the exchange, replacing it', flush=True)
+        merge_local_candles(df, path, zip)
+        return
+    df = df.iloc[1:]
+    
+    if is_candle_store_path(path):
+        print('appending {:d} candles to {:s}...'.format(df.shape[0], path), end=' ', flush=True)
+        store.extend(open_times[1:], df.loc[:, store.columns].to_numpy(dtype=np.float64))
+        print('done', flush=True)
+    elif zip:
+        dfpickle_zip(pd.concat([local, df]), path)
+    else:
+        dfpickle(pd.concat([local, df]), path)
 
 def load_and_verify_dataframe(path:str, start:str, end:Union[str,None], zip:bool) -> pd.DataFrame:
-    if zip:
-        df = dfunpickle_zip(path)
+    if is_candle_store_path(path):
+        df = dfunstore(path, start, end)
     else:
-        df = dfunpickle(path)
-    df = df.loc[start:end]
+        if zip:
+            df = dfunpickle_zip(path)
+        else:
+            df = dfunpickle(path)
+        df = df.loc[start:end]
     assert df.shape[0] >= 1000, 'Too short'
     if end is None:
         assert df.index[-1] > tznow() - dt.timedelta(hours=2), 'Not up to date'
@@ -134,7 +429,8 @@ def create_dataframe(
     download: Union[str, bool] = 'auto',
     start: str = '2000-01-01',
     end: Union[str, None] = None,
-    zip: bool = False
+    zip: bool = False,
+    feature_cache = None
 ) -> pd.DataFrame:
     if download == 'auto':
         try:
@@ -142,23 +438,34 @@ def create_dataframe(
         except FileNotFoundError:
             df = download_dataframe(symbol, interval, path, start, end, zip)
         except AssertionError:
-            print('error: dataframe too short or not up to date', flush=True)
-            df = download_dataframe(symbol, interval, path, start, end, zip)
+            print('dataframe too short or not up to date', flush=True)
+            try:
+                fill_dataframe_gap(symbol, interval, path, end, zip)
+                df = load_and_verify_dataframe(path, start, end, zip)
+            except (AssertionError, ValueError) as e:
+                print('error: local data could not be completed ({:s}), downloading all data'.format(str(e)), flush=True)
+                df = download_dataframe(symbol, interval, path, start, end, zip)
     
     elif download == True:
         df = download_dataframe(symbol, interval, path, start, end, zip)
     
     else:
-        if zip:
-            df = dfunpickle_zip(path)
+        if is_candle_store_path(path):
+            df = dfunstore(path, start, end)
         else:
-            df = dfunpickle(path)
-        df = df.loc[start:end]
+            if zip:
+                df = dfunpickle_zip(path)
+            else:
+                df = dfunpickle(path)
+            df = df.loc[start:end]
     
     if mode == 'v01':
         df = apply_technicals_v01(df)
     elif mode == 'v04':
-        df = apply_technicals_v04_full(df)
+        if feature_cache is not None:
+            df = feature_cache.apply(df)
+        else:
+            df = apply_technicals_v04_full(df)
     else:
         raise ValueError('Unknown mode encountered in create_dataframe')
     
@@ -168,6 +475,36 @@ def linregress_trend(series:pd.Series) -> float:
     slope, intercept, r_value, p_value, std_err = linregress(np.arange(series.shape[0]), series)
     return slope * r_value**2
 
+def linregress_trend_from_sums(
+    n: int,
+    sum_y: Union[float, np.ndarray],
+    sum_xy: Union[float, np.ndarray],
+    sum_yy: Union[float, np.ndarray]
+) -> Union[float, np.ndarray]:
+    # closed form of linregress_trend with x = 0, 1, ..., n - 1
+    sum_x = n * (n - 1) / 2.
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6.
+    ssxm = sum_xx - sum_x**2 / n
+    ssxym = sum_xy - sum_x * sum_y / n
+    ssym = sum_yy - sum_y**2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = np.where(ssym > 0., np.minimum(ssxym**2 / (ssxm * ssym), 1.), 0.)
+    return ssxym / ssxm * r_squared
+
+def rolling_linregress_trend(values:Union[pd.Series, np.ndarray], window:int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    trend = np.full(values.shape[0], np.nan)
+    if values.shape[0] < window:
+        return trend
+    windows = sliding_window_view(values, window)
+    trend[window - 1:] = linregress_trend_from_sums(
+        window,
+        windows.sum(axis=1),
+        windows @ np.arange(window, dtype=np.float64),
+        (windows * windows).sum(axis=1)
+    )
+    return trend
+
 def apply_technicals_v01(df:pd.DataFrame) -> pd.DataFrame:
     df['rsi'] = ta.RSI(df, timeperiod=14)
     stoch = ta.STOCH(df)
@@ -189,25 +526,19 @@ def apply_technicals_v01(df:pd.DataFrame) -> pd.DataFrame:
     df['ema34'] = ta.EMA(df, timeperiod=34)
     df['std'] = ta.STDDEV(df, timeperiod=20)
     df['atr'] = ta.ATR(df, timeperiod=10)
-    df['engulfing'] = ta.CDLENGULFING(df)
-    df['hammer'] = ta.CDLHAMMER(df)
-    df['invertedhammer'] = ta.CDLINVERTEDHAMMER(df)
-    df['harami'] = ta.CDLHARAMI(df)
-    df['hangingman'] = ta.CDLHANGINGMAN(df)
-    df['morningstar'] = ta.CDLMORNINGSTAR(df)
-    df['eveningstar'] = ta.CDLEVENINGSTAR(df)
-    df['shootingstar'] = ta.CDLSHOOTINGSTAR(df)
-    df['spinningtop'] = ta.CDLSPINNINGTOP(df)
-    df['doji'] = ta.CDLDOJI(df)
-    df['dojistar'] = ta.CDLDOJISTAR(df)
-    df['longleggeddoji'] = ta.CDLLONGLEGGEDDOJI(df)
-    df['dragonflydoji'] = ta.CDLDRAGONFLYDOJI(df)
-    df['gravestonedoji'] = ta.CDLGRAVESTONEDOJI(df)
+    if hasattr(ta, 'candle_patterns'):
+        # the fallback detects all patterns from one set of body/shadow intermediates
+        patterns = ta.candle_patterns(df, list(CANDLE_PATTERN_COLUMNS_V01.values()))
+        for col, function_name in CANDLE_PATTERN_COLUMNS_V01.items():
+            df[col] = patterns[function_name]
+    else:
+        for col, function_name in CANDLE_PATTERN_COLUMNS_V01.items():
+            df[col] = getattr(ta, function_name)(df)
     return df
 
 def apply_technicals_v04_full(df:pd.DataFrame) -> pd.DataFrame:
     df['rsi'] = ta.RSI(df, timeperiod=14)
-    df['rsi_trend'] = df['rsi'].rolling(10).apply(linregress_trend)
+    df['rsi_trend'] = rolling_linregress_trend(df['rsi'], 10)
     df['ema10'] = ta.EMA(df, timeperiod=10)
     df['ema20'] = ta.EMA(df, timeperiod=21)
     df['sma50'] = ta.SMA(df, timeperiod=50)
@@ -230,7 +561,7 @@ def apply_technicals_v04_full(df:pd.DataFrame) -> pd.DataFrame:
 
 def apply_technicals_v04_update(df:pd.DataFrame) -> pd.DataFrame:
     df['rsi'] = ta.RSI(df, timeperiod=14)
-    df.loc[df.index[-1], 'rsi_trend'] = linregress_trend(df.iloc[-10:]['rsi'])
+    df.loc[df.index[-1], 'rsi_trend'] = rolling_linregress_trend(df.iloc[-10:]['rsi'], 10)[-1]
     df['ema10'] = ta.EMA(df, timeperiod=10)
     df['ema20'] = ta.EMA(df, timeperiod=21)
     df['sma50'] = ta.SMA(df, timeperiod=50)
@@ -251,50 +582,99 @@ def apply_technicals_v04_update(df:pd.DataFrame) -> pd.DataFrame:
     df['stochrsi_fastd'] = stochrsi.fastd
     return df
 
+def apply_lookahead_label(df:pd.DataFrame) -> pd.DataFrame:
+    # mean close of the next LOOKAHEAD_WINDOW candles in percent of the current close
+    future_ma = df['close'].rolling(LOOKAHEAD_WINDOW).mean().shift(-LOOKAHEAD_WINDOW)
+    df[LABEL_COL] = (future_ma / df['close'] - 1.) * 100.
+    return df
+
 def create_dfml(df:pd.DataFrame, mode:str, ignored_columns:list=[]) -> pd.DataFrame:
     dfml = df.loc[:, [col not in ignored_columns for col in df.columns]].copy()
     if mode == 'v01':
-        dfml['open'] = (dfml['open'] / dfml['close'] - 1.) * 100.
-        dfml['high'] = (dfml['high'] / dfml['close'] - 1.) * 100.
-        dfml['low'] = (dfml['low'] / dfml['close'] - 1.) * 100.
-        dfml['sma10'] = (dfml['sma10'] / dfml['close'] - 1.) * 100.
-        dfml['sma20'] = (dfml['sma20'] / dfml['close'] - 1.) * 100.
-        dfml['sma50'] = (dfml['sma50'] / dfml['close'] - 1.) * 100.
-        dfml['sma100'] = (dfml['sma100'] / dfml['close'] - 1.) * 100.
-        dfml['sma200'] = (dfml['sma200'] / dfml['close'] - 1.) * 100.
-        dfml['sma500'] = (dfml['sma500'] / dfml['close'] - 1.) * 100.
-        dfml['sma1000'] = (dfml['sma1000'] / dfml['close'] - 1.) * 100.
-        dfml['ema5'] = (dfml['ema5'] / dfml['close'] - 1.) * 100.
-        dfml['ema10'] = (dfml['ema10'] / dfml['close'] - 1.) * 100.
-        dfml['ema21'] = (dfml['ema21'] / dfml['close'] - 1.) * 100.
-        dfml['ema34'] = (dfml['ema34'] / dfml['close'] - 1.) * 100.
-        dfml['std'] = (dfml['std'] / dfml['close'] - 1.) * 100.
-        dfml['atr'] = (dfml['atr'] / dfml['close'] - 1.) * 100.
+        for col in DFML_PCT_OF_CLOSE_COLUMNS_V01:
+            dfml[col] = (dfml[col] / dfml['close'] - 1.) * 100.
     elif mode == 'v04':
-        dfml['open'] = dfml['open'] / dfml['close'] - 1.
-        dfml['high'] = dfml['high'] / dfml['close'] - 1.
-        dfml['low'] = dfml['low'] / dfml['close'] - 1.
-        dfml['ema10'] = dfml['ema10'] / dfml['close'] - 1.
-        dfml['ema20'] = dfml['ema20'] / dfml['close'] - 1.
-        dfml['sma50'] = dfml['sma50'] / dfml['close'] - 1.
-        dfml['sma100'] = dfml['sma100'] / dfml['close'] - 1.
-        dfml['sma200'] = dfml['sma200'] / dfml['close'] - 1.
-        dfml['sma500'] = dfml['sma500'] / dfml['close'] - 1.
-        dfml['sma1000'] = dfml['sma1000'] / dfml['close'] - 1.
-        dfml['std20'] = dfml['std20'] / dfml['close']
-        dfml['atr10'] = dfml['atr10'] / dfml['close']
-        dfml['atr100'] = dfml['atr100'] / dfml['close']
-        dfml['keltner_upper'] = dfml['keltner_upper'] / dfml['close'] - 1.
-        dfml['keltner_lower'] = dfml['keltner_lower'] / dfml['close'] - 1.
-        normalized_columns = [
-            'volume',
-            'taker_buy_base_vol'
-        ]
-        mean_dict = {'volume': 1883.2653201563026, 'taker_buy_base_vol': 943.0650478388751}
-        std_dict = {'volume': 2056.6755264848543, 'taker_buy_base_vol': 1011.2795091423222}
-        for col in normalized_columns:
-            dfml[col] = (dfml[col] - mean_dict[col]) / std_dict[col]
+        for col in DFML_RATIO_CHANGE_COLUMNS_V04:
+            dfml[col] = dfml[col] / dfml['close'] - 1.
+        for col in DFML_RATIO_COLUMNS_V04:
+            dfml[col] = dfml[col] / dfml['close']
+        for col in DFML_NORMALIZED_COLUMNS_V04:
+            dfml[col] = (dfml[col] - DFML_MEAN_DICT_V04[col]) / DFML_STD_DICT_V04[col]
     else:
         raise ValueError('Unknown mode encountered in create_dfml')
     dfml.drop('close', axis=1, inplace=True)
     return dfml
+
+class FeaturePlan:
+    """
+    create_dfml compiled against a fixed column layout: column positions and
+    transforms are resolved once, transform() only touches the rows passed in;
+    extra_transforms maps further columns (e.g. higher timeframe features) to one
+    of the transforms
+    """
+    def __init__(
+        self,
+        columns: list,
+        mode: str,
+        ignored_columns: list = [],
+        output_columns: Union[list, None] = None,
+        dtype: type = np.float64,
+        extra_transforms: Union[dict, None] = None
+    ) -> None:
+        columns = list(columns)
+        positions = {col: i for i, col in enumerate(columns)}
+        available_columns = [col for col in columns if col not in ignored_columns and col != 'close']
+        if output_columns is None:
+            output_columns = available_columns
+        missing_columns = [col for col in output_columns if col not in available_columns]
+        if missing_columns:
+            raise ValueError('Feature plan is missing columns: {:s}'.format(', '.join(missing_columns)))
+        self.mode = mode
+        self.columns = list(output_columns)
+        self.dtype = dtype
+        self.close_position = positions['close']
+        
+        if mode == 'v01':
+            transforms = {col: 'pct_change' for col in DFML_PCT_OF_CLOSE_COLUMNS_V01}
+        elif mode == 'v04':
+            transforms = {col: 'ratio_change' for col in DFML_RATIO_CHANGE_COLUMNS_V04}
+            transforms.update({col: 'ratio' for col in DFML_RATIO_COLUMNS_V04})
+            transforms.update({col: 'zscore' for col in DFML_NORMALIZED_COLUMNS_V04})
+        else:
+            raise ValueError('Unknown mode encountered in FeaturePlan')
+        if extra_transforms is not None:
+            transforms.update(extra_transforms)
+        
+        groups = dict()
+        for output_position, col in enumerate(self.columns):
+            group = groups.setdefault(transforms.get(col, 'identity'), ([], [], []))
+            group[0].append(output_position)
+            group[1].append(positions[col])
+            group[2].append(col)
+        self.groups = list()
+        for transform, (output_positions, input_positions, group_columns) in groups.items():
+            if transform == 'zscore':
+                params = (
+                    np.array([DFML_MEAN_DICT_V04[col] for col in group_columns]),
+                    np.array([DFML_STD_DICT_V04[col] for col in group_columns])
+                )
+            else:
+                params = None
+            self.groups.append((transform, np.array(output_positions), np.array(input_positions), params))
+    
+    def transform(self, values:np.ndarray, out:Union[np.ndarray, None]=None) -> np.ndarray:
+        if out is None:
+            out = np.empty((values.shape[0], len(self.columns)), dtype=self.dtype)
+        close = values[:, self.close_position, np.newaxis]
+        for transform, output_positions, input_positions, params in self.groups:
+            x = values[:, input_positions]
+            if transform == 'pct_change':
+                x = (x / close - 1.) * 100.
+            elif transform == 'ratio_change':
+                x = x / close - 1.
+            elif transform == 'ratio':
+                x = x / close
+            elif transform == 'zscore':
+                x = (x - params[0]) / params[1]
+            out[:, output_positions] = x
+        return out
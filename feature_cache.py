@@ -0,0 +1,182 @@
+import os
+import json
+import pickle
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+from typing import Union
+from persistence import WriteBehind, atomic_write
+import stream_technicals
+from df_utils import ta, apply_technicals_v04_full
+from stream_technicals import TechnicalsV04Stream, TECHNICALS_V04_COLUMNS
+from candle_buffer import CandleBuffer, datetime_index_to_open_times
+from config import DATAFRAME_LENGTH
+
+FEATURE_CACHE_VERSION = 1
+# raw columns the indicators are computed from, compared at the last cached candle
+SOURCE_COLUMNS = ['high', 'low', 'close']
+
+def technicals_definition_hash(mode:str) -> str:
+    # any change to the indicator code or the TA backend invalidates the cache
+    if mode != 'v04':
+        raise ValueError('Unknown mode encountered in technicals_definition_hash')
+    h = hashlib.sha256()
+    h.update('{:d} {:s} {:s}'.format(FEATURE_CACHE_VERSION, mode, ta.__name__).encode('utf-8'))
+    h.update(inspect.getsource(stream_technicals).encode('utf-8'))
+    h.update(inspect.getsource(apply_technicals_v04_full).encode('utf-8'))
+    return h.hexdigest()
+
+class FeatureCache:
+    """
+    technicals of the candle frame saved next to the raw candles: a memory-mapped
+    .npy feature matrix, the pickled TechnicalsV04Stream and a json file with the
+    mode, the definition hash and the last candle time; on startup only the candles
+    after the last cached one are pushed through the restored stream
+    """
+    def __init__(self, path:str, mode:str='v04', min_rows:int=DATAFRAME_LENGTH) -> None:
+        self.path = path
+        self.mode = mode
+        self.min_rows = min_rows
+        self.definition_hash = technicals_definition_hash(mode)
+        self.columns = list(TECHNICALS_V04_COLUMNS)
+        self.engine = None
+    
+    @property
+    def meta_path(self) -> str:
+        return self.path + '.json'
+    
+    @property
+    def features_path(self) -> str:
+        return self.path + '.npy'
+    
+    @property
+    def open_times_path(self) -> str:
+        return self.path + '.open_times.npy'
+    
+    @property
+    def engine_path(self) -> str:
+        return self.path + '.state.pkl'
+    
+    def load(self) -> Union[tuple, None]:
+        # (metadata, open times, memory-mapped features, engine) or None if missing or stale
+        try:
+            with open(self.meta_path, 'r') as fh:
+                meta = json.load(fh)
+            if (
+                meta['version'] != FEATURE_CACHE_VERSION or
+                meta['mode'] != self.mode or
+                meta['definition_hash'] != self.definition_hash or
+                meta['columns'] != self.columns
+            ):
+                return None
+            open_times = np.load(self.open_times_path)
+            features = np.load(self.features_path, mmap_mode='r')
+            with open(self.engine_path, 'rb') as fh:
+                engine = pickle.load(fh)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            return None
+        if (
+            open_times.shape[0] == 0 or
+            features.shape != (open_times.shape[0], len(self.columns)) or
+            int(open_times[-1]) != meta['last_open_time']
+        ):
+            return None
+        return meta, open_times, features, engine
+    
+    def save(self, df:pd.DataFrame, engine:TechnicalsV04Stream, writer:Union[WriteBehind, None]=None) -> None:
+        self.save_arrays(
+            datetime_index_to_open_times(df.index),
+            df.loc[:, self.columns].to_numpy(dtype=np.float64, copy=True),
+            [float(x) for x in df.iloc[-1].loc[SOURCE_COLUMNS]],
+            engine,
+            writer
+        )
+    
+    def save_buffer(self, candles:CandleBuffer, engine:TechnicalsV04Stream, writer:Union[WriteBehind, None]=None) -> None:
+        # straight from the ring buffer, without building a DataFrame on the tick path
+        positions = [candles.column_positions[col] for col in self.columns]
+        self.save_arrays(
+            candles.open_times().copy(),
+            candles.tail()[:, positions],
+            [candles.last(col) for col in SOURCE_COLUMNS],
+            engine,
+            writer
+        )
+    
+    def save_arrays(
+        self,
+        open_times: np.ndarray,
+        features: np.ndarray,
+        last_candle: list,
+        engine: TechnicalsV04Stream,
+        writer: Union[WriteBehind, None] = None
+    ) -> None:
+        # the arrays must not be modified afterwards, they are written by the writer thread if one is given
+        engine_state = pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            'version': FEATURE_CACHE_VERSION,
+            'mode': self.mode,
+            'definition_hash': self.definition_hash,
+            'columns': self.columns,
+            'last_open_time': int(open_times[-1]),
+            'last_candle': [float(x) for x in last_candle],
+            'n_rows': int(open_times.shape[0])
+        }
+        
+        def write() -> None:
+            # the metadata is replaced last, a cache torn by a crash doesn't validate
+            if os.path.exists(self.meta_path):
+                os.remove(self.meta_path)
+            atomic_write(self.features_path, lambda fh: np.save(fh, features))
+            atomic_write(self.open_times_path, lambda fh: np.save(fh, open_times))
+            atomic_write(self.engine_path, engine_state)
+            atomic_write(self.meta_path, json.dumps(meta, indent=2).encode('utf-8'))
+        
+        if writer is None:
+            write()
+        else:
+            writer.submit(self.path, write)
+    
+    def apply(self, df:pd.DataFrame, save:bool=True) -> pd.DataFrame:
+        # drop-in for apply_technicals_v04_full that leaves the seeded stream in self.engine;
+        # rows before the first cached candle are cut off as long as min_rows remain
+        cached = self.load()
+        open_times = datetime_index_to_open_times(df.index)
+        position = -1
+        if cached is not None:
+            meta, cached_open_times, features, engine = cached
+            position = int(np.searchsorted(open_times, meta['last_open_time']))
+            overlap_start = max(int(open_times[0]), int(cached_open_times[0]))
+            start = int(np.searchsorted(open_times, overlap_start))
+            first = int(np.searchsorted(cached_open_times, overlap_start))
+            if (
+                position == open_times.shape[0] or
+                open_times[position] != meta['last_open_time'] or
+                df.iloc[position].loc[SOURCE_COLUMNS].tolist() != meta['last_candle'] or
+                open_times.shape[0] - start < min(self.min_rows, open_times.shape[0]) or
+                not np.array_equal(cached_open_times[first:], open_times[start:position + 1])
+            ):
+                position = -1
+        
+        if position < 0:
+            print('computing technicals...', end=' ', flush=True)
+            df = apply_technicals_v04_full(df)
+            self.engine = TechnicalsV04Stream()
+            self.engine.seed(df)
+        else:
+            n_new = open_times.shape[0] - position - 1
+            print('loading cached technicals, computing {:d} new rows...'.format(n_new), end=' ', flush=True)
+            df = df.iloc[start:].copy()
+            position -= start
+            values = np.empty((df.shape[0], len(self.columns)))
+            values[:position + 1] = features[first:]
+            for i, tick in enumerate(df.iloc[position + 1:].loc[:, SOURCE_COLUMNS].to_dict('records')):
+                row = engine.update(tick)
+                values[position + 1 + i] = [row[col] for col in self.columns]
+            df[self.columns] = values
+            self.engine = engine
+        print('done', flush=True)
+        if save:
+            self.save(df, self.engine)
+        return df
@@ -0,0 +1,201 @@
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from collections import Counter, OrderedDict, defaultdict
+from typing import Union
+from binance.client import Client
+from latency import LatencyRecorder, DEFAULT_BUCKETS_MS
+from rate_limits import RateLimitScheduler, request_params
+from persistence import atomic_write
+from bot_utils import get_timestamp
+from config import (
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_GET_RETRIES,
+    HTTP_LATENCY_SAMPLES,
+    HTTP_STATS_PATH
+)
+
+class EndpointStats:
+    """
+    latency, request, retry and error counts per endpoint ('GET /api/v3/order'),
+    written by every thread using the shared sessions
+    """
+    def __init__(self, maxlen:Union[int, None]=HTTP_LATENCY_SAMPLES) -> None:
+        self.maxlen = maxlen
+        self.__lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        with self.__lock:
+            self.latency = LatencyRecorder(self.maxlen)
+            self.requests = Counter()
+            self.retries = Counter()
+            self.errors = defaultdict(Counter)
+    
+    @property
+    def n_requests(self) -> int:
+        return sum(self.requests.values())
+    
+    def record(self, endpoint:str, seconds:float, error:Union[str, None]=None, retries:int=0) -> None:
+        with self.__lock:
+            self.latency.record(endpoint, seconds)
+            self.requests[endpoint] += 1
+            if retries:
+                self.retries[endpoint] += retries
+            if error is not None:
+                self.errors[endpoint][error] += 1
+    
+    def summary(self) -> dict:
+        with self.__lock:
+            latency = self.latency.summary()
+            summary = OrderedDict()
+            for endpoint, stats in latency.items():
+                stats['requests'] = self.requests[endpoint]  # count only covers the kept samples
+                stats['retries'] = self.retries[endpoint]
+                stats['errors'] = dict(self.errors[endpoint])
+                summary[endpoint] = stats
+            return summary
+    
+    def histogram(self, buckets_ms:tuple=DEFAULT_BUCKETS_MS) -> dict:
+        with self.__lock:
+            return self.latency.histogram(buckets_ms)
+    
+    def to_json(self, path:str, buckets_ms:tuple=DEFAULT_BUCKETS_MS) -> None:
+        report = OrderedDict([
+            ('metadata', {'written': get_timestamp(), 'samples_per_endpoint': self.maxlen}),
+            ('endpoints', self.summary()),
+            ('buckets_ms', list(buckets_ms)),
+            ('histogram', self.histogram(buckets_ms))
+        ])
+        atomic_write(path, json.dumps(report, indent=2).encode('utf-8'), fsync=False)
+
+class InstrumentedSession(requests.Session):
+    """
+    requests.Session timing every request, the retries done by the adapter
+    included, into an EndpointStats; exceptions and HTTP error statuses are
+    counted as errors of the endpoint; with a scheduler every request is admitted
+    by it first and reports the rate limit headers of its response back
+    """
+    def __init__(
+        self,
+        adapter: HTTPAdapter,
+        stats: EndpointStats,
+        timeout: tuple,
+        scheduler: Union[RateLimitScheduler, None] = None
+    ) -> None:
+        super().__init__()
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.stats = stats
+        self.timeout = timeout
+        self.scheduler = scheduler
+    
+    def request(self, method, url, **kwargs) -> requests.Response:
+        if kwargs.get('timeout', None) is None:
+            kwargs['timeout'] = self.timeout
+        method = method.upper()
+        path = urlparse(url).path
+        endpoint = '{:s} {:s}'.format(method, path)
+        if self.scheduler is not None:
+            params = request_params(kwargs.get('params', None))
+            coalesced = self.scheduler.acquire(method, path, params)
+            if coalesced is not None:
+                return coalesced
+        t0 = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception as e:
+            self.stats.record(endpoint, time.perf_counter() - t0, error=type(e).__name__)
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        self.stats.record(
+            endpoint,
+            time.perf_counter() - t0,
+            error = 'HTTP {:d}'.format(response.status_code) if response.status_code >= 400 else None,
+            retries = len(retries.history) if retries is not None else 0
+        )
+        if self.scheduler is not None:
+            self.scheduler.update(method, path, params, response)
+        return response
+
+def make_adapter(pool_size:int=HTTP_POOL_SIZE, get_retries:int=HTTP_GET_RETRIES) -> HTTPAdapter:
+    # connection errors happen before anything was sent and are retried for every
+    # method, read errors and 5xx responses only for GET; 418/429 are left to the caller
+    retry = Retry(
+        total = get_retries,
+        connect = get_retries,
+        read = get_retries,
+        status = get_retries,
+        other = 0,
+        allowed_methods = frozenset(['GET']),
+        status_forcelist = (500, 502, 503, 504),
+        backoff_factor = 0.2,
+        raise_on_status = False,
+        respect_retry_after_header = False
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+http_stats = EndpointStats()
+http_adapter = make_adapter()
+rate_limiter = RateLimitScheduler()
+sessions = dict()  # api key -> InstrumentedSession, all on http_adapter
+sessions_lock = threading.Lock()
+
+def get_session(api_key:Union[str, None]=None) -> InstrumentedSession:
+    # one session per API key since the key is a session header, the connection pool and rate limits are shared
+    with sessions_lock:
+        if api_key not in sessions:
+            session = InstrumentedSession(
+                http_adapter,
+                http_stats,
+                (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                scheduler = rate_limiter
+            )
+            session.headers.update({'Accept': 'application/json', 'User-Agent': 'binance/python'})
+            if api_key:
+                session.headers['X-MBX-APIKEY'] = api_key
+            sessions[api_key] = session
+        return sessions[api_key]
+
+class PooledClient(Client):
+    """
+    binance Client on the shared session of its API key with the configured
+    connect and read timeouts instead of the fixed 10 s of Client._request
+    """
+    def __init__(self, api_key=None, api_secret=None, requests_params=None, **kwargs) -> None:
+        if requests_params is None:
+            requests_params = {'timeout': (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)}
+        super().__init__(api_key, api_secret, requests_params, **kwargs)
+    
+    def _init_session(self) -> requests.Session:
+        return get_session(self.API_KEY)
+
+def format_http_stats(stats:EndpointStats=http_stats) -> str:
+    lines = list()
+    for endpoint, s in stats.summary().items():
+        lines.append('{:s}: {:d} calls, p50 {:.0f} ms, p95 {:.0f} ms, max {:.0f} ms{:s}{:s}'.format(
+            endpoint,
+            s['requests'],
+            s['p50_ms'],
+            s['p95_ms'],
+            s['max_ms'],
+            ', {:d} retries'.format(s['retries']) if s['retries'] else '',
+            ', errors {:s}'.format(', '.join('{:s} x{:d}'.format(k, v) for k, v in s['errors'].items())) if s['errors'] else ''
+        ))
+    return '\n'.join(lines) if lines else 'No requests recorded'
+
+def dump_http_stats(path:str=HTTP_STATS_PATH) -> bool:
+    if http_stats.n_requests == 0:
+        return False
+    try:
+        http_stats.to_json(path)
+        return True
+    except Exception as e:
+        print(get_timestamp(), 'http stats: {:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+        return False
@@ -0,0 +1,104 @@
+import time
+import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+from binance.helpers import date_to_milliseconds, interval_to_milliseconds
+from http_session import get_session
+from rate_limits import DEFAULT_RETRY_AFTER
+from config import (
+    BINANCE_API_URL,
+    KLINE_DOWNLOAD_WORKERS
+)
+
+KLINES_ENDPOINT = '/api/v3/klines'
+KLINES_LIMIT = 1000
+MAX_RETRIES = 5
+# payload positions of open, high, low, close, volume, quote asset volume, number of
+# trades, taker buy base and quote asset volume (the order of DATA_COLUMNS)
+KLINE_VALUE_FIELDS = [1, 2, 3, 4, 5, 7, 8, 9, 10]
+
+def to_milliseconds(t:Union[int, str]) -> int:
+    return t if isinstance(t, int) else date_to_milliseconds(t)
+
+def parse_klines(klines:list) -> tuple:
+    # int64 open times and float64 values of a raw klines payload in one pass
+    if len(klines) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(KLINE_VALUE_FIELDS)))
+    raw = np.array(klines, dtype=object)
+    return raw[:, 0].astype(np.int64), raw[:, KLINE_VALUE_FIELDS].astype(np.float64)
+
+class KlineDownloader:
+    """
+    fetches [start, end] as interval aligned windows of KLINES_LIMIT candles in
+    parallel over the shared pooled HTTP session and merges them in chronological order;
+    the RateLimitScheduler of the session paces the requests against the request weight,
+    a session without one sleeps for Retry-After on 418 and 429 itself
+    """
+    def __init__(
+        self,
+        base_url: str = BINANCE_API_URL,
+        max_workers: int = KLINE_DOWNLOAD_WORKERS,
+        session: Union[requests.Session, None] = None,
+        timeout: float = 10.
+    ) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = session if session is not None else get_session()
+    
+    def get_klines(self, symbol:str, interval:str, limit:int=KLINES_LIMIT, **params) -> list:
+        params.update({'symbol': symbol, 'interval': interval, 'limit': limit})
+        for _ in range(MAX_RETRIES):
+            response = self.session.get(self.base_url + KLINES_ENDPOINT, params=params, timeout=self.timeout)
+            if response.status_code in (418, 429):
+                # a scheduled session holds the retry back until Retry-After, any other has to wait here
+                if getattr(self.session, 'scheduler', None) is None:
+                    time.sleep(float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER)))
+                continue
+            response.raise_for_status()
+            return response.json()
+        raise requests.HTTPError('Klines request still rate limited after {:d} attempts'.format(MAX_RETRIES))
+    
+    def earliest_open_time(self, symbol:str, interval:str) -> int:
+        klines = self.get_klines(symbol, interval, limit=1, startTime=0)
+        return klines[0][0] if klines else 0
+    
+    def windows(self, interval:str, start_ms:int, end_ms:int) -> list:
+        interval_ms = interval_to_milliseconds(interval)
+        first = -(-start_ms // interval_ms) * interval_ms
+        step = KLINES_LIMIT * interval_ms
+        return [(t, min(t + step - 1, end_ms)) for t in range(first, end_ms + 1, step)]
+    
+    def download(
+        self,
+        symbol: str,
+        interval: str,
+        start: Union[int, str],
+        end: Union[int, str, None] = None
+    ) -> list:
+        # same rows as Client.get_historical_klines: open times from start to end inclusive
+        start_ms = max(to_milliseconds(start), self.earliest_open_time(symbol, interval))
+        end_ms = to_milliseconds(end) if end is not None else int(time.time() * 1000)
+        windows = self.windows(interval, start_ms, end_ms)
+        if not windows:
+            return list()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(windows))) as executor:
+            results = executor.map(
+                lambda window: self.get_klines(symbol, interval, startTime=window[0], endTime=window[1]),
+                windows
+            )
+            merged = dict()
+            for klines in results:
+                for kline in klines:
+                    merged[kline[0]] = kline
+        return [merged[open_time] for open_time in sorted(merged)]
+
+def download_klines(
+    symbol: str,
+    interval: str,
+    start: Union[int, str],
+    end: Union[int, str, None] = None,
+    **kwargs
+) -> list:
+    return KlineDownloader(**kwargs).download(symbol, interval, start, end)
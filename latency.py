@@ -0,0 +1,90 @@
+import json
+import time
+import numpy as np
+from collections import OrderedDict, deque
+from typing import Union
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class LatencyRecorder:
+    """
+    wall clock durations of the stages of a repeatedly executed code path;
+    lap() only records between start() and stop(), so it can sit on shared code
+    """
+    def __init__(self, maxlen:Union[int, None]=None) -> None:
+        self.maxlen = maxlen
+        self.reset()
+    
+    def reset(self) -> None:
+        self.samples = OrderedDict()
+        self.__run = None
+        self.__run_start = None
+        self.__lap_start = None
+    
+    @property
+    def active(self) -> bool:
+        return self.__run is not None
+    
+    def start(self) -> None:
+        self.__run = OrderedDict()
+        self.__run_start = self.__lap_start = time.perf_counter()
+    
+    def lap(self, stage:str) -> None:
+        # time since the previous lap; repeated stages within one run are summed
+        if self.__run is None:
+            return
+        now = time.perf_counter()
+        self.__run[stage] = self.__run.get(stage, 0.) + now - self.__lap_start
+        self.__lap_start = now
+    
+    def stop(self, stage:str='total') -> None:
+        if self.__run is None:
+            return
+        self.__run[stage] = time.perf_counter() - self.__run_start
+        for run_stage, seconds in self.__run.items():
+            self.record(run_stage, seconds)
+        self.__run = self.__run_start = self.__lap_start = None
+    
+    def record(self, stage:str, seconds:float) -> None:
+        if stage not in self.samples:
+            self.samples[stage] = deque(maxlen=self.maxlen)
+        self.samples[stage].append(seconds)
+    
+    def summary(self, percentiles:tuple=DEFAULT_PERCENTILES) -> dict:
+        # milliseconds per stage, stages in order of first appearance
+        summary = OrderedDict()
+        for stage, samples in self.samples.items():
+            values = 1e3 * np.fromiter(samples, float, len(samples))
+            stats = OrderedDict([('count', len(values)), ('mean_ms', float(values.mean()))])
+            for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats['p{:g}_ms'.format(p)] = float(value)
+            stats['max_ms'] = float(values.max())
+            summary[stage] = stats
+        return summary
+    
+    def histogram(self, buckets_ms:tuple=DEFAULT_BUCKETS_MS) -> dict:
+        # samples per stage below each bucket bound in ms, the last count is above all of them
+        edges = np.concatenate([[-np.inf], np.asarray(buckets_ms, float), [np.inf]])
+        histogram = OrderedDict()
+        for stage, samples in self.samples.items():
+            values = 1e3 * np.fromiter(samples, float, len(samples))
+            histogram[stage] = [int(n) for n in np.histogram(values, edges)[0]]
+        return histogram
+    
+    def to_json(
+        self,
+        path: str,
+        metadata: Union[dict, None] = None,
+        percentiles: tuple = DEFAULT_PERCENTILES,
+        buckets_ms: Union[tuple, None] = None
+    ) -> None:
+        report = OrderedDict()
+        if metadata is not None:
+            report['metadata'] = metadata
+        report['stages'] = self.summary(percentiles)
+        if buckets_ms is not None:
+            report['buckets_ms'] = list(buckets_ms)
+            report['histogram'] = self.histogram(buckets_ms)
+        with open(path, 'w', newline='\n') as fh:
+            json.dump(report, fh, indent=2)
@@ -1,16 +1,20 @@
 print('initializing...', flush=True)
 
+import os
 import pandas as pd
 import numpy as np
 import datetime as dt
 import joblib
 import time
 import sys
+import atexit
+from typing import Union
 import telegram_interface as tg  # import whole module to avoid circular reference breaking everything
 from twisted.internet import reactor
 from xgboost import XGBRegressor
 from binance.websockets import BinanceSocketManager
-from binance_interface import tsm
+from binance.helpers import interval_to_milliseconds
+from binance_interface import tsm, TradeStateMachine, quote_allocation
 from bot_utils import (
     BUY_TYPE,
     SELL_TYPE,
@@ -24,22 +28,44 @@ from bot_utils import (
     print_exception_and_shutdown
 )
 from df_utils import (
-    dfpickle,
     create_dataframe,
-    create_dfml,
     apply_technicals_v01,
-    apply_technicals_v04_update
+    FeaturePlan
+)
+from stream_technicals import TechnicalsV04Stream
+from feature_cache import FeatureCache
+from timeframes import MultiTimeframeAggregator
+from candle_buffer import CandleBuffer, open_time_index, datetime_index_to_open_times
+from candle_store import CandleStore, migrate_pickle
+from latency import LatencyRecorder
+from user_stream import UserDataStream
+from persistence import write_behind
+from order_executor import order_executor
+from http_session import dump_http_stats
+from prediction import (
+    PredictionCache,
+    PredictionEWM,
+    InplacePredictor,
+    model_identity,
+    model_feature_names
 )
 from config import (
-    QTY_DEC_PLACES,
-    PRICE_DEC_PLACES,
-    SYMBOL,
     INTERVAL,
     DATAFRAME_LENGTH,
     DATA_PATH,
-    TIMEZONE_OBJ,
+    CANDLE_STORE_PATH,
+    FEATURE_CACHE_PATH,
+    FEATURE_CACHE_SAVE_INTERVAL,
+    HIGHER_TIMEFRAMES,
+    TIMEFRAME_WARMUP_CANDLES,
+    MULTI_SYMBOL_PAIRS,
+    STATE_FILE_PATH_FORMAT,
+    CANDLE_STORE_PATH_FORMAT,
+    FEATURE_CACHE_PATH_FORMAT,
     N_ROWS_TO_PREDICT,
     PREDICTION_MA_WINDOW,
+    PREDICTION_CACHE_SIZE,
+    TICK_LATENCY_SAMPLES,
     SIGNAL_THRESHOLD,
     SL_ATR_FACTOR,
     SL_PCT_OFFSET,
@@ -47,6 +73,7 @@ from config import (
     SHADOW_LIMIT_ENABLED,
     DELTA_DECAY_FACTOR,
     TICKS_BETWEEN_ORDER_UPDATES,
+    USER_STREAM_ENABLED,
     DATA_COLUMNS,
     IGNORED_COLUMNS,
     SL_BASE_COL,
@@ -66,9 +93,46 @@ else:
     else:
         raise ValueError('Unknown mode encountered during initialization')
 
-def process_message(msg: dict) -> None:
-    global df, tick_counter, last_order_update_tick
-    tick_counter += 1
+class SymbolContext:
+    """
+    per-pair state of the bot; the model, feature plan, predictor and client
+    are shared by all pairs
+    """
+    def __init__(self, state_machine:TradeStateMachine, candle_store_path:str, feature_cache_path:str) -> None:
+        self.tsm = state_machine
+        self.symbol = state_machine.symbol
+        self.candle_store_path = candle_store_path
+        self.feature_cache_path = feature_cache_path
+        self.candles = None
+        self.technicals = None
+        self.candle_store = None
+        self.feature_cache = None
+        self.timeframes = None
+        self.prediction_cache = PredictionCache(None, PREDICTION_CACHE_SIZE)
+        self.prediction_ewm = PredictionEWM(1./PREDICTION_MA_WINDOW, N_ROWS_TO_PREDICT, PREDICTION_MA_WINDOW)
+        self.tick_counter = 0
+        self.last_order_update_tick = -1
+        self.closing_tick_counter = 0
+        # handed from the tick handler to the order commands on order_executor
+        self.last_kline = None
+        self.last_candle = None
+        self.order_command = None
+        self.order_poll_tick = None  # set by the tick handler, order_poll_done by the command handling it
+        self.order_poll_done = None
+
+def dispatch_message(msg:dict) -> None:
+    # combined stream messages wrap the kline event, anything else goes to the main pair
+    data = msg.get('data', msg)
+    ctx = contexts_by_symbol.get(data.get('s', None), contexts[0])
+    process_message(data, ctx)
+
+def process_message(msg:dict, ctx:Union[SymbolContext, None]=None) -> None:
+    # market data is handled here, everything touching orders or balances is queued on order_executor
+    if ctx is None:
+        ctx = contexts[0]
+    tsm = ctx.tsm
+    candles = ctx.candles
+    ctx.tick_counter += 1
     
     try:
         tsm.last_price = float(msg['k']['c'])
@@ -86,167 +150,101 @@ def process_message(msg: dict) -> None:
         reactor.stop()
         tg.updater.stop()
         sys.exit(0)
-    
-    if tsm.stoploss_order_active and float(msg['k']['l']) <= tsm.stoploss_level:
-        time_index = df.index[-1]
-        if SL_TIMEOUT_ENABLED and time_index >= tsm.stoploss_hit_timeout:
-            tsm.set_stoploss_hit_timeout(time_index)
-        tsm.check_and_process_order(STOPLOSS_TYPE, update_balances=True)
+    ctx.last_kline = msg['k']
     
     if msg['k']['x']:
-        sl_adjustment_req_flag = False
+        tick_latency.start()
+        ctx.closing_tick_counter += 1
+        tick = ctx.tick_counter
+        ctx.tick_counter = 1
         
-        if tick_counter != last_order_update_tick + 1:
-            if tsm.buy_order_active:
-                holdings_increased = tsm.check_and_process_order(BUY_TYPE)
-                if tsm.stoploss_enabled and holdings_increased:
-                    sl_adjustment_req_flag = True
-            elif tsm.sell_order_active:
-                tsm.check_and_process_order(SELL_TYPE)
-        
-        tick_counter = 1
-        df_ = df.iloc[-1000:].loc[:, DATA_COLUMNS].copy()
+        open_time = msg['k']['t']
+        new_tick = {
+            'open': float(msg['k']['o']),
+            'high': float(msg['k']['h']),
+            'low': float(msg['k']['l']),
+            'close': float(msg['k']['c']),
+            'volume': float(msg['k']['v']),
+            'quote_asset_vol': float(msg['k']['q']),
+            'no_of_trades': float(msg['k']['n']),
+            'taker_buy_base_vol': float(msg['k']['V']),
+            'taker_buy_quote_vol': float(msg['k']['Q'])
+        }
         
-        new_tick = pd.Series(
-            {
-                'open': msg['k']['o'],
-                'high': msg['k']['h'],
-                'low': msg['k']['l'],
-                'close': msg['k']['c'],
-                'volume': msg['k']['v'],
-                'quote_asset_vol': msg['k']['q'],
-                'no_of_trades': msg['k']['n'],
-                'taker_buy_base_vol': msg['k']['V'],
-                'taker_buy_quote_vol': msg['k']['Q']
-            },
-            name = dt.datetime.fromtimestamp(msg['k']['t'] // 1000),
-            dtype = 'float64'
-        )
+        if ctx.timeframes is not None:
+            new_tick.update(ctx.timeframes.update(open_time, new_tick))
+            tick_latency.lap('timeframes')
         
-        df_.index = df_.index.tz_localize(None)
-        df_ = df_.append(new_tick)
-        df_.index = df_.index.tz_localize(TIMEZONE_OBJ, ambiguous='infer')
         if tsm.mode == 'v01':
+            df_ = pd.concat([
+                candles.to_dataframe(1000, DATA_COLUMNS),
+                pd.DataFrame(new_tick, index=open_time_index([open_time]))
+            ])
+            tick_latency.lap('frame_update')
             df_ = apply_technicals_v01(df_)
+            tick_latency.lap('technicals')
+            candles.append(open_time, df_.iloc[-1])
+            tick_latency.lap('frame_update')
         elif tsm.mode == 'v04':
-            df_ = apply_technicals_v04_update(df_)
+            new_tick.update(ctx.technicals.update(new_tick))
+            tick_latency.lap('technicals')
+            candles.append(open_time, new_tick)
+            tick_latency.lap('frame_update')
         else:
             raise ValueError('Unknown mode encountered during dataframe update process')
+        previous_candle = ctx.last_candle
+        ctx.last_candle = candle_snapshot(candles)
         
-        df = df.append(df_.iloc[-1, :])
+        open_times = candles.open_times(N_ROWS_TO_PREDICT)
+        predictions, missing = ctx.prediction_cache.lookup(open_times)
+        if missing.any():
+            n_missing = int(missing.sum())
+            feature_plan.transform(candles.tail(N_ROWS_TO_PREDICT)[missing], out=predictor.buffer[:n_missing])
+            tick_latency.lap('dfml')
+            predictions[missing] = predictor.predict(n_missing)
+            ctx.prediction_cache.store(open_times[missing], predictions[missing])
+        prediction = predictions[-1]
+        prediction_ma = ctx.prediction_ewm.update(open_times, predictions)
+        tick_latency.lap('predict')
         
-        dfml = create_dfml(df, tsm.mode, IGNORED_COLUMNS)
-        dfml[Y_PRED_COL] = np.full(dfml.shape[0], np.nan)
-        index_end = dfml.index[-N_ROWS_TO_PREDICT:]
-        dfml.loc[index_end, Y_PRED_COL] = est.predict(
-            dfml.iloc[-N_ROWS_TO_PREDICT:, :].loc[
-                :,
-                [col not in [LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL] for col in dfml.columns]
-            ]
+        ctx.order_command = order_executor.submit(
+            closing_tick_orders,
+            ctx,
+            tick,
+            msg['k'],
+            previous_candle,
+            ctx.last_candle,
+            prediction_ma
         )
-        dfml[Y_PRED_MA_COL] = dfml[Y_PRED_COL].ewm(
-            alpha = 1./PREDICTION_MA_WINDOW,
-            min_periods = PREDICTION_MA_WINDOW
-        ).mean()
+        tick_latency.lap('order_submit')
         
         tg.notify_new_prediction(
-            df.iloc[-1]['high'],
-            df.iloc[-1]['low'],
-            df.iloc[-1]['close'],
-            dfml.iloc[-1][Y_PRED_COL],
-            dfml.iloc[-1][Y_PRED_MA_COL]
+            candles.last('high'),
+            candles.last('low'),
+            candles.last('close'),
+            prediction,
+            prediction_ma,
+            state_machine = tsm
         )
+        tick_latency.lap('notify')
         
-        df = df.iloc[-DATAFRAME_LENGTH:, :].copy()
-        dfpickle(df.loc[:, DATA_COLUMNS], DATA_PATH, print_timestamp=True)
+        candle_store = ctx.candle_store
+        write_behind.submit((ctx.candle_store_path, open_time), lambda: candle_store.append(open_time, new_tick))
+        tick_latency.lap('store')
         
-        if tsm.trading_enabled and not (
-            SL_TIMEOUT_ENABLED and df.index[-1] < tsm.stoploss_hit_timeout
-        ):
-            if tsm.position_open and tsm.stoploss_enabled:
-                sl_adjustment_req_flag = tsm.update_stoploss_level(
-                    df.iloc[-1][SL_BASE_COL],
-                    df.iloc[-1][ATR10_COL],
-                    SL_ATR_FACTOR,
-                    SL_PCT_OFFSET,
-                    override_condition = 'greater'
-                )
-            
-            if dfml.iloc[-1][Y_PRED_MA_COL] < -SIGNAL_THRESHOLD:
-                if tsm.buy_signal_flag:
-                    tsm.deactivate_buy_signal()
-                if tsm.buy_order_req_flag:
-                    tsm.buy_order_req_flag = False
-                if tsm.buy_order_active:
-                    tsm.cancel_buy_order()
-                if tsm.position_open and not (
-                    tsm.sell_order_active or
-                    tsm.sell_order_req_flag or
-                    tsm.sell_signal_flag
-                ):
-                    if tsm.stoploss_order_active:
-                        tsm.cancel_stoploss_order()
-                    elif tsm.stoploss_order_req_flag:
-                        tsm.stoploss_order_req_flag = False
-                    tsm.update_asset_balance()
-                    if SHADOW_LIMIT_ENABLED:
-                        tsm.activate_sell_signal(df.iloc[-1]['close'], df.iloc[-1][ATR10_COL])
-                    else:
-                        tsm.sell_order_req_flag = True
-                        tsm.sell_target_price = df.iloc[-1]['close']
-                    sl_adjustment_req_flag = False
-            
-            elif dfml.iloc[-1][Y_PRED_MA_COL] > SIGNAL_THRESHOLD:
-                if tsm.position_open and (
-                    tsm.sell_order_active or
-                    tsm.sell_order_req_flag or
-                    tsm.sell_signal_flag
-                ):
-                    if tsm.sell_signal_flag:
-                        tsm.deactivate_sell_signal()
-                    if tsm.sell_order_req_flag:
-                        tsm.sell_order_req_flag = False
-                    if tsm.sell_order_active:
-                        tsm.cancel_sell_order()
-                    if tsm.stoploss_enabled:
-                        tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
-                    sl_adjustment_req_flag = False
-                if not tsm.position_full and not (
-                    tsm.buy_order_active or
-                    tsm.buy_order_req_flag or
-                    tsm.buy_signal_flag
-                ):
-                    tsm.update_quote_asset_balance()
-                    if SHADOW_LIMIT_ENABLED:
-                        tsm.activate_buy_signal(df.iloc[-1]['close'], df.iloc[-1][ATR10_COL])
-                    else:
-                        tsm.buy_order_req_flag = True
-                        tsm.buy_target_price = df.iloc[-1]['close']
-                    if tsm.position_open and tsm.stoploss_enabled and not sl_adjustment_req_flag:
-                        sl_adjustment_req_flag = tsm.update_stoploss_level(
-                            df.iloc[-1][SL_BASE_COL],
-                            df.iloc[-1][ATR10_COL],
-                            SL_ATR_FACTOR,
-                            SL_PCT_OFFSET,
-                            override_condition = 'not_equal'
-                        )
-            
-            if sl_adjustment_req_flag:
-                if tsm.stoploss_order_active:
-                    if tsm.stoploss_is_oco and tsm.sell_order_active:
-                        tsm.cancel_stoploss_order(alert=False)
-                        tsm.sell_order_req_flag = not tsm.sell_order_active
-                    else:
-                        tsm.cancel_stoploss_order(alert=False)
-                        tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
+        if ctx.feature_cache is not None and ctx.closing_tick_counter % FEATURE_CACHE_SAVE_INTERVAL == 0:
+            ctx.feature_cache.save_buffer(candles, ctx.technicals, write_behind)
+            tick_latency.lap('feature_cache')
         
         try:
             set_system_time_from_ntp(timeout=0.1)
         except Exception:
             pass
+        tick_latency.lap('time_sync')
+        tick_latency.stop()
     
     elif (  # dataframe outdated, kline closing tick missed
-        dt.datetime.fromtimestamp(msg['E'] // 1000, dt.timezone.utc) > df.index[-1] + dt.timedelta(hours=2)
+        dt.datetime.fromtimestamp(msg['E'] // 1000, dt.timezone.utc) > candles.last_time() + dt.timedelta(hours=2)
     ):
         ts = get_timestamp()
         tg_msg = 'Connection failed: missed last hourly closing tick'
@@ -258,24 +256,173 @@ def process_message(msg: dict) -> None:
         except Exception:
             print('failed')
         print(get_timestamp(), 'shutting down...\n', flush=True)
-        if tick_counter == 1: time.sleep(300)
+        if ctx.tick_counter == 1: time.sleep(300)
         reactor.stop()
         tg.updater.stop()
         sys.exit(0)
     
-    elif tick_counter % TICKS_BETWEEN_ORDER_UPDATES == 0 and (
-        tsm.buy_order_active or
-        tsm.sell_order_active
+    else:
+        if ctx.tick_counter % TICKS_BETWEEN_ORDER_UPDATES == 0:
+            ctx.order_poll_tick = ctx.tick_counter
+        # a command that has not started yet reads the newest kline when it does
+        command = ctx.order_command
+        if command is None or command.running() or command.done():
+            ctx.order_command = order_executor.submit(intra_candle_orders, ctx)
+
+def candle_snapshot(candles:CandleBuffer) -> dict:
+    # values of the last closed candle used by the order commands, replaced on every close
+    return {
+        'time': candles.last_time(),
+        'close': candles.last('close'),
+        'atr': candles.last(ATR10_COL),
+        'sl_base': candles.last(SL_BASE_COL)
+    }
+
+def check_stoploss_hit(tsm:TradeStateMachine, kline:dict, candle:dict) -> None:
+    # candle is the last one closed before the kline
+    if tsm.stoploss_order_active and float(kline['l']) <= tsm.stoploss_level:
+        time_index = candle['time']
+        if SL_TIMEOUT_ENABLED and time_index >= tsm.stoploss_hit_timeout:
+            tsm.set_stoploss_hit_timeout(time_index)
+        if not tsm.user_stream_live:
+            tsm.reconcile_and_process_orders(update_balances=True)
+
+def request_stoploss_order(tsm:TradeStateMachine) -> None:
+    if tsm.stoploss_enabled and tsm.position_open and not (
+        tsm.sell_order_active or
+        tsm.sell_order_req_flag or
+        tsm.sell_signal_flag or
+        tsm.stoploss_order_active or
+        tsm.stoploss_order_req_flag
+    ):
+        tsm.stoploss_order_req_flag = True
+
+def closing_tick_orders(
+    ctx: SymbolContext,
+    tick: int,
+    kline: dict,
+    previous_candle: dict,
+    candle: dict,
+    prediction_ma: float
+) -> None:
+    # order command of a closing tick, tick is its number within the candle
+    tsm = ctx.tsm
+    order_latency.start()
+    check_stoploss_hit(tsm, kline, previous_candle)
+    sl_adjustment_req_flag = False
+    
+    if tick != ctx.last_order_update_tick + 1:
+        holdings_increased = tsm.reconcile_and_process_orders().get(BUY_TYPE, False)
+        if tsm.stoploss_enabled and holdings_increased:
+            sl_adjustment_req_flag = True
+    order_latency.lap('order_check')
+    
+    if tsm.trading_enabled and not (
+        SL_TIMEOUT_ENABLED and candle['time'] < tsm.stoploss_hit_timeout
     ):
-        last_order_update_tick = tick_counter
-        if tsm.buy_order_active:
-            holdings_increased = tsm.check_and_process_order(BUY_TYPE, update_balances=True)
-            if holdings_increased and tsm.trading_enabled and tsm.stoploss_enabled:
+        if tsm.position_open and tsm.stoploss_enabled:
+            sl_adjustment_req_flag = tsm.update_stoploss_level(
+                candle['sl_base'],
+                candle['atr'],
+                SL_ATR_FACTOR,
+                SL_PCT_OFFSET,
+                override_condition = 'greater'
+            )
+        
+        if prediction_ma < -SIGNAL_THRESHOLD:
+            if tsm.buy_signal_flag:
+                tsm.deactivate_buy_signal()
+            if tsm.buy_order_req_flag:
+                tsm.buy_order_req_flag = False
+            if tsm.buy_order_active:
+                tsm.cancel_buy_order()
+            if tsm.position_open and not (
+                tsm.sell_order_active or
+                tsm.sell_order_req_flag or
+                tsm.sell_signal_flag
+            ):
                 if tsm.stoploss_order_active:
                     tsm.cancel_stoploss_order()
-                tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
-        elif tsm.sell_order_active:
-            tsm.check_and_process_order(SELL_TYPE, update_balances=True)
+                elif tsm.stoploss_order_req_flag:
+                    tsm.stoploss_order_req_flag = False
+                tsm.update_asset_balance()
+                if SHADOW_LIMIT_ENABLED:
+                    tsm.activate_sell_signal(candle['close'], candle['atr'])
+                else:
+                    tsm.sell_order_req_flag = True
+                    tsm.sell_target_price = candle['close']
+                sl_adjustment_req_flag = False
+        
+        elif prediction_ma > SIGNAL_THRESHOLD:
+            if tsm.position_open and (
+                tsm.sell_order_active or
+                tsm.sell_order_req_flag or
+                tsm.sell_signal_flag
+            ):
+                if tsm.sell_signal_flag:
+                    tsm.deactivate_sell_signal()
+                if tsm.sell_order_req_flag:
+                    tsm.sell_order_req_flag = False
+                if tsm.sell_order_active:
+                    tsm.cancel_sell_order()
+                if tsm.stoploss_enabled:
+                    tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
+                sl_adjustment_req_flag = False
+            if not tsm.position_full and not (
+                tsm.buy_order_active or
+                tsm.buy_order_req_flag or
+                tsm.buy_signal_flag
+            ):
+                tsm.update_quote_asset_balance()
+                if SHADOW_LIMIT_ENABLED:
+                    tsm.activate_buy_signal(candle['close'], candle['atr'])
+                else:
+                    tsm.buy_order_req_flag = True
+                    tsm.buy_target_price = candle['close']
+                if tsm.position_open and tsm.stoploss_enabled and not sl_adjustment_req_flag:
+                    sl_adjustment_req_flag = tsm.update_stoploss_level(
+                        candle['sl_base'],
+                        candle['atr'],
+                        SL_ATR_FACTOR,
+                        SL_PCT_OFFSET,
+                        override_condition = 'not_equal'
+                    )
+        
+        if sl_adjustment_req_flag:
+            if tsm.stoploss_order_active:
+                if tsm.stoploss_is_oco and tsm.sell_order_active:
+                    tsm.cancel_stoploss_order(alert=False)
+                    tsm.sell_order_req_flag = not tsm.sell_order_active
+                else:
+                    tsm.cancel_stoploss_order(alert=False)
+                    tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
+    
+    request_stoploss_order(tsm)
+    order_latency.lap('decision')
+    if tsm.unsaved_changes: tsm.save_state()
+    order_latency.lap('state_save')
+    order_latency.stop()
+
+def intra_candle_orders(ctx:SymbolContext) -> None:
+    # order command of the ticks between closes, on the newest kline and closed candle
+    tsm = ctx.tsm
+    kline = ctx.last_kline
+    candle = ctx.last_candle
+    check_stoploss_hit(tsm, kline, candle)
+    poll_tick = ctx.order_poll_tick
+    poll_due = poll_tick != ctx.order_poll_done
+    ctx.order_poll_done = poll_tick
+    
+    if poll_due and not tsm.user_stream_live and (
+        tsm.buy_order_active or
+        tsm.sell_order_active
+    ):
+        ctx.last_order_update_tick = poll_tick
+        holdings_increased = tsm.reconcile_and_process_orders(update_balances=True).get(BUY_TYPE, False)
+        if holdings_increased and tsm.trading_enabled and tsm.stoploss_enabled:
+            if tsm.stoploss_order_active:
+                tsm.cancel_stoploss_order()
+            tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
     
     elif tsm.trading_enabled:
         now = tznow().timestamp()
@@ -289,9 +436,9 @@ def process_message(msg: dict) -> None:
             )
             tsm.buy_target_price = round(
                 tsm.buy_signal_price - current_buy_price_delta,
-                PRICE_DEC_PLACES
+                tsm.price_dec_places
             )
-            if float(msg['k']['c']) <= tsm.buy_target_price:
+            if float(kline['c']) <= tsm.buy_target_price:
                 tsm.buy_signal_flag = False
                 tsm.buy_order_req_flag = True
         
@@ -304,9 +451,9 @@ def process_message(msg: dict) -> None:
             )
             tsm.sell_target_price = round(
                 tsm.sell_signal_price + current_sell_price_delta,
-                PRICE_DEC_PLACES
+                tsm.price_dec_places
             )
-            if float(msg['k']['c']) >= tsm.sell_target_price:
+            if float(kline['c']) >= tsm.sell_target_price:
                 tsm.sell_signal_flag = False
                 tsm.sell_order_req_flag = True
         
@@ -315,23 +462,23 @@ def process_message(msg: dict) -> None:
                 success = tsm.place_and_process_order(
                     BUY_TYPE,
                     rounddown(
-                        float(tsm.quote_asset_balance['free']),
-                        PRICE_DEC_PLACES
+                        quote_allocation(tsm),
+                        tsm.price_dec_places
                     ) / tsm.buy_target_price,
                     tsm.buy_target_price
                 )
                 tsm.buy_order_req_flag = not success
                 if success and tsm.stoploss_enabled:
                     tsm.update_stoploss_level(
-                        df.iloc[-1][SL_BASE_COL],
-                        df.iloc[-1][ATR10_COL],
+                        candle['sl_base'],
+                        candle['atr'],
                         SL_ATR_FACTOR,
                         SL_PCT_OFFSET,
                         override_condition = 'not_equal'
                     )
             
             elif tsm.sell_order_req_flag:
-                if tsm.stoploss_enabled and float(msg['k']['c']) < tsm.sell_target_price:
+                if tsm.stoploss_enabled and float(kline['c']) < tsm.sell_target_price:
                     success = tsm.place_and_process_order(
                         OCO_SELL_TYPE,
                         float(tsm.asset_balance['free']),
@@ -354,78 +501,184 @@ def process_message(msg: dict) -> None:
                 )
                 tsm.stoploss_order_req_flag = not success
     
-    if tsm.stoploss_enabled and tsm.position_open and not (
-        tsm.sell_order_active or
-        tsm.sell_order_req_flag or
-        tsm.sell_signal_flag or
-        tsm.stoploss_order_active or
-        tsm.stoploss_order_req_flag
-    ):
-        tsm.stoploss_order_req_flag = True
-    
+    request_stoploss_order(tsm)
     if tsm.unsaved_changes: tsm.save_state()
 
-tick_counter = 0
-last_order_update_tick = -1
-
-try:
-    set_system_time_from_ntp()
-except Exception as e:
-    error_msg = str(e).strip('()').split(', ')
-    if error_msg[0] == '1314':
-        print('warning: insufficient privileges to change system time', flush=True)
+def process_order_update(state_machine:TradeStateMachine, order_type:str, exec_qty_increased:bool) -> None:
+    # fills reported by the user data stream get the follow-up of the polled order checks
+    if not exec_qty_increased:
+        return
+    if order_type == BUY_TYPE:
+        if state_machine.trading_enabled and state_machine.stoploss_enabled:
+            if state_machine.stoploss_order_active:
+                state_machine.cancel_stoploss_order()
+            state_machine.stoploss_order_req_flag = not state_machine.stoploss_order_active
+    elif order_type == STOPLOSS_TYPE:
+        time_index = contexts_by_symbol[state_machine.symbol].last_candle['time']
+        if SL_TIMEOUT_ENABLED and time_index >= state_machine.stoploss_hit_timeout:
+            state_machine.set_stoploss_hit_timeout(time_index)
 
-print('loading prediction model...', end=' ', flush=True)
-try:
+def load_model() -> None:
+    global est
     est = joblib.load(MODEL_PATH)
-    print('done', flush=True)
-except Exception as e:
-    print_exception_and_shutdown(e)
+    # cached predictions and their moving average belong to the previous model
+    for ctx in contexts:
+        ctx.prediction_cache.invalidate(model_identity(MODEL_PATH, tsm.mode))
+        ctx.prediction_ewm.reset()
 
-print('connecting to exchange and updating account data...', end=' ', flush=True)
-try:
-    asset_bal_old = rounddown(
-        float(tsm.asset_balance['free']) + float(tsm.asset_balance['locked']),
-        QTY_DEC_PLACES
-    )
-    tsm.update_asset_balance()
-    tsm.update_quote_asset_balance()
-    asset_bal_new = rounddown(
-        float(tsm.asset_balance['free']) + float(tsm.asset_balance['locked']),
-        QTY_DEC_PLACES
+def compile_prediction_path() -> None:
+    global feature_plan, predictor
+    feature_plan = FeaturePlan(
+        contexts[0].candles.columns,
+        tsm.mode,
+        IGNORED_COLUMNS + [LABEL_COL, Y_PRED_COL, Y_PRED_MA_COL],
+        output_columns = model_feature_names(est),
+        dtype = np.float32,
+        extra_transforms = contexts[0].timeframes.transforms() if contexts[0].timeframes is not None else None
     )
+    predictor = InplacePredictor(est, feature_plan.columns, N_ROWS_TO_PREDICT)
+
+def init_candles(ctx:SymbolContext, df:pd.DataFrame, engine:Union[TechnicalsV04Stream, None]=None) -> None:
+    if tsm.mode == 'v04':
+        if engine is None:
+            engine = TechnicalsV04Stream()
+            engine.seed(df)
+        ctx.technicals = engine
+    if ctx.timeframes is not None:
+        df = df.join(ctx.timeframes.seed(df))
+    ctx.candles = CandleBuffer.from_dataframe(df, DATAFRAME_LENGTH)
+    ctx.last_candle = candle_snapshot(ctx.candles)
+
+def init_symbol(ctx:SymbolContext) -> None:
+    sm = ctx.tsm
+    print('connecting to exchange and updating {:s} account data...'.format(ctx.symbol), end=' ', flush=True)
+    try:
+        asset_bal_old = rounddown(
+            float(sm.asset_balance['free']) + float(sm.asset_balance['locked']),
+            sm.qty_dec_places
+        )
+        sm.update_asset_balance()
+        sm.update_quote_asset_balance()
+        asset_bal_new = rounddown(
+            float(sm.asset_balance['free']) + float(sm.asset_balance['locked']),
+            sm.qty_dec_places
+        )
+        
+        sm.reconcile_orders()
+        
+        if (
+            sm.trading_enabled and
+            sm.stoploss_enabled and
+            sm.stoploss_order_active and
+            asset_bal_new > asset_bal_old
+        ):
+            sm.cancel_stoploss_order()
+            sm.stoploss_order_req_flag = not sm.stoploss_order_active
+        
+        sm.save_state()
+        print('done', flush=True)
+    except Exception as e:
+        print_exception_and_shutdown(e)
+    
+    if sm is tsm and not os.path.exists(CANDLE_STORE_PATH) and os.path.exists(DATA_PATH):
+        print('migrating {:s} to {:s}...'.format(DATA_PATH, CANDLE_STORE_PATH), end=' ', flush=True)
+        try:
+            migrate_pickle(DATA_PATH, CANDLE_STORE_PATH)
+            print('done', flush=True)
+        except Exception as e:
+            print('failed ({:s}: {:s})'.format(type(e).__name__, str(e)), flush=True)
     
-    if tsm.buy_order_active: tsm.check_buy_order()
-    if tsm.sell_order_active: tsm.check_sell_order()
-    if tsm.stoploss_order_active: tsm.check_stoploss_order()
+    if tsm.mode == 'v04':
+        ctx.feature_cache = FeatureCache(ctx.feature_cache_path, tsm.mode)
     
-    if (
-        tsm.trading_enabled and
-        tsm.stoploss_enabled and
-        tsm.stoploss_order_active and
-        asset_bal_new > asset_bal_old
-    ):
-        tsm.cancel_stoploss_order()
-        tsm.stoploss_order_req_flag = not tsm.stoploss_order_active
+    try:
+        df = create_dataframe(
+            ctx.symbol,
+            INTERVAL,
+            ctx.candle_store_path,
+            tsm.mode,
+            start = str(tznow() - dt.timedelta(hours=DATAFRAME_LENGTH + 1)),
+            feature_cache = ctx.feature_cache
+        )
+    except Exception as e:
+        print_exception_and_shutdown(e)
     
-    tsm.save_state()
-    print('done', flush=True)
-except Exception as e:
-    print_exception_and_shutdown(e)
+    ctx.candle_store = CandleStore(ctx.candle_store_path)
+    if HIGHER_TIMEFRAMES:
+        # the higher timeframe bars and indicators start further back than the frame
+        ctx.timeframes = MultiTimeframeAggregator(HIGHER_TIMEFRAMES)
+        first_open_time = int(datetime_index_to_open_times(df.index[:1])[0])
+        open_times, values = ctx.candle_store.read(
+            first_open_time - TIMEFRAME_WARMUP_CANDLES * interval_to_milliseconds(INTERVAL),
+            first_open_time - 1
+        )
+        ctx.timeframes.extend(open_times, values, ctx.candle_store.columns)
+    init_candles(ctx, df, ctx.feature_cache.engine if ctx.feature_cache is not None else None)
 
-try:
-    df = create_dataframe(
-        SYMBOL,
-        INTERVAL,
-        DATA_PATH,
-        tsm.mode,
-        start = str(tznow() - dt.timedelta(hours=DATAFRAME_LENGTH + 1))
+def main() -> None:
+    global user_stream
+    try:
+        set_system_time_from_ntp()
+    except Exception as e:
+        error_msg = str(e).strip('()').split(', ')
+        if error_msg[0] == '1314':
+            print('warning: insufficient privileges to change system time', flush=True)
+    
+    print('loading prediction model...', end=' ', flush=True)
+    try:
+        load_model()
+        print('done', flush=True)
+    except Exception as e:
+        print_exception_and_shutdown(e)
+    
+    for ctx in contexts:
+        init_symbol(ctx)
+    
+    try:
+        compile_prediction_path()
+    except Exception as e:
+        print_exception_and_shutdown(e)
+    
+    print('starting websocket listener...\n', flush=True)
+    bm = BinanceSocketManager(tsm.client)
+    if len(contexts) == 1:
+        conn_key = bm.start_kline_socket(tsm.symbol, process_message, interval=INTERVAL)
+    else:
+        conn_key = bm.start_multiplex_socket(
+            ['{:s}@kline_{:s}'.format(ctx.symbol.lower(), INTERVAL) for ctx in contexts],
+            dispatch_message
+        )
+    if USER_STREAM_ENABLED:
+        user_stream = UserDataStream(bm, tsm.client, on_order_update=process_order_update, executor=order_executor)
+        if not user_stream.start():
+            print('warning: user data stream unavailable, polling orders', flush=True)
+    atexit.register(dump_http_stats)
+    bm.start()
+    tg.updater.start_polling()
+
+# the extra pairs share the client and follow the mode of the main pair
+contexts = [SymbolContext(tsm, CANDLE_STORE_PATH, FEATURE_CACHE_PATH)]
+for asset, quote_asset, qty_dec_places, price_dec_places in MULTI_SYMBOL_PAIRS:
+    state_machine = TradeStateMachine(
+        asset,
+        quote_asset,
+        qty_dec_places,
+        price_dec_places,
+        state_path = STATE_FILE_PATH_FORMAT.format(asset + quote_asset),
+        client = tsm.client,
+        mode = tsm.mode
     )
-except Exception as e:
-    print_exception_and_shutdown(e)
+    if state_machine.mode != tsm.mode:
+        state_machine.mode = tsm.mode
+    contexts.append(SymbolContext(
+        state_machine,
+        CANDLE_STORE_PATH_FORMAT.format(state_machine.symbol),
+        FEATURE_CACHE_PATH_FORMAT.format(state_machine.symbol)
+    ))
+contexts_by_symbol = {ctx.symbol: ctx for ctx in contexts}
+user_stream = None
+tick_latency = LatencyRecorder(maxlen=TICK_LATENCY_SAMPLES)
+order_latency = LatencyRecorder(maxlen=TICK_LATENCY_SAMPLES)  # closing_tick_orders on the executor thread
 
-print('starting websocket listener...\n', flush=True)
-bm = BinanceSocketManager(tsm.client)
-conn_key = bm.start_kline_socket(SYMBOL, process_message, interval=INTERVAL)
-bm.start()
-tg.updater.start_polling()
+if __name__ == '__main__':
+    main()
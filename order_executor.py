@@ -0,0 +1,104 @@
+import time
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Union, Callable
+from latency import LatencyRecorder
+from bot_utils import get_timestamp
+from config import ORDER_EXECUTOR_ENABLED, ORDER_EXECUTOR_LATENCY_SAMPLES
+
+class OrderExecutor:
+    """
+    FIFO command queue worked off by one thread, so that the REST calls of the
+    state machines leave the websocket callbacks; commands run one at a time in
+    submission order, so the ones for the same order slot can never overtake each
+    other, and each returns a Future of its result; with synchronous=True commands
+    run inline on the submitting thread instead
+    
+    latency records the time commands spent queued ('queued') and the run time of
+    each command under its name
+    """
+    def __init__(self, synchronous:bool=False, maxlen:Union[int, None]=ORDER_EXECUTOR_LATENCY_SAMPLES) -> None:
+        self.synchronous = synchronous
+        self.latency = LatencyRecorder(maxlen)
+        self.n_done = 0
+        self.n_failed = 0
+        self.last_error = None
+        self.__pending = deque()
+        self.__busy = False
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = None
+        if not synchronous:
+            self.__thread = threading.Thread(target=self.__run, name='order-executor', daemon=True)
+            self.__thread.start()
+    
+    def submit(self, command:Callable, *args, **kwargs) -> Future:
+        future = Future()
+        if self.synchronous:
+            self.__execute(future, command, args, kwargs, time.perf_counter())
+            return future
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('OrderExecutor is closed')
+            self.__pending.append((future, command, args, kwargs, time.perf_counter()))
+            self.__condition.notify_all()
+        return future
+    
+    def pending(self) -> int:
+        with self.__condition:
+            return len(self.__pending) + int(self.__busy)
+    
+    def flush(self, timeout:Union[float, None]=None) -> bool:
+        if self.synchronous:
+            return True
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__pending and not self.__busy, timeout)
+    
+    def close(self, timeout:Union[float, None]=None) -> bool:
+        # commands already queued are still executed
+        if self.synchronous:
+            return True
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join(timeout)
+        return not self.__thread.is_alive()
+    
+    def __execute(self, future:Future, command:Callable, args:tuple, kwargs:dict, submitted:float) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        t0 = time.perf_counter()
+        self.latency.record('queued', t0 - submitted)
+        try:
+            result = command(*args, **kwargs)
+        except Exception as e:
+            self.n_failed += 1
+            self.last_error = e
+            print(get_timestamp(), 'order command {:s}: {:s}: {:s}'.format(
+                getattr(command, '__name__', str(command)),
+                type(e).__name__,
+                str(e)
+            ), flush=True)
+            future.set_exception(e)
+        else:
+            self.n_done += 1
+            future.set_result(result)
+        self.latency.record(getattr(command, '__name__', 'command'), time.perf_counter() - t0)
+    
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__pending or self.__closed)
+                if not self.__pending:
+                    return
+                item = self.__pending.popleft()
+                self.__busy = True
+            self.__execute(*item)
+            with self.__condition:
+                self.__busy = False
+                self.__condition.notify_all()
+
+order_executor = OrderExecutor(synchronous=not ORDER_EXECUTOR_ENABLED)
+atexit.register(order_executor.close, 10.)
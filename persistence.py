@@ -0,0 +1,98 @@
+import os
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Union, Callable, Hashable
+from bot_utils import get_timestamp
+from config import WRITE_BEHIND_QUEUE_SIZE
+
+def atomic_write(path:str, data:Union[bytes, Callable], fsync:bool=True) -> None:
+    # data is either the file content or a function writing it to a binary file handle
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        if callable(data):
+            data(fh)
+        else:
+            fh.write(data)
+        fh.flush()
+        if fsync:
+            os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+class WriteBehind:
+    """
+    background writer for the tick path: pending writes are keyed by target and a
+    newer submission replaces the pending one in place, so only the latest snapshot
+    of each target is written; submit() only blocks while maxsize distinct targets
+    are pending
+    """
+    def __init__(self, maxsize:int=WRITE_BEHIND_QUEUE_SIZE, fsync:bool=True) -> None:
+        self.maxsize = maxsize
+        self.fsync = fsync
+        self.n_written = 0
+        self.n_coalesced = 0
+        self.last_error = None
+        self.__pending = OrderedDict()
+        self.__busy = False
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name='write-behind', daemon=True)
+        self.__thread.start()
+    
+    def submit(self, key:Hashable, write:Callable[[], None]) -> None:
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('WriteBehind is closed')
+            if key in self.__pending:
+                self.n_coalesced += 1
+            else:
+                while len(self.__pending) >= self.maxsize:
+                    self.__condition.wait()
+            self.__pending[key] = write
+            self.__condition.notify_all()
+    
+    def submit_file(self, path:str, data:Union[bytes, Callable]) -> None:
+        # data has to be a snapshot: it is written later on the writer thread
+        self.submit(path, lambda: atomic_write(path, data, self.fsync))
+    
+    def pending(self) -> int:
+        with self.__condition:
+            return len(self.__pending) + int(self.__busy)
+    
+    def flush(self, timeout:Union[float, None]=None) -> bool:
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__pending and not self.__busy, timeout)
+    
+    def close(self, timeout:Union[float, None]=None) -> bool:
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join(timeout)
+        return not self.__thread.is_alive()
+    
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__pending or self.__closed)
+                if not self.__pending:
+                    return
+                key, write = self.__pending.popitem(last=False)
+                self.__busy = True
+                self.__condition.notify_all()
+            try:
+                write()
+                self.n_written += 1
+            except Exception as e:
+                self.last_error = e
+                print('{:s} error: write-behind for {:s} failed ({:s}: {:s})'.format(
+                    get_timestamp(),
+                    str(key),
+                    type(e).__name__,
+                    str(e)
+                ), flush=True)
+            with self.__condition:
+                self.__busy = False
+                self.__condition.notify_all()
+
+write_behind = WriteBehind()
+atexit.register(write_behind.close)
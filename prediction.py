@@ -0,0 +1,119 @@
+import os
+import numpy as np
+from collections import OrderedDict, deque
+from typing import Union
+
+def model_identity(path:str, mode:str) -> str:
+    stat = os.stat(path)
+    return '{:s}:{:s}:{:d}:{:d}'.format(mode, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+class PredictionCache:
+    """
+    bounded LRU cache of model outputs keyed by model identity and candle open time
+    """
+    def __init__(self, model_id:Union[str, None], maxsize:int) -> None:
+        self.model_id = model_id
+        self.maxsize = maxsize
+        self.__entries = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self.__entries)
+    
+    def invalidate(self, model_id:Union[str, None]=None) -> None:
+        if model_id is not None:
+            self.model_id = model_id
+        self.__entries.clear()
+    
+    def lookup(self, open_times:np.ndarray) -> tuple:
+        predictions = np.full(len(open_times), np.nan)
+        missing = np.ones(len(open_times), dtype=bool)
+        for i, open_time in enumerate(open_times):
+            key = (self.model_id, int(open_time))
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                predictions[i] = self.__entries[key]
+                missing[i] = False
+        return predictions, missing
+    
+    def store(self, open_times:np.ndarray, predictions:np.ndarray) -> None:
+        for open_time, prediction in zip(open_times, predictions):
+            key = (self.model_id, int(open_time))
+            self.__entries[key] = float(prediction)
+            self.__entries.move_to_end(key)
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+class PredictionEWM:
+    """
+    adjusted EWM over the last `window` predictions, updated in O(1) per new prediction;
+    equals pd.Series(predictions[-window:]).ewm(alpha=alpha, min_periods=min_periods).mean()
+    """
+    def __init__(self, alpha:float, window:int, min_periods:int=0) -> None:
+        self.decay = 1. - alpha
+        self.window = window
+        self.min_periods = min_periods
+        self.reset()
+    
+    def reset(self) -> None:
+        self.values = deque(maxlen=self.window)
+        self.numerator = 0.0
+        self.last_open_time = None
+        self.pushes_since_resync = 0
+    
+    def push(self, prediction:float) -> float:
+        if len(self.values) == self.window:
+            self.numerator -= self.decay**(self.window - 1) * self.values[0]
+        self.values.append(prediction)
+        self.numerator = self.numerator * self.decay + prediction
+        self.pushes_since_resync += 1
+        if self.pushes_since_resync >= self.window:  # bound floating point drift
+            weights = self.decay**np.arange(len(self.values) - 1, -1, -1)
+            self.numerator = float(weights @ np.fromiter(self.values, float, len(self.values)))
+            self.pushes_since_resync = 0
+        return self.value
+    
+    def update(self, open_times:np.ndarray, predictions:np.ndarray) -> float:
+        for open_time, prediction in zip(open_times, predictions):
+            if self.last_open_time is None or open_time > self.last_open_time:
+                self.push(float(prediction))
+                self.last_open_time = int(open_time)
+        return self.value
+    
+    @property
+    def value(self) -> float:
+        n = len(self.values)
+        if n == 0 or n < self.min_periods:
+            return np.nan
+        return self.numerator * (1. - self.decay) / (1. - self.decay**n)
+
+def _unwrap_estimator(est:object) -> object:
+    # grid search results delegate predict() to the refitted best estimator
+    return getattr(est, 'best_estimator_', est)
+
+def model_feature_names(est:object) -> Union[list, None]:
+    feature_names = _unwrap_estimator(est).get_booster().feature_names
+    return list(feature_names) if feature_names is not None else None
+
+class InplacePredictor:
+    """
+    calls Booster.inplace_predict on a preallocated C-contiguous float32 buffer,
+    bypassing the DataFrame handling and DMatrix construction of est.predict
+    """
+    def __init__(self, est:object, feature_columns:list, max_rows:int) -> None:
+        model = _unwrap_estimator(est)
+        self.booster = model.get_booster()
+        feature_names = model_feature_names(est)
+        if feature_names is not None and feature_names != list(feature_columns):
+            raise ValueError('Feature plan columns do not match the feature names of the model')
+        try:
+            self.iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range = (0, 0)
+        self.buffer = np.empty((max_rows, len(feature_columns)), dtype=np.float32)
+    
+    def predict(self, n_rows:int) -> np.ndarray:
+        return self.booster.inplace_predict(
+            self.buffer[:n_rows],
+            iteration_range = self.iteration_range,
+            validate_features = False
+        )
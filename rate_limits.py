@@ -0,0 +1,252 @@
+import time
+import threading
+import requests
+from collections import Counter, OrderedDict, deque
+from typing import Union
+from latency import LatencyRecorder
+from bot_utils import get_timestamp
+from config import (
+    RATE_LIMITS,
+    RATE_LIMIT_LOW_PRIORITY_RESERVE,
+    RATE_LIMIT_MAX_WAIT_SECONDS,
+    RATE_LIMIT_COALESCE_SECONDS
+)
+
+HIGH_PRIORITY = 0  # order placement, cancels and the listen key of the user data stream
+LOW_PRIORITY = 1  # balance, order status and market data reads
+BULK_PRIORITY = 2  # historical kline downloads, wait as long as the limits require
+DEFAULT_RETRY_AFTER = 60.
+WINDOW_MARGIN = 0.02  # fraction of a limit interval tokens return late, the exchange counts a request on arrival
+# response headers with the usage the exchange counted for each limit of RATE_LIMITS
+USAGE_HEADERS = {
+    'X-MBX-USED-WEIGHT-1M': 'REQUEST_WEIGHT',
+    'X-MBX-ORDER-COUNT-10S': 'ORDERS_10S',
+    'X-MBX-ORDER-COUNT-1D': 'ORDERS_1D'
+}
+# request weight of the endpoints used by the bot, 1 for all others
+ENDPOINT_WEIGHTS = {
+    ('GET', '/api/v3/order'): 2,
+    ('GET', '/api/v3/openOrders'): 3,
+    ('GET', '/api/v3/account'): 10,
+    ('GET', '/api/v3/exchangeInfo'): 10
+}
+# orders counted by the ORDERS limits
+ENDPOINT_ORDERS = {
+    ('POST', '/api/v3/order'): 1,
+    ('POST', '/api/v3/order/oco'): 2
+}
+HIGH_PRIORITY_ENDPOINTS = {
+    ('POST', '/api/v3/order'),
+    ('POST', '/api/v3/order/oco'),
+    ('DELETE', '/api/v3/order'),
+    ('DELETE', '/api/v3/orderList'),
+    ('POST', '/api/v3/userDataStream'),
+    ('PUT', '/api/v3/userDataStream')
+}
+# signing parameters, left out when comparing reads for coalescing
+VOLATILE_PARAMS = ('timestamp', 'signature')
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    pass
+
+def klines_request_weight(limit:int) -> int:
+    if limit < 100:
+        return 1
+    elif limit < 500:
+        return 2
+    elif limit <= 1000:
+        return 5
+    return 10
+
+def request_params(params) -> tuple:
+    # query of a request as sorted (key, value) pairs: Client sends a query string, others a dict
+    if params is None:
+        return tuple()
+    if isinstance(params, (str, bytes)):
+        if isinstance(params, bytes):
+            params = params.decode('utf-8')
+        items = [tuple(item.split('=', 1)) if '=' in item else (item, '') for item in params.split('&') if item]
+    else:
+        items = [(str(k), str(v)) for k, v in dict(params).items()]
+    return tuple(sorted(items))
+
+def request_cost(method:str, path:str, params:tuple) -> tuple:
+    # (priority, weight, orders) of a request
+    key = (method, path)
+    if path.endswith('/klines'):
+        return BULK_PRIORITY, klines_request_weight(int(dict(params).get('limit', 500))), 0
+    weight = ENDPOINT_WEIGHTS.get(key, 1)
+    priority = HIGH_PRIORITY if key in HIGH_PRIORITY_ENDPOINTS else LOW_PRIORITY
+    return priority, weight, ENDPOINT_ORDERS.get(key, 0)
+
+class TokenBucket:
+    """
+    capacity tokens for a limit of the exchange counted over interval seconds; taken
+    tokens return to the bucket a little over interval seconds later, so it never allows
+    more than the exchange counts in a sliding or a fixed window; sync() takes the
+    usage the exchange reports beyond the own requests, e.g. from other processes
+    """
+    def __init__(self, capacity:int, interval:float) -> None:
+        self.capacity = capacity
+        self.interval = interval
+        self.tokens = float(capacity)
+        self.__delay = interval * (1. + WINDOW_MARGIN)
+        self.__taken = deque()  # (monotonic time, amount)
+    
+    def refill(self, now:float) -> None:
+        while self.__taken and self.__taken[0][0] <= now - self.__delay:
+            self.tokens += self.__taken.popleft()[1]
+    
+    def wait_time(self, amount:float, reserve:float=0.) -> float:
+        # seconds until amount tokens can be taken with reserve tokens left, refill() first
+        missing = amount + reserve - self.tokens
+        if missing <= 0.:
+            return 0.
+        for t, n in self.__taken:
+            missing -= n
+            if missing <= 0.:
+                return max(t + self.__delay - time.monotonic(), 0.001)
+        return self.__delay
+    
+    def take(self, amount:float) -> None:
+        if amount:
+            self.tokens -= amount
+            self.__taken.append((time.monotonic(), amount))
+    
+    def sync(self, used:int) -> None:
+        untracked = used - (self.capacity - self.tokens)
+        if untracked > 0:
+            self.take(untracked)
+
+class RateLimitScheduler:
+    """
+    admission of REST requests against a TokenBucket per limit type of the exchange,
+    synchronized with the usage headers of every response
+    
+    orders and cancels may use the whole budget and go first; reads have to leave
+    a reserve of the request weight and wait while orders are waiting, and a read
+    repeating one answered within coalesce_seconds gets that response instead of
+    waiting; after a 429 or 418 nothing is sent until its Retry-After has passed;
+    a request that would have to wait longer than max_wait raises RateLimitExceeded,
+    except kline downloads, which keep the reserve like reads but wait as long as needed
+    """
+    def __init__(
+        self,
+        limits: dict = RATE_LIMITS,
+        reserve: float = RATE_LIMIT_LOW_PRIORITY_RESERVE,
+        max_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+        coalesce_seconds: float = RATE_LIMIT_COALESCE_SECONDS
+    ) -> None:
+        self.buckets = OrderedDict((name, TokenBucket(limit, interval)) for name, (limit, interval) in limits.items())
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.coalesce_seconds = coalesce_seconds
+        self.blocked_until = 0.
+        self.counts = Counter()  # delayed, coalesced, rejected, rate_limited
+        self.wait_latency = LatencyRecorder(1000)
+        self.__high_waiting = 0
+        self.__recent = dict()  # (path, params) -> (monotonic time, response) of low priority reads
+        self.__condition = threading.Condition()
+    
+    def __admission_wait(self, now:float, priority:int, weight:int, orders:int) -> float:
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        wait = 0.
+        for name, bucket in self.buckets.items():
+            bucket.refill(now)
+            if name == 'REQUEST_WEIGHT':
+                reserve = self.reserve * bucket.capacity if priority != HIGH_PRIORITY else 0.
+                wait = max(wait, bucket.wait_time(weight, reserve))
+            elif orders:
+                wait = max(wait, bucket.wait_time(orders))
+        return wait
+    
+    def acquire(self, method:str, path:str, params:tuple) -> Union[requests.Response, None]:
+        # blocks until the request may be sent; a response is returned when a recent one is reused
+        priority, weight, orders = request_cost(method, path, params)
+        key = (path, tuple(item for item in params if item[0] not in VOLATILE_PARAMS))
+        t0 = time.monotonic()
+        with self.__condition:
+            delayed = False
+            while True:
+                now = time.monotonic()
+                wait = self.__admission_wait(now, priority, weight, orders)
+                if priority != HIGH_PRIORITY and self.__high_waiting and wait == 0.:
+                    wait = 0.01  # orders and cancels first
+                if wait == 0.:
+                    for name, bucket in self.buckets.items():
+                        bucket.take(weight if name == 'REQUEST_WEIGHT' else orders)
+                    break
+                if priority == LOW_PRIORITY and method == 'GET':
+                    recent = self.__recent.get(key, None)
+                    if recent is not None and now - recent[0] <= self.coalesce_seconds:
+                        self.counts['coalesced'] += 1
+                        return recent[1]
+                if priority != BULK_PRIORITY and now - t0 + wait > self.max_wait:
+                    self.counts['rejected'] += 1
+                    raise RateLimitExceeded('{:s} {:s} would wait {:.1f} s for the rate limits'.format(method, path, wait))
+                if not delayed:
+                    delayed = True
+                    self.counts['delayed'] += 1
+                if priority == HIGH_PRIORITY:
+                    self.__high_waiting += 1
+                try:
+                    self.__condition.wait(wait)
+                finally:
+                    if priority == HIGH_PRIORITY:
+                        self.__high_waiting -= 1
+        if delayed:
+            self.wait_latency.record(['high', 'low', 'bulk'][priority], time.monotonic() - t0)
+        return None
+    
+    def update(self, method:str, path:str, params:tuple, response:requests.Response) -> None:
+        with self.__condition:
+            now = time.monotonic()
+            for header, name in USAGE_HEADERS.items():
+                used = response.headers.get(header, None)
+                if used is not None and name in self.buckets:
+                    self.buckets[name].refill(now)
+                    self.buckets[name].sync(int(used))
+            if response.status_code in (418, 429):
+                retry_after = float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                self.counts['rate_limited'] += 1
+                print(get_timestamp(), 'warning: HTTP {:d} on {:s} {:s}, pausing requests for {:.0f} s'.format(
+                    response.status_code,
+                    method,
+                    path,
+                    retry_after
+                ), flush=True)
+            elif method == 'GET' and response.status_code == 200:
+                key = (path, tuple(item for item in params if item[0] not in VOLATILE_PARAMS))
+                self.__recent[key] = (now, response)
+                for k in [k for k, (t, _) in self.__recent.items() if now - t > self.coalesce_seconds]:
+                    del self.__recent[k]
+            self.__condition.notify_all()
+    
+    def status(self) -> dict:
+        # available tokens per limit, the pause left after a 429/418 and the counts
+        with self.__condition:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+            return {
+                'available': {name: (int(bucket.tokens), bucket.capacity) for name, bucket in self.buckets.items()},
+                'blocked_seconds': max(self.blocked_until - now, 0.),
+                'counts': dict(self.counts)
+            }
+
+def format_rate_limits(scheduler:RateLimitScheduler) -> str:
+    status = scheduler.status()
+    msg = 'Rate limits: {:s}'.format(', '.join(
+        '{:s} {:d}/{:d} left'.format(name, tokens, capacity) for name, (tokens, capacity) in status['available'].items()
+    ))
+    if status['blocked_seconds'] > 0.:
+        msg += ', paused for {:.0f} s'.format(status['blocked_seconds'])
+    counts = status['counts']
+    return msg + '\n{:d} delayed, {:d} coalesced, {:d} rejected, {:d} rate limited by the exchange'.format(
+        counts.get('delayed', 0),
+        counts.get('coalesced', 0),
+        counts.get('rejected', 0),
+        counts.get('rate_limited', 0)
+    )
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import threading
+import argparse
+from typing import Union
+from persistence import WriteBehind, write_behind, atomic_write
+from config import STATE_FILE_PATH, STATE_JOURNAL_PATH, STATE_JOURNAL_COMPACT_RECORDS
+
+def default_state(mode:str) -> dict:
+    # initial state of a pair that has never been traded
+    balance = {'asset': '', 'free': '0.00000000', 'locked': '0.00000000'}
+    state = {
+        'asset_balance': balance,
+        'quote_asset_balance': balance,
+        'mode': mode,
+        'trading_enabled': False,
+        'stoploss_enabled': False,
+        'stoploss_level': 0.0,
+        'stoploss_hit_timeout': '2000-01-01 00:00:00 +0000',
+        'stoploss_is_oco': False,
+        'position_open': False,
+        'position_full': False,
+        'order_timeout': 0.0
+    }
+    for side in ('buy', 'sell'):
+        state.update({
+            side + '_signal_flag': False,
+            side + '_signal_time': 0.0,
+            side + '_signal_price': 0.0,
+            side + '_price_delta': 0.0,
+            side + '_target_price': 0.0
+        })
+    for order in ('buy', 'sell', 'stoploss'):
+        state.update({
+            order + '_order_req_flag': False,
+            order + '_order_active': False,
+            order + '_order_id': 0,
+            order + '_order_price': '0.00',
+            order + '_order_status': '',
+            order + '_order_original_qty': '0.000000',
+            order + '_order_executed_qty': '0.000000',
+            order + '_order_cum_quote_qty': '0.00'
+        })
+    return state
+
+class StateJournal:
+    """
+    json snapshot plus an append-only journal of compact json lines holding only the
+    fields that changed; the state is the snapshot with the journal replayed on top,
+    compaction rewrites the snapshot and rotates the journal to <journal>.1
+    """
+    def __init__(
+        self,
+        snapshot_path: str = STATE_FILE_PATH,
+        journal_path: str = STATE_JOURNAL_PATH,
+        compact_records: int = STATE_JOURNAL_COMPACT_RECORDS,
+        writer: Union[WriteBehind, None] = write_behind
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_records = compact_records
+        self.writer = writer
+        self.seq = 0
+        self.n_records = 0
+        self.__committed = dict()
+        self.__lock = threading.Lock()
+    
+    def read_journal(self, path:Union[str, None]=None, repair:bool=False) -> list:
+        # records up to the first torn or invalid line, which is cut off if repair is set
+        path = path or self.journal_path
+        records = list()
+        valid_size = 0
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return records
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('Torn journal record')
+                record = json.loads(line)
+                if not isinstance(record, dict) or not isinstance(record.get('changes', None), dict):
+                    raise ValueError('Invalid journal record')
+            except ValueError:
+                break
+            records.append(record)
+            valid_size += len(line)
+        if repair and valid_size != len(data):
+            print('warning: dropping {:d} bytes of torn or corrupted state journal records from {:s}'.format(
+                len(data) - valid_size,
+                path
+            ), flush=True)
+            with open(path, 'r+b') as fh:
+                fh.truncate(valid_size)
+                os.fsync(fh.fileno())
+        return records
+    
+    def load(self) -> dict:
+        with open(self.snapshot_path, 'r') as fh:
+            state = json.load(fh)
+        records = self.read_journal(repair=True)
+        for record in records:
+            state.update(record['changes'])
+        with self.__lock:
+            self.__committed = dict(state)
+            self.n_records = len(records)
+            self.seq = self.last_seq(records)
+        return state
+    
+    def last_seq(self, records:list) -> int:
+        # after a compaction the journal is empty or gone, the sequence continues from the rotated one
+        if records:
+            return records[-1]['seq']
+        rotated = self.read_journal(self.journal_path + '.1')
+        return rotated[-1]['seq'] if rotated else 0
+    
+    def commit(self, state:dict) -> dict:
+        # state has to be json serializable; returns the changed fields
+        with self.__lock:
+            changes = {key: value for key, value in state.items() if self.__committed.get(key, None) != value}
+            if not changes and len(state) == len(self.__committed):
+                return changes
+            self.seq += 1
+            self.n_records += 1
+            self.__committed = dict(state)
+            record = json.dumps(
+                {'seq': self.seq, 'time': round(time.time(), 3), 'changes': changes},
+                separators = (',', ':')
+            ).encode('utf-8') + b'\n'
+            self.__submit(('state_journal', self.journal_path, self.seq), lambda: self.__append(record))
+            if self.n_records >= self.compact_records:
+                self.__compact(json.dumps(state, indent=2).encode('utf-8'))
+        return changes
+    
+    def compact(self) -> None:
+        with self.__lock:
+            self.__compact(json.dumps(self.__committed, indent=2).encode('utf-8'))
+    
+    def __compact(self, snapshot:bytes) -> None:
+        # replaying the rotated journal on the new snapshot yields the same state,
+        # so a crash between the two steps is harmless
+        self.n_records = 0
+        
+        def write() -> None:
+            atomic_write(self.snapshot_path, snapshot)
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.journal_path + '.1')
+        
+        self.__submit(('state_journal', self.journal_path, self.seq, 'compact'), write)
+    
+    def __append(self, record:bytes) -> None:
+        with open(self.journal_path, 'ab') as fh:
+            fh.write(record)
+            fh.flush()
+            os.fsync(fh.fileno())
+    
+    def __submit(self, key:tuple, write) -> None:
+        if self.writer is None:
+            write()
+        else:
+            self.writer.submit(key, write)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='print the state transitions recorded in the state journal')
+    parser.add_argument('path', nargs='?', default=STATE_JOURNAL_PATH)
+    parser.add_argument('--rotated', action='store_true', help='include the journal rotated by the last compaction')
+    args = parser.parse_args()
+    
+    journal = StateJournal(journal_path=args.path, writer=None)
+    paths = [args.path + '.1', args.path] if args.rotated else [args.path]
+    if not any(os.path.exists(path) for path in paths):
+        print("error: '{:s}' not found".format(args.path))
+        sys.exit(1)
+    for path in paths:
+        for record in journal.read_journal(path):
+            print('{:s} #{:d} {:s}'.format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['time'])),
+                record['seq'],
+                ', '.join('{:s}={:s}'.format(key, json.dumps(value)) for key, value in record['changes'].items())
+            ))
+
+if __name__ == '__main__':
+    main()
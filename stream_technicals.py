@@ -0,0 +1,329 @@
+import math
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Union
+from df_utils import ta, linregress_trend_from_sums
+
+# TA-Lib seeds its moving averages with a simple average and returns 0 on a zero range,
+# the pandas-based fallback uses adjusted EWMs and plain division
+TALIB_SEMANTICS = ta.__name__ != 'talib_fallback'
+
+TECHNICALS_V04_COLUMNS = [
+    'rsi',
+    'rsi_trend',
+    'ema10',
+    'ema20',
+    'sma50',
+    'sma100',
+    'sma200',
+    'sma500',
+    'sma1000',
+    'std20',
+    'atr10',
+    'atr100',
+    'keltner_upper',
+    'keltner_lower',
+    'stoch_slowk',
+    'stoch_slowd',
+    'stochrsi_fastk',
+    'stochrsi_fastd'
+]
+
+def _divide(a:float, b:float, zero_value:Union[float, None]=None) -> float:
+    if b != 0.:
+        return a / b
+    if zero_value is not None:
+        return zero_value
+    if a == 0. or math.isnan(a):
+        return np.nan
+    return math.copysign(np.inf, a) * math.copysign(1., b)
+
+class _RollingWindow:
+    def __init__(self, n:int) -> None:
+        self.n = n
+        self.values = deque(maxlen=n)
+        self.sum = 0.0
+        self.nan_count = 0
+        self.pushes_since_resync = 0
+    
+    def push(self, x:float) -> None:
+        if len(self.values) == self.n:
+            old = self.values[0]
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.sum -= old
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.sum += x
+        self.pushes_since_resync += 1
+        if self.pushes_since_resync >= self.n:  # bound floating point drift of the running sum
+            self.sum = math.fsum(v for v in self.values if not math.isnan(v))
+            self.pushes_since_resync = 0
+    
+    @property
+    def ready(self) -> bool:
+        return len(self.values) == self.n and self.nan_count == 0
+    
+    def mean(self) -> float:
+        return self.sum / self.n if self.ready else np.nan
+    
+    def std(self) -> float:
+        return float(np.std(np.fromiter(self.values, float, self.n))) if self.ready else np.nan
+    
+    def to_array(self) -> np.ndarray:
+        return np.fromiter(self.values, float, len(self.values))
+
+class _RollingTrend:
+    """
+    incremental linregress_trend over the last n values from running sums of y, x*y and y**2
+    """
+    def __init__(self, n:int) -> None:
+        self.window = _RollingWindow(n)
+        self.n = n
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_yy = 0.0
+        self.pushes_since_resync = 0
+    
+    def resync(self) -> None:
+        y = self.window.to_array()
+        self.sum_y = y.sum()
+        self.sum_xy = y @ np.arange(y.shape[0], dtype=np.float64)
+        self.sum_yy = y @ y
+        self.pushes_since_resync = 0
+    
+    def push(self, x:float) -> float:
+        was_ready = self.window.ready
+        full = len(self.window.values) == self.n
+        old = self.window.values[0] if full else np.nan
+        self.window.push(x)
+        if not self.window.ready:
+            return np.nan
+        self.pushes_since_resync += 1
+        if not was_ready or self.pushes_since_resync >= self.n:
+            self.resync()
+        else:
+            # drop the oldest value, shift all x positions down by one, add the new value at n - 1
+            self.sum_xy += (self.n - 1) * x - (self.sum_y - old)
+            self.sum_y += x - old
+            self.sum_yy += x * x - old * old
+        return float(linregress_trend_from_sums(self.n, self.sum_y, self.sum_xy, self.sum_yy))
+
+class _RollingExtreme:
+    def __init__(self, n:int, mode:str='max') -> None:
+        if mode not in ('max', 'min'):
+            raise ValueError("Invalid mode: must be 'max' or 'min'")
+        self.n = n
+        self.sign = 1. if mode == 'max' else -1.
+        self.candidates = deque()  # monotonic (position, value) pairs
+        self.nan_positions = deque()
+        self.position = -1
+    
+    def push(self, x:float) -> None:
+        self.position += 1
+        first_valid = self.position - self.n + 1
+        while self.candidates and self.candidates[0][0] < first_valid:
+            self.candidates.popleft()
+        while self.nan_positions and self.nan_positions[0] < first_valid:
+            self.nan_positions.popleft()
+        if math.isnan(x):
+            self.nan_positions.append(self.position)
+            return
+        while self.candidates and self.sign * self.candidates[-1][1] <= self.sign * x:
+            self.candidates.pop()
+        self.candidates.append((self.position, x))
+    
+    def value(self) -> float:
+        if self.position < self.n - 1 or self.nan_positions or not self.candidates:
+            return np.nan
+        return self.candidates[0][1]
+
+class _AdjustedEWM:
+    """
+    mirrors pandas' ewm(adjust=True, ignore_na=False) arithmetic
+    """
+    def __init__(self, alpha:float, min_periods:int) -> None:
+        self.old_wt_factor = 1. - alpha
+        self.min_periods = min_periods
+        self.weighted_avg = np.nan
+        self.old_wt = 1.
+        self.nobs = 0
+    
+    def push(self, x:float) -> float:
+        is_observation = not math.isnan(x)
+        self.nobs += int(is_observation)
+        if not math.isnan(self.weighted_avg):
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if self.weighted_avg != x:
+                    self.weighted_avg = (self.old_wt * self.weighted_avg + x) / (self.old_wt + 1.)
+                self.old_wt += 1.
+        elif is_observation:
+            self.weighted_avg = x
+        return self.weighted_avg if self.nobs >= self.min_periods else np.nan
+
+class _SeededMovingAverage:
+    """
+    TA-Lib style recursive average: simple average of the first n values, then
+    exponential (k = 2 / (n + 1)) or Wilder (k = 1 / n) smoothing
+    """
+    def __init__(self, n:int, wilder:bool=False) -> None:
+        self.n = n
+        self.wilder = wilder
+        self.k = 2. / (n + 1.)
+        self.seed_values = list()
+        self.value = np.nan
+    
+    def push(self, x:float) -> float:
+        if math.isnan(x):
+            return self.value
+        if len(self.seed_values) < self.n:
+            self.seed_values.append(x)
+            if len(self.seed_values) == self.n:
+                self.value = sum(self.seed_values) / self.n
+        elif self.wilder:
+            self.value = (self.value * (self.n - 1) + x) / self.n
+        else:
+            self.value = (x - self.value) * self.k + self.value
+        return self.value
+
+class _EMA:
+    def __init__(self, n:int) -> None:
+        if TALIB_SEMANTICS:
+            self.average = _SeededMovingAverage(n)
+        else:
+            self.average = _AdjustedEWM(2. / (n + 1.), n)
+    
+    def push(self, x:float) -> float:
+        return self.average.push(x)
+
+class _RSI:
+    def __init__(self, n:int) -> None:
+        self.prev_close = np.nan
+        if TALIB_SEMANTICS:
+            self.up_avg = _SeededMovingAverage(n, wilder=True)
+            self.down_avg = _SeededMovingAverage(n, wilder=True)
+        else:
+            self.up_avg = _AdjustedEWM(1. / n, n)
+            self.down_avg = _AdjustedEWM(1. / n, n)
+    
+    def push(self, close:float) -> float:
+        diff = close - self.prev_close
+        self.prev_close = close
+        if TALIB_SEMANTICS:
+            if math.isnan(diff):
+                return np.nan
+            up = self.up_avg.push(max(diff, 0.))
+            down = self.down_avg.push(max(-diff, 0.))
+            return 100. * _divide(up, up + down, zero_value=0.)
+        else:
+            # the fallback maps the undefined first difference to zero gain and loss
+            up = self.up_avg.push(diff if diff >= 0. else 0.)
+            down = self.down_avg.push(-diff if diff < 0. else 0.)
+            return 100. - _divide(100., 1. + _divide(up, down))
+
+class _ATR:
+    def __init__(self, n:int) -> None:
+        self.prev_close = np.nan
+        if TALIB_SEMANTICS:
+            self.average = _SeededMovingAverage(n, wilder=True)
+        else:
+            self.average = _AdjustedEWM(1. / n, n)
+    
+    def push(self, high:float, low:float, close:float) -> float:
+        true_range = max(
+            abs(high - low),
+            abs(high - self.prev_close),
+            abs(low - self.prev_close)
+        ) if not math.isnan(self.prev_close) else np.nan
+        self.prev_close = close
+        return self.average.push(true_range)
+
+class _StochasticOscillator:
+    def __init__(self, fastk_period:int, smoothing_periods:list) -> None:
+        self.highest = _RollingExtreme(fastk_period, 'max')
+        self.lowest = _RollingExtreme(fastk_period, 'min')
+        self.smoothing = [_RollingWindow(n) for n in smoothing_periods]
+    
+    def push(self, high:float, low:float, close:float) -> list:
+        self.highest.push(high)
+        self.lowest.push(low)
+        h, l = self.highest.value(), self.lowest.value()
+        if TALIB_SEMANTICS:
+            k = 100. * _divide(close - l, h - l, zero_value=0.)
+        else:
+            k = 100. * _divide(close - l, h - l)
+        outputs = list()
+        x = k
+        for window in self.smoothing:
+            window.push(x)
+            x = window.mean()
+            outputs.append(x)
+        if TALIB_SEMANTICS and math.isnan(outputs[-1]):
+            # TA-Lib starts all outputs at the lookback of the last one
+            outputs = [np.nan] * len(outputs)
+        return outputs
+
+class TechnicalsV04Stream:
+    """
+    constant time per candle equivalent of apply_technicals_v04_full
+    """
+    def __init__(self) -> None:
+        self.rsi = _RSI(14)
+        self.rsi_trend = _RollingTrend(10)
+        self.ema10 = _EMA(10)
+        self.ema20 = _EMA(21)
+        self.sma = {n: _RollingWindow(n) for n in (50, 100, 200, 500, 1000)}
+        self.std20 = _RollingWindow(20)
+        self.atr10 = _ATR(10)
+        self.atr100 = _ATR(100)
+        self.stoch = _StochasticOscillator(5, [3, 5])
+        self.stochrsi = _StochasticOscillator(5, [1, 3])
+        self.n_updates = 0
+    
+    def update(self, tick:Union[dict, pd.Series]) -> dict:
+        high = float(tick['high'])
+        low = float(tick['low'])
+        close = float(tick['close'])
+        self.n_updates += 1
+        
+        rsi = self.rsi.push(close)
+        rsi_trend = self.rsi_trend.push(rsi)
+        
+        for window in self.sma.values():
+            window.push(close)
+        self.std20.push(close)
+        
+        ema20 = self.ema20.push(close)
+        atr10 = self.atr10.push(high, low, close)
+        stoch_slowk, stoch_slowd = self.stoch.push(high, low, close)
+        stochrsi_fastk, stochrsi_fastd = self.stochrsi.push(rsi, rsi, rsi)
+        
+        return {
+            'rsi': rsi,
+            'rsi_trend': rsi_trend,
+            'ema10': self.ema10.push(close),
+            'ema20': ema20,
+            'sma50': self.sma[50].mean(),
+            'sma100': self.sma[100].mean(),
+            'sma200': self.sma[200].mean(),
+            'sma500': self.sma[500].mean(),
+            'sma1000': self.sma[1000].mean(),
+            'std20': self.std20.std(),
+            'atr10': atr10,
+            'atr100': self.atr100.push(high, low, close),
+            'keltner_upper': ema20 + 2 * atr10,
+            'keltner_lower': ema20 - 2 * atr10,
+            'stoch_slowk': stoch_slowk,
+            'stoch_slowd': stoch_slowd,
+            'stochrsi_fastk': stochrsi_fastk,
+            'stochrsi_fastd': stochrsi_fastd
+        }
+    
+    def seed(self, df:pd.DataFrame) -> pd.DataFrame:
+        rows = [self.update(tick) for tick in df.loc[:, ['high', 'low', 'close']].to_dict('records')]
+        return pd.DataFrame(rows, index=df.index, columns=TECHNICALS_V04_COLUMNS)
@@ -1,89 +1,358 @@
 import numpy as np
 import pandas as pd
+from scipy.signal import lfilter
+from numpy.lib.stride_tricks import sliding_window_view
+
+# inputs can be a DataFrame (returns Series/DataFrame like talib.abstract)
+# or a dict of arrays (returns arrays, multiple outputs as a list)
+
+def _column(inputs, name:str) -> np.ndarray:
+    return np.asarray(inputs[name], dtype=np.float64)
+
+def _output(inputs, values, names=None):
+    if isinstance(inputs, pd.DataFrame):
+        if names is None:
+            return pd.Series(values, index=inputs.index)
+        return pd.DataFrame(np.column_stack(values), columns=names, index=inputs.index)
+    return values if names is None else list(values)
+
+def _shift(x:np.ndarray, periods:int=1) -> np.ndarray:
+    shifted = np.full(x.shape[0], np.nan)
+    shifted[periods:] = x[:-periods]
+    return shifted
+
+def _rolling_mean(x:np.ndarray, timeperiod:int) -> np.ndarray:
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] < timeperiod:
+        return out
+    is_nan = np.isnan(x)
+    reference = x[~is_nan][0] if not is_nan.all() else 0.  # keeps the cumulative sum small
+    sums = np.concatenate(([0.], np.cumsum(np.where(is_nan, 0., x - reference))))
+    nan_counts = np.concatenate(([0], np.cumsum(is_nan)))
+    window_sums = sums[timeperiod:] - sums[:-timeperiod]
+    window_nan_counts = nan_counts[timeperiod:] - nan_counts[:-timeperiod]
+    out[timeperiod - 1:] = np.where(window_nan_counts == 0, window_sums / timeperiod + reference, np.nan)
+    return out
+
+def _rolling_extreme(x:np.ndarray, timeperiod:int, mode:str) -> np.ndarray:
+    # van Herk/Gil-Werman: prefix and suffix extremes within blocks of length timeperiod
+    combine = np.maximum if mode == 'max' else np.minimum
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+    if n < timeperiod:
+        return out
+    n_blocks = -(-n // timeperiod)
+    padded = np.full(n_blocks * timeperiod, -np.inf if mode == 'max' else np.inf)
+    padded[:n] = x
+    blocks = padded.reshape(n_blocks, timeperiod)
+    prefix = combine.accumulate(blocks, axis=1).ravel()
+    suffix = combine.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    out[timeperiod - 1:] = combine(suffix[:n - timeperiod + 1], prefix[timeperiod - 1:n])
+    return out
+
+def _rolling_var(x:np.ndarray, timeperiod:int, ddof:int) -> np.ndarray:
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] >= timeperiod:
+        out[timeperiod - 1:] = sliding_window_view(x, timeperiod).var(axis=1, ddof=ddof)
+    return out
+
+def _ewm_mean(x:np.ndarray, alpha:float, min_periods:int) -> np.ndarray:
+    # equals pd.Series(x).ewm(alpha=alpha, min_periods=min_periods).mean() (adjust=True, ignore_na=False)
+    is_observation = ~np.isnan(x)
+    filter_coefficients = ([1.], [1., alpha - 1.])
+    weighted_sums = lfilter(*filter_coefficients, np.where(is_observation, x, 0.))
+    weights = lfilter(*filter_coefficients, is_observation.astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = weighted_sums / weights
+    out[np.cumsum(is_observation) < max(min_periods, 1)] = np.nan
+    return out
+
+def _rsi(close:np.ndarray, timeperiod:int) -> np.ndarray:
+    diff = close - _shift(close)
+    up = np.where(diff >= 0., diff, 0.)
+    down = -np.where(diff < 0., diff, 0.)
+    up_weighted_avg = _ewm_mean(up, 1./timeperiod, timeperiod)
+    down_weighted_avg = _ewm_mean(down, 1./timeperiod, timeperiod)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100. - 100. / (1. + up_weighted_avg / down_weighted_avg)
+
+def _stochastic(x:np.ndarray, high:np.ndarray, low:np.ndarray, period:int) -> np.ndarray:
+    h = _rolling_extreme(high, period, 'max')
+    l = _rolling_extreme(low, period, 'min')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100. * (x - l) / (h - l)
 
 def SMA(df, timeperiod=30):
-    return df['close'].rolling(timeperiod).mean()
+    return _output(df, _rolling_mean(_column(df, 'close'), timeperiod))
 
 def EMA(df, timeperiod=30):
-    return df['close'].ewm(span=timeperiod, min_periods=timeperiod).mean()
+    return _output(df, _ewm_mean(_column(df, 'close'), 2. / (timeperiod + 1.), timeperiod))
 
 def VAR(df, timeperiod=5, ddof=0):
-    return df['close'].rolling(timeperiod).var(ddof=ddof)
+    return _output(df, _rolling_var(_column(df, 'close'), timeperiod, ddof))
 
 def STDDEV(df, timeperiod=5, ddof=0):
-    return df['close'].rolling(timeperiod).std(ddof=ddof)
+    return _output(df, np.sqrt(_rolling_var(_column(df, 'close'), timeperiod, ddof)))
 
 def ATR(df, timeperiod=14):
-    dhl = np.abs((df['high'] - df['low']).to_numpy())
-    dhc = np.abs((df['high'] - df['close'].shift(1)).to_numpy())
-    dlc = np.abs((df['low'] - df['close'].shift(1)).to_numpy())
-    true_range = pd.Series(np.array([dhl, dhc, dlc]).T.max(1), index=df.index)
-    return true_range.ewm(alpha=1./timeperiod, min_periods=timeperiod).mean()
+    high = _column(df, 'high')
+    low = _column(df, 'low')
+    prev_close = _shift(_column(df, 'close'))
+    true_range = np.maximum(np.maximum(np.abs(high - low), np.abs(high - prev_close)), np.abs(low - prev_close))
+    return _output(df, _ewm_mean(true_range, 1./timeperiod, timeperiod))
 
 def RSI(df, timeperiod=14):
-    diff = df['close'] - df['close'].shift(1)
-    up = diff.where(diff >= 0., 0.)
-    down = -diff.where(diff < 0., 0.)
-    up_weighted_avg = up.ewm(alpha=1./timeperiod, min_periods=timeperiod).mean()
-    down_weighted_avg = down.ewm(alpha=1./timeperiod, min_periods=timeperiod).mean()
-    return 100. - 100. / (1. + up_weighted_avg / down_weighted_avg)
+    return _output(df, _rsi(_column(df, 'close'), timeperiod))
 
 def STOCH(df, fastk_period=5, slowk_period=3, slowd_period=3):
-    h = df['high'].rolling(fastk_period).max()
-    l = df['low'].rolling(fastk_period).min()
-    fastk = 100. * (df['close'] - l) / (h - l)
-    slowk = fastk.rolling(slowk_period).mean()
-    slowd = slowk.rolling(slowd_period).mean().to_numpy()
-    slowk = slowk.to_numpy()
-    return pd.DataFrame(np.array([slowk, slowd]).T, columns=['slowk', 'slowd'], index=df.index)
+    fastk = _stochastic(_column(df, 'close'), _column(df, 'high'), _column(df, 'low'), fastk_period)
+    slowk = _rolling_mean(fastk, slowk_period)
+    slowd = _rolling_mean(slowk, slowd_period)
+    return _output(df, (slowk, slowd), ['slowk', 'slowd'])
 
 def STOCHRSI(df, timeperiod=14, fastk_period=5, fastd_period=3):
-    rsi = RSI(df, timeperiod=timeperiod)
-    h = rsi.rolling(fastk_period).max()
-    l = rsi.rolling(fastk_period).min()
-    fastk = 100. * (rsi - l) / (h - l)
-    fastd = fastk.rolling(fastd_period).mean().to_numpy()
-    fastk = fastk.to_numpy()
-    return pd.DataFrame(np.array([fastk, fastd]).T, columns=['fastk', 'fastd'], index=df.index)
+    rsi = _rsi(_column(df, 'close'), timeperiod)
+    fastk = _stochastic(rsi, rsi, rsi, fastk_period)
+    fastd = _rolling_mean(fastk, fastd_period)
+    return _output(df, (fastk, fastd), ['fastk', 'fastd'])
+
+# TA-Lib default candle settings: (range type, averaging period, factor), where the average
+# is taken over the `period` candles before the one it is compared with
+_CANDLE_SETTINGS = {
+    'BodyLong': ('RealBody', 10, 1.0),
+    'BodyShort': ('RealBody', 10, 1.0),
+    'BodyDoji': ('HighLow', 10, 0.1),
+    'ShadowLong': ('RealBody', 0, 1.0),
+    'ShadowVeryShort': ('HighLow', 10, 0.1),
+    'Near': ('HighLow', 5, 0.2)
+}
+
+class _Candles:
+    """
+    body and shadow intermediates shared by the CDL* functions
+    """
+    def __init__(self, inputs) -> None:
+        self.open = _column(inputs, 'open')
+        self.high = _column(inputs, 'high')
+        self.low = _column(inputs, 'low')
+        self.close = _column(inputs, 'close')
+        self.n = self.close.shape[0]
+        self.body_top = np.maximum(self.open, self.close)
+        self.body_bottom = np.minimum(self.open, self.close)
+        self.ranges = {
+            'RealBody': np.abs(self.close - self.open),
+            'HighLow': self.high - self.low
+        }
+        self.real_body = self.ranges['RealBody']
+        self.upper_shadow = self.high - self.body_top
+        self.lower_shadow = self.body_bottom - self.low
+        self.color = np.where(self.close >= self.open, 1, -1)
+        self.__averages = dict()
+    
+    def average(self, setting:str, shift:int=0) -> np.ndarray:
+        # setting average of the candle `shift` positions back, nan where it is undefined
+        if setting not in self.__averages:
+            range_type, period, factor = _CANDLE_SETTINGS[setting]
+            if period == 0:
+                self.__averages[setting] = factor * self.ranges[range_type]
+            else:
+                self.__averages[setting] = factor * _shift(_rolling_mean(self.ranges[range_type], period))
+        return _shift(self.__averages[setting], shift) if shift else self.__averages[setting]
+    
+    def previous(self, x:np.ndarray, periods:int=1) -> np.ndarray:
+        return _shift(x, periods)
+    
+    def lookback(self, *settings:str) -> int:
+        return max(_CANDLE_SETTINGS[setting][1] for setting in settings)
+    
+    def signal(self, values:np.ndarray, lookback:int) -> np.ndarray:
+        out = values.astype(np.int32)
+        out[:lookback] = 0
+        return out
+
+def _engulfing(candles:_Candles) -> np.ndarray:
+    o, c = candles.open, candles.close
+    prev_o, prev_c = candles.previous(o), candles.previous(c)
+    color, prev_color = candles.color, candles.previous(candles.color)
+    bullish = (color == 1) & (prev_color == -1) & (
+        ((c >= prev_o) & (o < prev_c)) | ((c > prev_o) & (o <= prev_c))
+    )
+    bearish = (color == -1) & (prev_color == 1) & (
+        ((o >= prev_c) & (c < prev_o)) | ((o > prev_c) & (c <= prev_o))
+    )
+    strength = np.where((o != prev_c) & (c != prev_o), 100, 80)
+    return candles.signal(np.where(bullish | bearish, color * strength, 0), 2)
+
+def _hammer(candles:_Candles, hanging_man:bool=False) -> np.ndarray:
+    small_body_long_lower_shadow = (
+        (candles.real_body < candles.average('BodyShort'))
+        & (candles.lower_shadow > candles.average('ShadowLong'))
+        & (candles.upper_shadow < candles.average('ShadowVeryShort'))
+    )
+    if hanging_man:
+        near_extreme = candles.body_bottom >= candles.previous(candles.high) - candles.average('Near', 1)
+    else:
+        near_extreme = candles.body_bottom <= candles.previous(candles.low) + candles.average('Near', 1)
+    lookback = candles.lookback('BodyShort', 'ShadowLong', 'ShadowVeryShort', 'Near') + 1
+    return candles.signal(np.where(small_body_long_lower_shadow & near_extreme, -100 if hanging_man else 100, 0), lookback)
+
+def _inverted_hammer(candles:_Candles, shooting_star:bool=False) -> np.ndarray:
+    small_body_long_upper_shadow = (
+        (candles.real_body < candles.average('BodyShort'))
+        & (candles.upper_shadow > candles.average('ShadowLong'))
+        & (candles.lower_shadow < candles.average('ShadowVeryShort'))
+    )
+    if shooting_star:
+        gap = candles.body_bottom > candles.previous(candles.body_top)
+    else:
+        gap = candles.body_top < candles.previous(candles.body_bottom)
+    lookback = candles.lookback('BodyShort', 'ShadowLong', 'ShadowVeryShort') + 1
+    return candles.signal(np.where(small_body_long_upper_shadow & gap, -100 if shooting_star else 100, 0), lookback)
+
+def _harami(candles:_Candles) -> np.ndarray:
+    prev_top, prev_bottom = candles.previous(candles.body_top), candles.previous(candles.body_bottom)
+    long_then_short = (
+        (candles.previous(candles.real_body) > candles.average('BodyLong', 1))
+        & (candles.real_body <= candles.average('BodyShort'))
+    )
+    inside = (candles.body_top < prev_top) & (candles.body_bottom > prev_bottom)
+    touching = (candles.body_top <= prev_top) & (candles.body_bottom >= prev_bottom)
+    strength = np.where(inside, 100, np.where(touching, 80, 0))
+    lookback = candles.lookback('BodyShort', 'BodyLong') + 1
+    return candles.signal(np.where(long_then_short, -candles.previous(candles.color) * strength, 0), lookback)
+
+def _star(candles:_Candles, evening:bool=False, penetration:float=0.3) -> np.ndarray:
+    # morning star: long black candle, short candle gapping down, white candle closing well into the first
+    direction = -1 if evening else 1
+    first_body = candles.previous(candles.real_body, 2)
+    first_close = candles.previous(candles.close, 2)
+    if evening:
+        gap = candles.previous(candles.body_bottom) > candles.previous(candles.body_top, 2)
+        closes_into_first = candles.close < first_close - first_body * penetration
+    else:
+        gap = candles.previous(candles.body_top) < candles.previous(candles.body_bottom, 2)
+        closes_into_first = candles.close > first_close + first_body * penetration
+    pattern = (
+        (first_body > candles.average('BodyLong', 2))
+        & (candles.previous(candles.color, 2) == -direction)
+        & (candles.previous(candles.real_body) <= candles.average('BodyShort', 1))
+        & gap
+        & (candles.real_body > candles.average('BodyShort'))
+        & (candles.color == direction)
+        & closes_into_first
+    )
+    lookback = candles.lookback('BodyShort', 'BodyLong') + 2
+    return candles.signal(np.where(pattern, 100 * direction, 0), lookback)
+
+def _spinning_top(candles:_Candles) -> np.ndarray:
+    pattern = (
+        (candles.real_body < candles.average('BodyShort'))
+        & (candles.upper_shadow > candles.real_body)
+        & (candles.lower_shadow > candles.real_body)
+    )
+    return candles.signal(np.where(pattern, 100 * candles.color, 0), candles.lookback('BodyShort'))
+
+def _doji(candles:_Candles) -> np.ndarray:
+    is_doji = candles.real_body <= candles.average('BodyDoji')
+    return candles.signal(np.where(is_doji, 100, 0), candles.lookback('BodyDoji'))
+
+def _doji_star(candles:_Candles) -> np.ndarray:
+    prev_color = candles.previous(candles.color)
+    gap_up = candles.body_bottom > candles.previous(candles.body_top)
+    gap_down = candles.body_top < candles.previous(candles.body_bottom)
+    pattern = (
+        (candles.previous(candles.real_body) > candles.average('BodyLong', 1))
+        & (candles.real_body <= candles.average('BodyDoji'))
+        & (((prev_color == 1) & gap_up) | ((prev_color == -1) & gap_down))
+    )
+    lookback = candles.lookback('BodyDoji', 'BodyLong') + 1
+    return candles.signal(np.where(pattern, -prev_color * 100, 0), lookback)
+
+def _long_legged_doji(candles:_Candles) -> np.ndarray:
+    pattern = (candles.real_body <= candles.average('BodyDoji')) & (
+        (candles.lower_shadow > candles.average('ShadowLong'))
+        | (candles.upper_shadow > candles.average('ShadowLong'))
+    )
+    return candles.signal(np.where(pattern, 100, 0), candles.lookback('BodyDoji', 'ShadowLong'))
+
+def _one_sided_doji(candles:_Candles, long_shadow:np.ndarray, short_shadow:np.ndarray) -> np.ndarray:
+    pattern = (
+        (candles.real_body <= candles.average('BodyDoji'))
+        & (short_shadow < candles.average('ShadowVeryShort'))
+        & (long_shadow > candles.average('ShadowVeryShort'))
+    )
+    return candles.signal(np.where(pattern, 100, 0), candles.lookback('BodyDoji', 'ShadowVeryShort'))
+
+_CANDLE_PATTERNS = {
+    'CDLENGULFING': _engulfing,
+    'CDLHAMMER': _hammer,
+    'CDLINVERTEDHAMMER': _inverted_hammer,
+    'CDLHARAMI': _harami,
+    'CDLHANGINGMAN': lambda candles: _hammer(candles, hanging_man=True),
+    'CDLMORNINGSTAR': _star,
+    'CDLEVENINGSTAR': lambda candles: _star(candles, evening=True),
+    'CDLSHOOTINGSTAR': lambda candles: _inverted_hammer(candles, shooting_star=True),
+    'CDLSPINNINGTOP': _spinning_top,
+    'CDLDOJI': _doji,
+    'CDLDOJISTAR': _doji_star,
+    'CDLLONGLEGGEDDOJI': _long_legged_doji,
+    'CDLDRAGONFLYDOJI': lambda candles: _one_sided_doji(candles, candles.lower_shadow, candles.upper_shadow),
+    'CDLGRAVESTONEDOJI': lambda candles: _one_sided_doji(candles, candles.upper_shadow, candles.lower_shadow)
+}
+
+def candle_patterns(df, names=None):
+    """
+    all (or the named) CDL* outputs from one set of body/shadow intermediates,
+    as a DataFrame (or dict of arrays) with the function names as columns
+    """
+    candles = _Candles(df)
+    if names is None:
+        names = list(_CANDLE_PATTERNS)
+    outputs = {name: _CANDLE_PATTERNS[name](candles) for name in names}
+    if isinstance(df, pd.DataFrame):
+        return pd.DataFrame(outputs, index=df.index, columns=names)
+    return outputs
 
 def CDLENGULFING(df):
-    return 0
+    return _output(df, _engulfing(_Candles(df)))
 
 def CDLHAMMER(df):
-    return 0
+    return _output(df, _hammer(_Candles(df)))
 
 def CDLINVERTEDHAMMER(df):
-    return 0
+    return _output(df, _inverted_hammer(_Candles(df)))
 
 def CDLHARAMI(df):
-    return 0
+    return _output(df, _harami(_Candles(df)))
 
 def CDLHANGINGMAN(df):
-    return 0
+    return _output(df, _hammer(_Candles(df), hanging_man=True))
 
-def CDLMORNINGSTAR(df):
-    return 0
+def CDLMORNINGSTAR(df, penetration=0.3):
+    return _output(df, _star(_Candles(df), penetration=penetration))
 
-def CDLEVENINGSTAR(df):
-    return 0
+def CDLEVENINGSTAR(df, penetration=0.3):
+    return _output(df, _star(_Candles(df), evening=True, penetration=penetration))
 
 def CDLSHOOTINGSTAR(df):
-    return 0
+    return _output(df, _inverted_hammer(_Candles(df), shooting_star=True))
 
 def CDLSPINNINGTOP(df):
-    return 0
+    return _output(df, _spinning_top(_Candles(df)))
 
 def CDLDOJI(df):
-    return 0
+    return _output(df, _doji(_Candles(df)))
 
 def CDLDOJISTAR(df):
-    return 0
+    return _output(df, _doji_star(_Candles(df)))
 
 def CDLLONGLEGGEDDOJI(df):
-    return 0
+    return _output(df, _long_legged_doji(_Candles(df)))
 
 def CDLDRAGONFLYDOJI(df):
-    return 0
+    candles = _Candles(df)
+    return _output(df, _one_sided_doji(candles, candles.lower_shadow, candles.upper_shadow))
 
 def CDLGRAVESTONEDOJI(df):
-    return 0
+    candles = _Candles(df)
+    return _output(df, _one_sided_doji(candles, candles.upper_shadow, candles.lower_shadow))
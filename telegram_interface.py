@@ -1,11 +1,15 @@
 import sys
+from typing import Union
 import datetime as dt
 from twisted.internet import reactor
 from telegram import Update
 from telegram.bot import Bot
 from telegram.ext import Updater, CommandHandler, CallbackContext
 from telegram.constants import PARSEMODE_HTML
-from binance_interface import tsm
+from binance_interface import tsm, state_machines, TradeStateMachine
+from http_session import format_http_stats, dump_http_stats, rate_limiter
+from rate_limits import format_rate_limits
+from order_executor import order_executor
 from bot_utils import (
     BUY_TYPE, OCO_STOPLOSS_TYPE, SELL_TYPE, STOPLOSS_TYPE,
     ORDER_TYPE_DICT,
@@ -13,11 +17,8 @@ from bot_utils import (
     rounddown
 )
 from config import (
-    ASSET,
-    QUOTE_ASSET,
-    QTY_DEC_PLACES,
-    PRICE_DEC_PLACES,
     PREDICTION_MA_WINDOW,
+    HTTP_STATS_PATH,
     TG_RECIPIENT,
     TG_BOT_TOKEN
 )
@@ -25,46 +26,72 @@ from config import (
 def send(*args, **kwargs) -> None:
     bot.send_message(TG_RECIPIENT, *args, **kwargs)
 
+def _command_state_machine(context:CallbackContext) -> Union[TradeStateMachine, None]:
+    # commands act on the main pair unless a symbol is given, e.g. /enable ETHUSDT
+    if len(context.args) == 0:
+        return tsm
+    sm = state_machines.get(context.args[0].upper(), None)
+    if sm is None:
+        msg = 'Unknown symbol. Available symbols: {:s}'.format(', '.join(state_machines.keys()))
+        context.bot.send_message(TG_RECIPIENT, msg)
+    return sm
+
 def bot_enable_trading(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        tsm.trading_enabled = True
-        msg = 'Trading has been enabled'
+        sm = _command_state_machine(context)
+        if sm is None: return
+        sm.trading_enabled = True
+        msg = _state_machine_and_label(sm)[1] + 'Trading has been enabled'
         print(get_timestamp(), msg.lower(), flush=True)
         context.bot.send_message(TG_RECIPIENT, msg)
 
 def bot_disable_trading(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        tsm.trading_enabled = False
-        msg = 'Trading has been disabled'
+        sm = _command_state_machine(context)
+        if sm is None: return
+        sm.trading_enabled = False
+        msg = _state_machine_and_label(sm)[1] + 'Trading has been disabled'
         print(get_timestamp(), msg.lower(), flush=True)
         context.bot.send_message(TG_RECIPIENT, msg)
 
 def bot_enable_stoploss(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        tsm.stoploss_enabled = True
-        msg = 'Stop-loss has been enabled'
+        sm = _command_state_machine(context)
+        if sm is None: return
+        sm.stoploss_enabled = True
+        msg = _state_machine_and_label(sm)[1] + 'Stop-loss has been enabled'
         print(get_timestamp(), msg.lower(), flush=True)
         context.bot.send_message(TG_RECIPIENT, msg)
 
 def bot_disable_stoploss(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        tsm.stoploss_enabled = False
-        msg = 'Stop-loss has been disabled'
+        sm = _command_state_machine(context)
+        if sm is None: return
+        sm.stoploss_enabled = False
+        msg = _state_machine_and_label(sm)[1] + 'Stop-loss has been disabled'
         print(get_timestamp(), msg.lower(), flush=True)
         context.bot.send_message(TG_RECIPIENT, msg)
 
+def _cancel_orders(sm:TradeStateMachine) -> None:
+    if sm.buy_order_active: sm.cancel_buy_order()
+    if sm.sell_order_active: sm.cancel_sell_order()
+    if sm.stoploss_order_active: sm.cancel_stoploss_order()
+
 def bot_cancel_order(update:Update, context:CallbackContext) -> None:
+    # queued behind the order commands of the kline handler
     if update.effective_chat.id == TG_RECIPIENT:
-        if tsm.buy_order_active: tsm.cancel_buy_order()
-        if tsm.sell_order_active: tsm.cancel_sell_order()
-        if tsm.stoploss_order_active: tsm.cancel_stoploss_order()
+        sm = _command_state_machine(context)
+        if sm is None: return
+        order_executor.submit(_cancel_orders, sm)
 
 def bot_reset_flags(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        tsm.buy_signal_flag = False
-        tsm.sell_order_req_flag = False
-        tsm.stoploss_order_req_flag = False
-        msg = 'Flags have been reset'
+        sm = _command_state_machine(context)
+        if sm is None: return
+        sm.buy_signal_flag = False
+        sm.sell_order_req_flag = False
+        sm.stoploss_order_req_flag = False
+        msg = _state_machine_and_label(sm)[1] + 'Flags have been reset'
         print(get_timestamp(), msg.lower(), flush=True)
         context.bot.send_message(TG_RECIPIENT, msg)
 
@@ -103,7 +130,21 @@ def bot_switch_mode(update:Update, context:CallbackContext) -> None:
 
 def bot_price_info(update:Update, context:CallbackContext) -> None:
     if update.effective_chat.id == TG_RECIPIENT:
-        msg = 'Current price: {:.{:d}f} {:s}'.format(tsm.last_price, PRICE_DEC_PLACES, QUOTE_ASSET)
+        sm = _command_state_machine(context)
+        if sm is None: return
+        msg = _state_machine_and_label(sm)[1] + 'Current price: {:.{:d}f} {:s}'.format(
+            sm.last_price,
+            sm.price_dec_places,
+            sm.quote_asset
+        )
+        context.bot.send_message(TG_RECIPIENT, msg)
+
+def bot_http_stats(update:Update, context:CallbackContext) -> None:
+    # latency per REST endpoint since the start, also written to HTTP_STATS_PATH, and the rate limit budget
+    if update.effective_chat.id == TG_RECIPIENT:
+        msg = format_http_stats() + '\n' + format_rate_limits(rate_limiter)
+        if dump_http_stats():
+            msg += '\nSaved to {:s}'.format(HTTP_STATS_PATH)
         context.bot.send_message(TG_RECIPIENT, msg)
 
 def bot_print_help(update:Update, context:CallbackContext) -> None:
@@ -116,128 +157,168 @@ def bot_handle_error(update:Update, context:CallbackContext) -> None:
     msg = '{:s}'.format(type(context.error).__name__)
     print(get_timestamp(), msg.lower(), flush=True)
 
-def notify(msg:str, **kwargs) -> None:
+def _state_machine_and_label(state_machine:Union[TradeStateMachine, None]) -> tuple:
+    # messages about any pair other than the main one are prefixed with its symbol
+    if state_machine is None or state_machine is tsm:
+        return tsm, ''
+    return state_machine, '[{:s}] '.format(state_machine.symbol)
+
+def notify(msg:str, state_machine:Union[TradeStateMachine, None]=None, **kwargs) -> None:
+    msg = _state_machine_and_label(state_machine)[1] + msg
     print(get_timestamp(), msg.lower(), flush=True)
     send(msg, **kwargs)
 
-def notify_order_placed(order_type:str, quantity:float, price:float, alert:bool=True) -> None:
+def notify_order_placed(
+    order_type: str,
+    quantity: float,
+    price: float,
+    alert: bool = True,
+    state_machine: Union[TradeStateMachine, None] = None
+) -> None:
+    sm, label = _state_machine_and_label(state_machine)
     silent = order_type == STOPLOSS_TYPE
-    order_id = tsm.get_order_id(order_type)
-    msg = 'New {:s} order for {:.{:d}f} {:s}'.format(
+    order_id = sm.get_order_id(order_type)
+    msg = label + 'New {:s} order for {:.{:d}f} {:s}'.format(
             ORDER_TYPE_DICT[order_type],
-            rounddown(quantity, QTY_DEC_PLACES),
-            QTY_DEC_PLACES,
-            ASSET
+            rounddown(quantity, sm.qty_dec_places),
+            sm.qty_dec_places,
+            sm.asset
         ) \
-        + ' at {:.{:d}f} {:s}'.format(price, PRICE_DEC_PLACES, QUOTE_ASSET) \
+        + ' at {:.{:d}f} {:s}'.format(price, sm.price_dec_places, sm.quote_asset) \
         + ' created (#{:s})'.format(str(order_id))
     print(get_timestamp(), msg.lower(), flush=True)
     if alert: send(msg, disable_notification=silent)
 
-def notify_order_cancelled(order_type:str, alert:bool=True) -> None:
+def notify_order_cancelled(
+    order_type: str,
+    alert: bool = True,
+    state_machine: Union[TradeStateMachine, None] = None
+) -> None:
+    sm, label = _state_machine_and_label(state_machine)
     silent = (order_type == STOPLOSS_TYPE or order_type == OCO_STOPLOSS_TYPE)
-    order_id = tsm.get_order_id(order_type)
+    order_id = sm.get_order_id(order_type)
     order_name = ORDER_TYPE_DICT[order_type]
-    msg = '{:s} order #{:s} has been cancelled'.format(
+    msg = label + '{:s} order #{:s} has been cancelled'.format(
         order_name[0].upper() + order_name[1:],
         str(order_id)
     )
     print(get_timestamp(), msg.lower(), flush=True)
     if alert: send(msg, disable_notification=silent)
 
-def notify_order_partially_filled(order_type:str, alert:bool=True) -> None:
-    order_id = tsm.get_order_id(order_type)
-    orig_qty = tsm.get_original_quantity(order_type)
-    exec_qty = tsm.get_executed_quantity(order_type)
-    cum_quote_qty = tsm.get_cumulative_quote_quantity(order_type)
+def notify_order_partially_filled(
+    order_type: str,
+    alert: bool = True,
+    state_machine: Union[TradeStateMachine, None] = None
+) -> None:
+    sm, label = _state_machine_and_label(state_machine)
+    order_id = sm.get_order_id(order_type)
+    orig_qty = sm.get_original_quantity(order_type)
+    exec_qty = sm.get_executed_quantity(order_type)
+    cum_quote_qty = sm.get_cumulative_quote_quantity(order_type)
     order_name = ORDER_TYPE_DICT[order_type]
-    msg = '{:s} order #{:s} has been partially filled:'.format(
+    msg = label + '{:s} order #{:s} has been partially filled:'.format(
             order_name[0].upper() + order_name[1:],
             str(order_id)
         ) \
-        + ' {:.{:d}f} {:s} for'.format(exec_qty, QTY_DEC_PLACES, ASSET) \
-        + ' {:.{:d}f} {:s}'.format(cum_quote_qty, PRICE_DEC_PLACES, QUOTE_ASSET) \
+        + ' {:.{:d}f} {:s} for'.format(exec_qty, sm.qty_dec_places, sm.asset) \
+        + ' {:.{:d}f} {:s}'.format(cum_quote_qty, sm.price_dec_places, sm.quote_asset) \
         + ' ({:.1f}%)'.format(100. * exec_qty / orig_qty)
     print(get_timestamp(), msg.lower(), flush=True)
     if alert: send(msg)
 
-def notify_order_filled(order_type:str, alert:bool=True) -> None:
-    order_id = tsm.get_order_id(order_type)
-    cum_quote_qty = tsm.get_cumulative_quote_quantity(order_type)
+def notify_order_filled(
+    order_type: str,
+    alert: bool = True,
+    state_machine: Union[TradeStateMachine, None] = None
+) -> None:
+    sm, label = _state_machine_and_label(state_machine)
+    order_id = sm.get_order_id(order_type)
+    cum_quote_qty = sm.get_cumulative_quote_quantity(order_type)
     order_name = ORDER_TYPE_DICT[order_type]
-    msg = '{:s} order #{:s} has been filled'.format(
+    msg = label + '{:s} order #{:s} has been filled'.format(
             order_name[0].upper() + order_name[1:],
             str(order_id)
         ) \
-        + ' for {:.{:d}f} {:s}!'.format(cum_quote_qty, PRICE_DEC_PLACES, QUOTE_ASSET)
+        + ' for {:.{:d}f} {:s}!'.format(cum_quote_qty, sm.price_dec_places, sm.quote_asset)
     print(get_timestamp(), msg.lower(), flush=True)
     if alert: send(msg)
 
-def notify_unexpected_order_status(order_type:str, status:str) -> None:
-    order_id = tsm.get_order_id(order_type)
+def notify_unexpected_order_status(
+    order_type: str,
+    status: str,
+    state_machine: Union[TradeStateMachine, None] = None
+) -> None:
+    sm = _state_machine_and_label(state_machine)[0]
+    order_id = sm.get_order_id(order_type)
     msg = 'Warning: {:s} order #{:s} returned status {:s}'.format(
         ORDER_TYPE_DICT[order_type],
         str(order_id),
         status
     )
-    notify(msg)
+    notify(msg, state_machine=sm)
 
 def notify_new_prediction(
     high: float,
     low: float,
     close: float,
     prediction: float,
-    prediction_ma: float
+    prediction_ma: float,
+    state_machine: Union[TradeStateMachine, None] = None
 ) -> None:
-    print(get_timestamp(), 'new prediction: {:+.3f}% (ma2: {:+.3f}%)'.format(
+    sm, label = _state_machine_and_label(state_machine)
+    print(get_timestamp(), '{:s}new prediction: {:+.3f}% (ma2: {:+.3f}%)'.format(
+        label.lower(),
         prediction,
         prediction_ma
     ), flush=True)
-    msg = '<b>High:</b> {:.{:d}f} {:s}\n'.format(high, PRICE_DEC_PLACES, QUOTE_ASSET) \
-        + '<b>Low:</b> {:.{:d}f} {:s}\n'.format(low, PRICE_DEC_PLACES, QUOTE_ASSET) \
-        + '<b>Close:</b> {:.{:d}f} {:s}\n'.format(close, PRICE_DEC_PLACES, QUOTE_ASSET) \
+    msg = label + '<b>High:</b> {:.{:d}f} {:s}\n'.format(high, sm.price_dec_places, sm.quote_asset) \
+        + '<b>Low:</b> {:.{:d}f} {:s}\n'.format(low, sm.price_dec_places, sm.quote_asset) \
+        + '<b>Close:</b> {:.{:d}f} {:s}\n'.format(close, sm.price_dec_places, sm.quote_asset) \
         + '<b>Prediction:</b> {:+.3f}%\n'.format(prediction) \
         + '<b>Prediction MA{:d}:</b> {:+.3f}%'.format(PREDICTION_MA_WINDOW, prediction_ma)
     send(msg, parse_mode=PARSEMODE_HTML, disable_notification=True)
 
-def notify_stoploss_update(stoploss_level:float) -> None:
+def notify_stoploss_update(stoploss_level:float, state_machine:Union[TradeStateMachine, None]=None) -> None:
+    sm = _state_machine_and_label(state_machine)[0]
     msg = 'Updating stop-loss level to {:.{:d}f} {:s}'.format(
         stoploss_level,
-        PRICE_DEC_PLACES,
-        QUOTE_ASSET
+        sm.price_dec_places,
+        sm.quote_asset
     )
-    notify(msg, disable_notification=True)
+    notify(msg, state_machine=sm, disable_notification=True)
 
-def notify_stoploss_hit() -> None:
-    reopen_time = tsm.stoploss_hit_timeout + dt.timedelta(hours=1)
+def notify_stoploss_hit(state_machine:Union[TradeStateMachine, None]=None) -> None:
+    sm = _state_machine_and_label(state_machine)[0]
+    reopen_time = sm.stoploss_hit_timeout + dt.timedelta(hours=1)
     ts_format = '%Y-%m-%d %H:%M (%Z)'
     msg = 'Stop-loss has been hit at {:.{:d}f} {:s}!\n'.format(
-        tsm.stoploss_level,
-        PRICE_DEC_PLACES,
-        QUOTE_ASSET
+        sm.stoploss_level,
+        sm.price_dec_places,
+        sm.quote_asset
     ) + 'Trading paused until {:s}'.format(reopen_time.strftime(ts_format))
-    notify(msg)
+    notify(msg, state_machine=sm)
 
-def notify_signal_activated(order_type:str) -> None:
+def notify_signal_activated(order_type:str, state_machine:Union[TradeStateMachine, None]=None) -> None:
+    sm = _state_machine_and_label(state_machine)[0]
     order_name = ORDER_TYPE_DICT[order_type]
     if order_type == BUY_TYPE:
-        target_price = tsm.buy_signal_price - tsm.buy_price_delta
+        target_price = sm.buy_signal_price - sm.buy_price_delta
     elif order_type == SELL_TYPE:
-        target_price = tsm.sell_signal_price + tsm.sell_price_delta
+        target_price = sm.sell_signal_price + sm.sell_price_delta
     else:
         raise ValueError('Unexpected order type encountered in notify_signal_activated')
     msg = '{:s} signal activated! Shadow limit currently at {:.{:d}f} {:s}'.format(
         order_name[0].upper() + order_name[1:],
         target_price,
-        PRICE_DEC_PLACES,
-        QUOTE_ASSET
+        sm.price_dec_places,
+        sm.quote_asset
     )
-    notify(msg)
+    notify(msg, state_machine=sm)
 
-def notify_signal_deactivated(order_type:str) -> None:
+def notify_signal_deactivated(order_type:str, state_machine:Union[TradeStateMachine, None]=None) -> None:
     order_name = ORDER_TYPE_DICT[order_type]
     msg = '{:s} signal deactivated'.format(order_name[0].upper() + order_name[1:])
-    notify(msg, disable_notification=True)
+    notify(msg, state_machine=state_machine, disable_notification=True)
 
 bot_commands = {
     'enable': bot_enable_trading,
@@ -249,6 +330,7 @@ bot_commands = {
     'restart': bot_restart,
     'mode': bot_switch_mode,
     'price': bot_price_info,
+    'http': bot_http_stats,
     'help': bot_print_help
 }
 
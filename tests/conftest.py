@@ -0,0 +1,22 @@
+"""
+config reads ./data/credentials.json on import, so the tests run from a temporary
+working directory with placeholder credentials; the repo root and the benchmarks
+(for synthetic_data) are put on sys.path
+"""
+import os
+import sys
+import json
+import shutil
+import atexit
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'benchmarks'))
+
+WORK_DIR = tempfile.mkdtemp(prefix='tradingbot_tests_')
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.makedirs(os.path.join(WORK_DIR, 'data'))
+with open(os.path.join(WORK_DIR, 'data', 'credentials.json'), 'w') as fh:
+    json.dump({'binance_key': ['key', 'secret'], 'tg_bot_token': '123456:test', 'tg_recipient': 0}, fh)
+os.chdir(WORK_DIR)
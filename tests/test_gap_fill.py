@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import df_utils
+from candle_store import CandleStore
+from candle_buffer import datetime_index_to_open_times
+from kline_downloader import to_milliseconds
+
+HOUR_MS = 3600 * 1000
+FIRST_OPEN_TIME = 1700000000000 // HOUR_MS * HOUR_MS
+N_CANDLES = 300
+
+def make_kline(open_time:int) -> list:
+    i = (open_time - FIRST_OPEN_TIME) // HOUR_MS
+    close = 30000. + 100. * np.sin(i / 10.)
+    values = [close - 5., close + 20., close - 25., close, 10. + i % 7, 3e5 + i, 100 + i, 5. + i % 3, 1.5e5 + i]
+    kline = [open_time] + ['{:.8f}'.format(v) for v in values[:5]]
+    return kline + [open_time + HOUR_MS - 1, '{:.8f}'.format(values[5]), int(values[6])] + ['{:.8f}'.format(v) for v in values[7:]] + ['0']
+
+@pytest.fixture
+def exchange(monkeypatch):
+    # N_CANDLES klines of the exchange from FIRST_OPEN_TIME on, all of them closed
+    def download_klines(symbol, interval, start, end=None):
+        first = -(-to_milliseconds(start) // HOUR_MS) * HOUR_MS
+        return [make_kline(t) for t in range(max(first, FIRST_OPEN_TIME), FIRST_OPEN_TIME + N_CANDLES * HOUR_MS, HOUR_MS)]
+    
+    monkeypatch.setattr(df_utils, 'download_klines', download_klines)
+    return df_utils.klines_to_dataframe([make_kline(FIRST_OPEN_TIME + i * HOUR_MS) for i in range(N_CANDLES)])
+
+def write_store(path:str, df) -> CandleStore:
+    return CandleStore.from_dataframe(path, df)
+
+def test_gap_is_appended_despite_float_noise_at_the_seam(tmp_path, exchange):
+    path = str(tmp_path / 'BTCUSDT_1h.candles')
+    local = exchange.iloc[:200].copy()
+    local.iloc[-1] *= 1. + 1e-12
+    write_store(path, local)
+    df_utils.fill_dataframe_gap('BTCUSDT', '1h', path, None, False)
+    stored = CandleStore(path).to_dataframe()
+    assert stored.shape[0] == N_CANDLES
+    np.testing.assert_allclose(stored.to_numpy(), exchange.to_numpy(), rtol=1e-9)
+
+def test_gap_fill_does_not_load_the_whole_store(tmp_path, exchange, monkeypatch):
+    path = str(tmp_path / 'BTCUSDT_1h.candles')
+    write_store(path, exchange.iloc[:200])
+    
+    def full_load(*args, **kwargs):
+        raise AssertionError('whole store loaded')
+    
+    monkeypatch.setattr(df_utils, 'load_local_candles', full_load)
+    monkeypatch.setattr(CandleStore, 'invalid', full_load)
+    df_utils.fill_dataframe_gap('BTCUSDT', '1h', path, None, False)
+    assert len(CandleStore(path)) == N_CANDLES
+
+def test_seam_mismatch_replaces_the_candle_and_keeps_the_history(tmp_path, exchange):
+    path = str(tmp_path / 'BTCUSDT_1h.candles')
+    local = exchange.iloc[:200].copy()
+    local.iloc[-1, local.columns.get_loc('volume')] /= 2.  # stored before the candle was final
+    write_store(path, local)
+    df_utils.fill_dataframe_gap('BTCUSDT', '1h', path, None, False)
+    stored = CandleStore(path).to_dataframe()
+    assert stored.index.equals(exchange.index)
+    np.testing.assert_array_equal(stored.to_numpy(), exchange.to_numpy())
+
+def test_full_download_never_shortens_the_store(tmp_path, exchange):
+    path = str(tmp_path / 'BTCUSDT_1h.candles')
+    write_store(path, exchange.iloc[:250])
+    start = str(exchange.index[200])
+    df = df_utils.download_dataframe('BTCUSDT', '1h', path, start, None, False)
+    # download_dataframe drops the last candle as the one still open
+    assert df.index[0] == exchange.index[200] and df.index[-1] == exchange.index[-2]
+    open_times = datetime_index_to_open_times(CandleStore(path).to_dataframe().index)
+    assert open_times[0] == FIRST_OPEN_TIME and len(open_times) == N_CANDLES - 1
@@ -0,0 +1,39 @@
+import kline_downloader
+from kline_downloader import KlineDownloader
+
+class FakeResponse:
+    def __init__(self, status_code:int, headers:dict=None, payload:list=None) -> None:
+        self.status_code = status_code
+        self.headers = headers or dict()
+        self.payload = payload
+    
+    def raise_for_status(self) -> None:
+        assert self.status_code == 200
+    
+    def json(self) -> list:
+        return self.payload
+
+class FakeSession:
+    # answers from a list of responses, optionally with a scheduler attribute
+    def __init__(self, responses:list, scheduler=None) -> None:
+        self.responses = list(responses)
+        self.scheduler = scheduler
+        self.n_requests = 0
+    
+    def get(self, url:str, params:dict=None, timeout:float=None) -> FakeResponse:
+        self.n_requests += 1
+        return self.responses.pop(0)
+
+def test_unscheduled_session_waits_for_retry_after(monkeypatch):
+    sleeps = list()
+    monkeypatch.setattr(kline_downloader.time, 'sleep', sleeps.append)
+    session = FakeSession([FakeResponse(429, {'Retry-After': '7'}), FakeResponse(418), FakeResponse(200, payload=[[0]])])
+    assert KlineDownloader(session=session).get_klines('BTCUSDT', '1h') == [[0]]
+    assert sleeps == [7., kline_downloader.DEFAULT_RETRY_AFTER]
+
+def test_scheduled_session_leaves_the_wait_to_the_scheduler(monkeypatch):
+    sleeps = list()
+    monkeypatch.setattr(kline_downloader.time, 'sleep', sleeps.append)
+    session = FakeSession([FakeResponse(429, {'Retry-After': '7'}), FakeResponse(200, payload=[[0]])], scheduler=object())
+    assert KlineDownloader(session=session).get_klines('BTCUSDT', '1h') == [[0]]
+    assert sleeps == [] and session.n_requests == 2
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from synthetic_data import make_candles
+from df_utils import ta, linregress_trend, rolling_linregress_trend
+from stream_technicals import _RollingTrend
+
+FLAT = slice(500, 520)
+
+@pytest.fixture
+def rsi():
+    values = ta.RSI(make_candles(1000, seed=5), timeperiod=14)
+    values.iloc[FLAT] = 50.
+    return values
+
+def flat_windows(n_rows:int, window:int) -> np.ndarray:
+    # rows whose window lies entirely in the constant stretch: r = 0/0, which recent
+    # SciPy returns as NaN, while the closed form defines the trend of a flat window as 0
+    rows = np.zeros(n_rows, dtype=bool)
+    rows[FLAT.start + window - 1:FLAT.stop] = True
+    return rows
+
+def check(trend:np.ndarray, rsi, window:int) -> None:
+    expected = rsi.rolling(window).apply(linregress_trend).to_numpy()
+    flat = flat_windows(rsi.shape[0], window)
+    np.testing.assert_allclose(trend[~flat], expected[~flat], rtol=1e-7, atol=1e-9)
+    np.testing.assert_array_equal(trend[flat], 0.)
+
+@pytest.mark.parametrize('window', [3, 10])
+def test_closed_form_matches_linregress_trend(rsi, window):
+    check(rolling_linregress_trend(rsi, window), rsi, window)
+    check(rolling_linregress_trend(rsi.to_numpy(), window), rsi, window)
+
+@pytest.mark.parametrize('window', [3, 10])
+def test_incremental_matches_linregress_trend(rsi, window):
+    trend = _RollingTrend(window)
+    check(np.array([trend.push(x) for x in rsi.to_numpy()]), rsi, window)
@@ -0,0 +1,56 @@
+import os
+import json
+from state_journal import StateJournal
+
+def make_journal(tmp_path, name:str='state', **kwargs) -> StateJournal:
+    snapshot_path = str(tmp_path / (name + '.json'))
+    with open(snapshot_path, 'w') as fh:
+        json.dump({'a': 0, 'b': 'x'}, fh)
+    journal = StateJournal(snapshot_path, str(tmp_path / (name + '.journal')), writer=None, **kwargs)
+    journal.load()
+    return journal
+
+def test_replay_after_restart(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.commit({'a': 1, 'b': 'x'})
+    journal.commit({'a': 2, 'b': 'y'})
+    restarted = StateJournal(journal.snapshot_path, journal.journal_path, writer=None)
+    assert restarted.load() == {'a': 2, 'b': 'y'}
+    assert restarted.seq == 2
+
+def test_seq_continues_after_compaction_and_restart(tmp_path):
+    journal = make_journal(tmp_path, compact_records=3)
+    for a in range(1, 5):
+        journal.commit({'a': a, 'b': 'x'})
+    assert os.path.exists(journal.journal_path + '.1')
+    
+    restarted = StateJournal(journal.snapshot_path, journal.journal_path, writer=None, compact_records=3)
+    assert restarted.load() == {'a': 4, 'b': 'x'}
+    assert restarted.seq == 4
+    restarted.compact()
+    restarted = StateJournal(journal.snapshot_path, journal.journal_path, writer=None, compact_records=3)
+    restarted.load()
+    assert restarted.seq == 4
+    restarted.commit({'a': 5, 'b': 'x'})
+    seqs = [record['seq'] for path in (journal.journal_path + '.1', journal.journal_path) for record in restarted.read_journal(path)]
+    assert seqs == sorted(set(seqs)) and seqs[-1] == 5
+
+def test_journals_of_several_pairs_share_the_writer(tmp_path):
+    # the same seq in two journals must not coalesce into one pending write
+    import threading
+    from persistence import WriteBehind
+    writer = WriteBehind()
+    release = threading.Event()
+    writer.submit('busy', release.wait)
+    journals = [make_journal(tmp_path, name) for name in ('state_BTCUSDT', 'state_ETHUSDT')]
+    for journal in journals:
+        journal.writer = writer
+        journal.commit({'a': 1, 'b': journal.snapshot_path})
+    release.set()
+    assert writer.flush(5.)
+    writer.close()
+    assert writer.n_coalesced == 0
+    for journal in journals:
+        records = journal.read_journal()
+        assert [record['seq'] for record in records] == [1]
+        assert records[0]['changes']['b'] == journal.snapshot_path
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import df_utils
+import stream_technicals
+from synthetic_data import make_candles
+from stream_technicals import TECHNICALS_V04_COLUMNS, TechnicalsV04Stream
+
+@pytest.fixture(params=['TA-Lib', 'talib_fallback'])
+def backend(request, monkeypatch):
+    # both the full recompute and the streaming engine follow the backend's semantics
+    if request.param == 'TA-Lib':
+        ta = pytest.importorskip('talib.abstract')
+    else:
+        import talib_fallback as ta
+    monkeypatch.setattr(df_utils, 'ta', ta)
+    monkeypatch.setattr(stream_technicals, 'TALIB_SEMANTICS', request.param == 'TA-Lib')
+    return request.param
+
+def streamed_columns(seeded, rows:list) -> dict:
+    return {col: np.concatenate([seeded[col].to_numpy(), [row[col] for row in rows]]) for col in TECHNICALS_V04_COLUMNS}
+
+@pytest.mark.parametrize('seed_rows', [1, 1100])
+def test_parity_with_full_recompute(backend, seed_rows):
+    df = make_candles(1500, seed=3)
+    expected = df_utils.apply_technicals_v04_full(df.copy())
+    technicals = TechnicalsV04Stream()
+    seeded = technicals.seed(df.iloc[:seed_rows])
+    rows = [technicals.update(tick) for tick in df.iloc[seed_rows:].to_dict('records')]
+    for col, streamed in streamed_columns(seeded, rows).items():
+        np.testing.assert_allclose(streamed, expected[col].to_numpy(), rtol=1e-9, atol=1e-9, err_msg=col)
+
+def test_parity_on_flat_prices(backend):
+    # zero ranges take the division special cases of each backend; the rsi of a flat stretch
+    # is constant only up to rounding, so its stochastic is rounding noise in both and left out
+    df = make_candles(1100, seed=4)
+    df.iloc[600:700, :4] = df.iloc[600]['close']
+    expected = df_utils.apply_technicals_v04_full(df.copy())
+    technicals = TechnicalsV04Stream()
+    seeded = technicals.seed(df)
+    for col in [col for col in TECHNICALS_V04_COLUMNS if not col.startswith('stochrsi')]:
+        np.testing.assert_allclose(seeded[col].to_numpy(), expected[col].to_numpy(), rtol=1e-9, atol=1e-9, err_msg=col)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+import talib_fallback
+from synthetic_data import make_candles
+
+# the pandas implementation talib_fallback replaced, the numbers it has to keep
+
+def reference_ewm(x:pd.Series, alpha:float, min_periods:int) -> pd.Series:
+    return x.ewm(alpha=alpha, min_periods=min_periods).mean()
+
+def reference_atr(df:pd.DataFrame, timeperiod:int) -> pd.Series:
+    prev_close = df['close'].shift(1)
+    ranges = [df['high'] - df['low'], (df['high'] - prev_close).abs(), (df['low'] - prev_close).abs()]
+    true_range = pd.Series(np.array(ranges).T.max(1), index=df.index)  # NaN in the first row
+    return reference_ewm(true_range, 1. / timeperiod, timeperiod)
+
+def reference_rsi(close:pd.Series, timeperiod:int) -> pd.Series:
+    diff = close.diff()
+    up = reference_ewm(diff.where(diff >= 0., 0.), 1. / timeperiod, timeperiod)
+    down = reference_ewm(-diff.where(diff < 0., 0.), 1. / timeperiod, timeperiod)
+    return 100. - 100. / (1. + up / down)
+
+def reference_stochastic(x:pd.Series, high:pd.Series, low:pd.Series, period:int) -> pd.Series:
+    h = high.rolling(period).max()
+    l = low.rolling(period).min()
+    return 100. * (x - l) / (h - l)
+
+@pytest.fixture
+def df():
+    return make_candles(3000, seed=6)
+
+def test_moving_averages(df):
+    close = df['close']
+    for timeperiod in (10, 50):
+        np.testing.assert_allclose(talib_fallback.SMA(df, timeperiod), close.rolling(timeperiod).mean(), rtol=1e-9)
+        np.testing.assert_allclose(
+            talib_fallback.EMA(df, timeperiod),
+            close.ewm(span=timeperiod, min_periods=timeperiod).mean(),
+            rtol = 1e-9
+        )
+
+def test_variance_is_exact(df):
+    # pandas' online rolling variance drifts, the reference is computed per window
+    windows = np.lib.stride_tricks.sliding_window_view(df['close'].to_numpy(), 20)
+    expected = np.concatenate([np.full(19, np.nan), windows.std(axis=1)])
+    np.testing.assert_allclose(talib_fallback.STDDEV(df, 20), expected, rtol=1e-9)
+    np.testing.assert_allclose(talib_fallback.VAR(df, 20, ddof=1), np.concatenate([np.full(19, np.nan), windows.var(axis=1, ddof=1)]), rtol=1e-9)
+
+def test_atr_and_rsi(df):
+    np.testing.assert_allclose(talib_fallback.ATR(df, 10), reference_atr(df, 10), rtol=1e-9)
+    np.testing.assert_allclose(talib_fallback.RSI(df, 14), reference_rsi(df['close'], 14), rtol=1e-9)
+
+def test_stochastics(df):
+    stoch = talib_fallback.STOCH(df, slowd_period=5)
+    fastk = reference_stochastic(df['close'], df['high'], df['low'], 5)
+    slowk = fastk.rolling(3).mean()
+    np.testing.assert_allclose(stoch['slowk'], slowk, rtol=1e-9)
+    np.testing.assert_allclose(stoch['slowd'], slowk.rolling(5).mean(), rtol=1e-9)
+    
+    stochrsi = talib_fallback.STOCHRSI(df, timeperiod=14)
+    rsi = reference_rsi(df['close'], 14)
+    fastk = reference_stochastic(rsi, rsi, rsi, 5)
+    np.testing.assert_allclose(stochrsi['fastk'], fastk, rtol=1e-9)
+    # cumulative sum rolling mean: zero up to rounding where pandas sums exactly
+    np.testing.assert_allclose(stochrsi['fastd'], fastk.rolling(3).mean(), rtol=1e-9, atol=1e-9)
+
+def test_array_inputs_return_arrays(df):
+    inputs = {col: df[col].to_numpy() for col in ('high', 'low', 'close')}
+    rsi = talib_fallback.RSI(inputs, 14)
+    assert isinstance(rsi, np.ndarray)
+    np.testing.assert_array_equal(rsi, talib_fallback.RSI(df, 14).to_numpy())
+    slowk, slowd = talib_fallback.STOCH(inputs, slowd_period=5)
+    np.testing.assert_array_equal(slowd, talib_fallback.STOCH(df, slowd_period=5)['slowd'].to_numpy())
+
+def test_candle_patterns_match_talib():
+    talib_abstract = pytest.importorskip('talib.abstract')
+    # gapped opens so that the star and gap based patterns occur
+    df = make_candles(20000, seed=7, open_gap=0.004)
+    patterns = talib_fallback.candle_patterns(df)
+    assert len(patterns.columns) == 14
+    for name in patterns.columns:
+        expected = getattr(talib_abstract, name)(df).to_numpy()
+        assert np.count_nonzero(expected) > 0, name
+        np.testing.assert_array_equal(patterns[name].to_numpy(), expected, err_msg=name)
+        np.testing.assert_array_equal(getattr(talib_fallback, name)(df).to_numpy(), expected, err_msg=name)
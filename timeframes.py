@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from typing import Union
+from binance.helpers import interval_to_milliseconds
+from stream_technicals import TechnicalsV04Stream
+from candle_buffer import CandleBuffer, open_time_index, datetime_index_to_open_times
+from config import INTERVAL, DATA_COLUMNS
+
+DAY_MS = 24 * 3600 * 1000
+# raw columns summed over the candles of a bar, open/high/low/close are aggregated as usual
+SUMMED_COLUMNS = [col for col in DATA_COLUMNS if col not in ('open', 'high', 'low', 'close')]
+# indicators of the last completed bar and the running bar so far, as '<interval>_<column>' features
+TIMEFRAME_TECHNICALS_COLUMNS = ['rsi', 'ema10', 'ema20', 'atr10', 'stoch_slowk', 'stoch_slowd']
+TIMEFRAME_BAR_COLUMNS = ['open', 'high', 'low', 'progress']
+# feature transforms relative to the close of the base candle, see FeaturePlan
+TIMEFRAME_TRANSFORMS = {
+    'ema10': 'ratio_change',
+    'ema20': 'ratio_change',
+    'atr10': 'ratio',
+    'open': 'ratio_change',
+    'high': 'ratio_change',
+    'low': 'ratio_change'
+}
+
+def timeframe_ms(interval:str, base_interval:str=INTERVAL) -> int:
+    # higher timeframes have to be made of whole base candles and align with UTC days
+    period = interval_to_milliseconds(interval)
+    base_period = interval_to_milliseconds(base_interval)
+    if period is None or base_period is None:
+        raise ValueError('Unknown interval: {:s}'.format(interval if period is None else base_interval))
+    if period <= base_period or period % base_period != 0 or DAY_MS % period != 0:
+        raise ValueError('Unsupported timeframe {:s} for {:s} candles'.format(interval, base_interval))
+    return period
+
+class TimeframeAggregator:
+    """
+    higher timeframe bars built from closed base candles, one update per candle:
+    bars start at UTC multiples of the period, the running bar stays partial until
+    its last base candle has closed and only completed bars are pushed through the
+    indicator stream; a bar missing candles is closed by the first candle of a
+    later bar
+    """
+    def __init__(self, interval:str, base_interval:str=INTERVAL, capacity:int=1000) -> None:
+        self.interval = interval
+        self.period = timeframe_ms(interval, base_interval)
+        self.base_period = interval_to_milliseconds(base_interval)
+        self.candles_per_bar = self.period // self.base_period
+        self.bars = CandleBuffer(capacity, DATA_COLUMNS + ['n_candles'])
+        self.technicals = TechnicalsV04Stream()
+        self.bar = None
+        self.bar_open_time = None
+        self.n_candles = 0
+        self.last_open_time = None
+        self.n_incomplete = 0
+        self.__bar_technicals = dict.fromkeys(TIMEFRAME_TECHNICALS_COLUMNS, np.nan)
+        self.columns = ['{:s}_{:s}'.format(interval, col) for col in TIMEFRAME_TECHNICALS_COLUMNS + TIMEFRAME_BAR_COLUMNS]
+    
+    def bar_start(self, open_time:int) -> int:
+        return open_time - open_time % self.period
+    
+    def update(self, open_time:int, tick:Union[dict, pd.Series]) -> dict:
+        # tick is a closed base candle; returns the features as of its close
+        if self.last_open_time is not None and open_time <= self.last_open_time:
+            raise ValueError('Candles must be passed in chronological order')
+        bar_open_time = self.bar_start(open_time)
+        if self.bar is not None and bar_open_time != self.bar_open_time:
+            self.__close_bar()
+        
+        if self.bar is None:
+            self.bar = {col: float(tick[col]) for col in DATA_COLUMNS}
+            self.bar_open_time = bar_open_time
+            self.n_candles = 1
+        else:
+            bar = self.bar
+            bar['high'] = max(bar['high'], float(tick['high']))
+            bar['low'] = min(bar['low'], float(tick['low']))
+            bar['close'] = float(tick['close'])
+            for col in SUMMED_COLUMNS:
+                bar[col] += float(tick[col])
+            self.n_candles += 1
+        self.last_open_time = open_time
+        
+        row = {
+            'open': self.bar['open'],
+            'high': self.bar['high'],
+            'low': self.bar['low'],
+            'progress': (open_time + self.base_period - bar_open_time) / self.period
+        }
+        if open_time + self.base_period == bar_open_time + self.period:
+            self.__close_bar()
+        row.update(self.__bar_technicals)
+        return {'{:s}_{:s}'.format(self.interval, col): row[col] for col in TIMEFRAME_TECHNICALS_COLUMNS + TIMEFRAME_BAR_COLUMNS}
+    
+    def __close_bar(self) -> None:
+        if self.n_candles < self.candles_per_bar:
+            self.n_incomplete += 1
+        row = self.technicals.update(self.bar)
+        self.__bar_technicals = {col: row[col] for col in TIMEFRAME_TECHNICALS_COLUMNS}
+        self.bars.append(self.bar_open_time, dict(self.bar, n_candles=self.n_candles))
+        self.bar = None
+        self.n_candles = 0
+    
+    def partial_bar(self) -> Union[dict, None]:
+        if self.bar is None:
+            return None
+        return dict(self.bar, n_candles=self.n_candles, open_time=self.bar_open_time)
+    
+    def to_dataframe(self, n:Union[int, None]=None, include_partial:bool=False) -> pd.DataFrame:
+        # completed bars, optionally followed by the running one; 'partial' marks the latter
+        df = self.bars.to_dataframe(n)
+        df['partial'] = False
+        if include_partial and self.bar is not None:
+            partial = pd.DataFrame(
+                dict(self.bar, n_candles=self.n_candles, partial=True),
+                index = open_time_index([self.bar_open_time])
+            )
+            df = pd.concat([df, partial]) if len(df) > 0 else partial
+        return df
+
+class MultiTimeframeAggregator:
+    """
+    TimeframeAggregator per higher timeframe, updated together from the base candles
+    """
+    def __init__(self, intervals:list, base_interval:str=INTERVAL, capacity:int=1000) -> None:
+        self.aggregators = [TimeframeAggregator(interval, base_interval, capacity) for interval in intervals]
+        self.columns = [col for aggregator in self.aggregators for col in aggregator.columns]
+    
+    def update(self, open_time:int, tick:Union[dict, pd.Series]) -> dict:
+        row = dict()
+        for aggregator in self.aggregators:
+            row.update(aggregator.update(open_time, tick))
+        return row
+    
+    def extend(self, open_times:np.ndarray, values:np.ndarray, columns:list=DATA_COLUMNS) -> None:
+        # warm-up from stored candles, e.g. CandleStore.read()
+        positions = [list(columns).index(col) for col in DATA_COLUMNS]
+        for open_time, row in zip(open_times, values[:, positions]):
+            self.update(int(open_time), dict(zip(DATA_COLUMNS, row)))
+    
+    def seed(self, df:pd.DataFrame) -> pd.DataFrame:
+        # features of every row of df, continuing from the current state
+        open_times = datetime_index_to_open_times(df.index)
+        values = df.loc[:, DATA_COLUMNS].to_numpy(dtype=np.float64)
+        rows = [
+            self.update(int(open_time), dict(zip(DATA_COLUMNS, row)))
+            for open_time, row in zip(open_times, values)
+        ]
+        return pd.DataFrame(rows, index=df.index, columns=self.columns)
+    
+    def transforms(self) -> dict:
+        return {
+            '{:s}_{:s}'.format(aggregator.interval, col): transform
+            for aggregator in self.aggregators
+            for col, transform in TIMEFRAME_TRANSFORMS.items()
+        }
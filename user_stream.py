@@ -0,0 +1,143 @@
+import threading
+from typing import Union, Callable
+from twisted.internet import reactor
+from binance_interface import state_machines
+from bot_utils import get_timestamp
+from config import USER_STREAM_KEEPALIVE_SECONDS, USER_STREAM_RETRY_SECONDS
+
+class UserDataStream:
+    """
+    executionReport and outboundAccountPosition events of the user data stream,
+    applied to the TradeStateMachine of their symbol as they arrive; the listen key
+    is kept alive from a timer thread, while the stream is down the state machines
+    are marked offline so that orders and balances are polled over REST again, and
+    every restart is followed by a REST reconciliation of what may have been missed
+    
+    on_order_update(state_machine, order_type, exec_qty_increased) is called for
+    every order change; with an executor (OrderExecutor) events, restarts and
+    reconciliations are queued on it behind the order commands of the kline
+    handler, otherwise they run on the reactor thread
+    """
+    def __init__(
+        self,
+        socket_manager,
+        client,
+        on_order_update: Union[Callable, None] = None,
+        keepalive_seconds: float = USER_STREAM_KEEPALIVE_SECONDS,
+        retry_seconds: float = USER_STREAM_RETRY_SECONDS,
+        call_from_thread: Callable = reactor.callFromThread,
+        executor = None
+    ) -> None:
+        self.socket_manager = socket_manager
+        self.client = client
+        self.on_order_update = on_order_update
+        self.keepalive_seconds = keepalive_seconds
+        self.retry_seconds = retry_seconds
+        self.executor = executor
+        self.call_from_thread = call_from_thread if executor is None else executor.submit
+        self.listen_key = None
+        self.n_events = 0
+        self.n_restarts = 0
+        self.__timer = None
+    
+    @property
+    def live(self) -> bool:
+        return self.listen_key is not None
+    
+    def set_live(self, live:bool) -> None:
+        for state_machine in list(state_machines.values()):
+            state_machine.user_stream_live = live
+    
+    def start(self) -> bool:
+        try:
+            # the connection key of a user socket is its listen key
+            listen_key = self.socket_manager.start_user_socket(self.receive_event)
+        except Exception as e:
+            print(get_timestamp(), 'user data stream: {:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+            listen_key = None
+        if not listen_key:
+            self.schedule(self.retry_seconds, self.retry)
+            return False
+        self.listen_key = listen_key
+        self.set_live(True)
+        self.schedule(self.keepalive_seconds, self.keepalive)
+        return True
+    
+    def stop(self) -> None:
+        self.set_live(False)
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        if self.listen_key is not None:
+            self.socket_manager.stop_socket(self.listen_key)
+            self.listen_key = None
+    
+    def restart(self) -> None:
+        print(get_timestamp(), 'user data stream: restarting, polling orders meanwhile', flush=True)
+        self.stop()
+        self.n_restarts += 1
+        if self.start():
+            self.reconcile()
+    
+    def schedule(self, delay:float, callback:Callable) -> None:
+        self.__timer = threading.Timer(delay, callback)
+        self.__timer.daemon = True
+        self.__timer.start()
+    
+    def keepalive(self) -> None:
+        # timer thread: a failed keepalive hands over to polling until the restart
+        try:
+            self.client.stream_keepalive(self.listen_key)
+            self.schedule(self.keepalive_seconds, self.keepalive)
+        except Exception as e:
+            print(get_timestamp(), 'user data stream keepalive: {:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+            self.set_live(False)
+            self.call_from_thread(self.restart)
+    
+    def retry(self) -> None:
+        self.call_from_thread(self.restart)
+    
+    def reconcile(self) -> None:
+        # REST fallback: balances and the orders still active after the stream was down
+        for state_machine in list(state_machines.values()):
+            try:
+                state_machine.update_asset_balance(force=True)
+                state_machine.update_quote_asset_balance(force=True)
+                for order_type, exec_qty_increased in state_machine.reconcile_and_process_orders().items():
+                    self.order_updated(state_machine, order_type, exec_qty_increased)
+            except Exception as e:
+                print(get_timestamp(), 'user data stream reconciliation: {:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)
+            if state_machine.unsaved_changes: state_machine.save_state()
+    
+    def order_updated(self, state_machine, order_type:str, exec_qty_increased:bool) -> None:
+        if self.on_order_update is not None:
+            self.on_order_update(state_machine, order_type, exec_qty_increased)
+    
+    def receive_event(self, msg:dict) -> None:
+        if self.executor is None:
+            self.process_event(msg)
+        else:
+            self.executor.submit(self.process_event, msg)
+    
+    def process_event(self, msg:dict) -> None:
+        self.n_events += 1
+        try:
+            event_type = msg.get('e', None)
+            if event_type == 'executionReport':
+                state_machine = state_machines.get(msg['s'], None)
+                if state_machine is None:
+                    return
+                update = state_machine.apply_execution_report(msg)
+                if update is not None:
+                    self.order_updated(state_machine, *update)
+                if state_machine.unsaved_changes: state_machine.save_state()
+            elif event_type == 'outboundAccountPosition':
+                for state_machine in list(state_machines.values()):
+                    state_machine.apply_account_position(msg)
+                    if state_machine.unsaved_changes: state_machine.save_state()
+            elif event_type == 'listenKeyExpired' or event_type == 'error':
+                # 'error' is sent by the socket manager once it gave up reconnecting
+                print(get_timestamp(), 'user data stream: {:s}'.format(str(msg.get('m', event_type))), flush=True)
+                self.restart()
+        except Exception as e:
+            print(get_timestamp(), 'user data stream event: {:s}: {:s}'.format(type(e).__name__, str(e)), flush=True)